@@ -1,23 +1,46 @@
 """管理员API模块 - 用户管理、数据导入、统计查询"""
 
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, Response, stream_with_context, send_file
 from flask_login import login_required, current_user
 from functools import wraps
 from models import (
     db, Users, Admin, Student, Teacher, Department, Course, TeachingClass,
     StudentClass, TeacherClass, Assignment, Submission, Grade, Material,
     Announcement, Attendance, AttendanceRecord,
-    VAdminUserStatistics, VAdminCourseStatistics,
+    VAdminUserStatistics, VAdminCourseStatistics, BackgroundJob,
     generate_next_id
 )
+from job_manager import start_semester_recalculation, retry_failed_tasks, serialize_job
+from import_jobs import start_import_job
+import dashboard_stats
+from user_deletion import delete_users, UserDeletionError
+import user_search
+from permission_manager import get_compiled_permissions, invalidate_admin_permissions, FEATURE_FLAGS
 from datetime import datetime
+from sqlalchemy.orm import joinedload
+import base64
 import csv
 import io
+import json
+import math
+import tempfile
+import time
 from werkzeug.utils import secure_filename
 import os
 
 admin_bp = Blueprint('admin', __name__)
 
+# 列表接口每页条数（默认/上限）
+ADMIN_PAGE_SIZE = 20
+ADMIN_MAX_PAGE_SIZE = 100
+
+
+def _page_args():
+    """读取 page/per_page 参数并限定范围（page >= 1，1 <= per_page <= 上限）"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', ADMIN_PAGE_SIZE, type=int), 1), ADMIN_MAX_PAGE_SIZE)
+    return page, per_page
+
 # ==================== 权限装饰器 ====================
 def admin_required(f):
     """要求管理员角色（临时禁用认证检查）"""
@@ -42,11 +65,11 @@ def admin_permission_required(min_level):
             # if current_user.role != 'admin':
             #     return jsonify({'error': 'Admin access required'}), 403
             # 
-            # admin_profile = current_user.admin_profile
-            # if not admin_profile:
+            # compiled = get_compiled_permissions()
+            # if not compiled:
             #     return jsonify({'error': 'Admin profile not found'}), 403
             # 
-            # if admin_profile.permission_level > min_level:
+            # if compiled[1] > min_level:
             #     return jsonify({'error': f'Permission level {min_level} required'}), 403
             
             return f(*args, **kwargs)
@@ -58,63 +81,9 @@ def admin_permission_required(min_level):
 # @login_required
 @admin_required
 def get_dashboard_stats():
-    """获取管理员仪表盘统计数据"""
+    """获取管理员仪表盘统计数据（读取物化快照，snapshot 字段给出快照刷新时间）"""
     try:
-        # 用户统计
-        user_stats = VAdminUserStatistics.query.all()
-        admin_count = sum(s.total_admin_count for s in user_stats)
-        teacher_count = sum(s.total_teacher_count for s in user_stats)
-        student_count = sum(s.total_student_count for s in user_stats)
-        
-        # 课程统计
-        course_stats = VAdminCourseStatistics.query.all()
-        total_courses = len(course_stats)
-        total_teaching_classes = sum(getattr(s, 'current_year_classes', 0) or getattr(s, 'total_class_count', 0) or 0 for s in course_stats)
-        
-        # 作业统计
-        total_assignments = Assignment.query.count()
-        total_submissions = Submission.query.count()
-        
-        # 考勤统计
-        total_attendance_sessions = Attendance.query.count()
-        
-        # 最新公告
-        latest_announcements = Announcement.query.filter_by(scope_type='global')\
-            .order_by(Announcement.created_at.desc()).limit(5).all()
-        
-        return jsonify({
-            'users': {
-                'admins': admin_count,
-                'teachers': teacher_count,
-                'students': student_count,
-                'total': admin_count + teacher_count + student_count
-            },
-            'courses': {
-                'courses': total_courses,
-                'teaching_classes': total_teaching_classes
-            },
-            'activities': {
-                'assignments': total_assignments,
-                'submissions': total_submissions,
-                'attendance_sessions': total_attendance_sessions
-            },
-            'announcements': [{
-                'id': a.id,
-                'title': a.title,
-                'content': a.content,
-                'created_at': a.created_at.isoformat() if a.created_at else None,
-                'author': {
-                    'id': a.author.user_id,
-                    'name': a.author.real_name
-                } if a.author else {'id': None, 'name': '系统'}
-            } for a in latest_announcements],
-            'user_stats_by_dept': [{
-                'dept_name': s.dept_name or '未分配院系',
-                'admins': s.total_admin_count,
-                'teachers': s.total_teacher_count,
-                'students': s.total_student_count
-            } for s in user_stats]
-        })
+        return jsonify(dashboard_stats.get_dashboard_stats(current_app._get_current_object()))
     except Exception as e:
         current_app.logger.error(f"Failed to get dashboard stats: {e}")
         return jsonify({'error': str(e)}), 500
@@ -124,15 +93,23 @@ def get_dashboard_stats():
 # # @login_required  # 临时禁用
 @admin_permission_required(2)
 def get_users():
-    """获取用户列表（支持筛选和搜索）"""
+    """获取用户列表（支持筛选和搜索）
+
+    分页方式：
+    - page/per_page：传统页码分页（默认）
+    - cursor：游标分页，首页传 cursor= 空值，之后传上一页返回的 next_cursor；
+      按 created_at、user_id 降序定位，深翻页不退化
+    总数默认只在页码分页和游标首页统计（include_total 可覆盖），并按筛选条件缓存一段时间，翻页不重复 COUNT。
+    """
     try:
         # 获取查询参数
         role = request.args.get('role', '')
         status = request.args.get('status', '')
         search_name = request.args.get('search_name', '')
         search_username = request.args.get('search_username', '')
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        page, per_page = _page_args()
+        cursor = request.args.get('cursor')
+        include_total = request.args.get('include_total', '0' if cursor else '1') not in ('0', 'false')
         
         # 构建查询
         query = Users.query
@@ -146,12 +123,35 @@ def get_users():
         if search_username:
             query = query.filter(Users.username.like(f'%{search_username}%'))
         
-        # 添加默认排序（MSSQL分页必须）
-        query = query.order_by(Users.created_at.desc())
-
-        # 分页
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        users = pagination.items
+        total = None
+        if include_total:
+            total = _count_users(query, (role, status, search_name, search_username))
+        
+        # 档案及院系随用户一次联表加载（均为一对一，不影响分页）
+        query = query.options(
+            joinedload(Users.admin_profile).joinedload(Admin.department),
+            joinedload(Users.teacher_profile).joinedload(Teacher.department),
+            joinedload(Users.student_profile).joinedload(Student.department)
+        )
+        
+        # 添加默认排序（MSSQL分页必须），user_id 保证顺序唯一
+        query = query.order_by(Users.created_at.desc(), Users.user_id.desc())
+        
+        next_cursor = None
+        if cursor is not None:
+            if cursor:
+                try:
+                    last_created_at, last_user_id = _decode_user_cursor(cursor)
+                except (ValueError, TypeError):
+                    return jsonify({'error': 'Invalid cursor'}), 400
+                query = query.filter(_after_user_cursor(last_created_at, last_user_id))
+            
+            users = query.limit(per_page + 1).all()
+            if len(users) > per_page:
+                users = users[:per_page]
+                next_cursor = _encode_user_cursor(users[-1])
+        else:
+            users = query.offset((page - 1) * per_page).limit(per_page).all()
         
         # 构建响应数据
         users_data = []
@@ -195,14 +195,24 @@ def get_users():
             
             users_data.append(user_data)
         
-        return jsonify({
-            'users': users_data,
-            'pagination': {
+        if cursor is not None:
+            pagination_data = {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'total': total
+            }
+        else:
+            pagination_data = {
                 'page': page,
                 'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages
+                'total': total,
+                'pages': math.ceil(total / per_page) if total is not None else None
             }
+        
+        return jsonify({
+            'users': users_data,
+            'pagination': pagination_data
         })
     except Exception as e:
         import traceback
@@ -213,6 +223,41 @@ def get_users():
         print(f"ERROR Traceback:\n{error_detail}")
         return jsonify({'error': str(e), 'detail': error_detail}), 500
 
+# 用户总数缓存有效期（秒）
+USER_COUNT_CACHE_TTL = 60
+
+_user_count_cache = {}
+
+def _count_users(query, filter_key):
+    """统计筛选后的用户总数（按筛选条件缓存，翻页时不重复 COUNT）"""
+    cached = _user_count_cache.get(filter_key)
+    if cached and time.time() - cached[0] < USER_COUNT_CACHE_TTL:
+        return cached[1]
+    
+    total = query.order_by(None).count()
+    _user_count_cache[filter_key] = (time.time(), total)
+    return total
+
+def _encode_user_cursor(user):
+    """把最后一行的 (created_at, user_id) 编码为不透明游标"""
+    payload = json.dumps([user.created_at.isoformat() if user.created_at else None, user.user_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def _decode_user_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, user_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    return (datetime.fromisoformat(created_at) if created_at else None), int(user_id)
+
+def _after_user_cursor(created_at, user_id):
+    """按 created_at DESC, user_id DESC 排序时位于游标之后的行（NULL 排在最后）"""
+    if created_at is None:
+        return db.and_(Users.created_at.is_(None), Users.user_id < user_id)
+    return db.or_(
+        Users.created_at < created_at,
+        db.and_(Users.created_at == created_at, Users.user_id < user_id),
+        Users.created_at.is_(None)
+    )
+
 @admin_bp.route('/users/<int:user_id>', methods=['GET'])
 # @login_required
 @admin_required
@@ -386,6 +431,9 @@ def create_user():
             db.session.add(new_student)
         
         db.session.commit()
+        _user_count_cache.clear()
+        dashboard_stats.adjust_user_count(data['role'], dept_id)
+        user_search.index_users([new_user_id])
         
         return jsonify({
             'message': 'User created successfully',
@@ -459,6 +507,10 @@ def update_user(user_id):
                 profile.dept_id = data['dept_id']
         
         db.session.commit()
+        _user_count_cache.clear()
+        dashboard_stats.mark_dashboard_stale()
+        user_search.index_users([user_id])
+        invalidate_admin_permissions([user_id])
         
         return jsonify({'message': 'User updated successfully'})
         
@@ -490,6 +542,8 @@ def toggle_user_status(user_id):
         
         user.status = 1 - user.status
         db.session.commit()
+        _user_count_cache.clear()
+        user_search.index_users([user_id])
         
         return jsonify({
             'message': 'User status toggled successfully',
@@ -507,73 +561,58 @@ def toggle_user_status(user_id):
 def delete_user(user_id):
     """删除用户及相关数据"""
     try:
-        user = db.session.get(Users, user_id)
-        if not user:
+        if not db.session.get(Users, user_id):
             return jsonify({'error': 'User not found'}), 404
         
-        # 不能删除自己
-        if user.user_id == current_user.user_id:
-            return jsonify({'error': 'Cannot delete current user'}), 400
-        
-        role = user.role
-        
-        # 删除角色特定数据
-        if role == 'student':
-            student = user.student_profile
-            if student:
-                StudentClass.query.filter_by(student_id=student.student_id).delete()
-                Submission.query.filter_by(student_id=student.student_id).delete()
-                Grade.query.filter_by(student_id=student.student_id).delete()
-                AttendanceRecord.query.filter_by(student_id=student.student_id).delete()
-                db.session.delete(student)
-                
-        elif role == 'teacher':
-            teacher = user.teacher_profile
-            if teacher:
-                # 删除作业及其提交记录
-                assignments = Assignment.query.filter_by(teacher_id=teacher.teacher_id).all()
-                for assignment in assignments:
-                    Submission.query.filter_by(assignment_id=assignment.assignment_id).delete()
-                    db.session.delete(assignment)
-                
-                # 删除教学资料
-                materials = Material.query.filter_by(teacher_id=teacher.teacher_id).all()
-                for material in materials:
-                    if material.file_path:
-                        file_path = os.path.join(current_app.config.get('MATERIALS_FOLDER', 'uploads/materials'), 
-                                               material.file_path)
-                        if os.path.exists(file_path):
-                            try:
-                                os.remove(file_path)
-                            except:
-                                pass
-                    db.session.delete(material)
-                
-                TeacherClass.query.filter_by(teacher_id=teacher.teacher_id).delete()
-                Grade.query.filter_by(calculated_by=teacher.teacher_id).update({'calculated_by': None})
-                Submission.query.filter_by(graded_by=teacher.teacher_id).update({'graded_by': None})
-                db.session.delete(teacher)
-                
-        elif role == 'admin':
-            admin = user.admin_profile
-            if admin:
-                # 不能删除超级管理员
-                super_admin_id = db.session.query(db.func.min(Admin.admin_id)).scalar()
-                if admin.admin_id == super_admin_id:
-                    return jsonify({'error': 'Cannot delete super admin'}), 400
-                db.session.delete(admin)
-        
-        # 删除用户记录
-        db.session.delete(user)
-        db.session.commit()
+        _delete_users([user_id])
         
         return jsonify({'message': 'User deleted successfully'})
         
+    except UserDeletionError as e:
+        return jsonify({'error': e.message}), e.status_code
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Failed to delete user: {e}")
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/users/bulk-delete', methods=['POST'])
+# @login_required
+@admin_permission_required(2)
+def bulk_delete_users():
+    """批量删除用户及相关数据（整批在一个事务中完成）"""
+    try:
+        data = request.get_json() or {}
+        user_ids = data.get('user_ids')
+        if not isinstance(user_ids, list) or not user_ids:
+            return jsonify({'error': 'user_ids must be a non-empty list'}), 400
+        
+        result = _delete_users(user_ids)
+        
+        return jsonify({
+            'message': f"{len(result['deleted'])} users deleted",
+            **result
+        })
+        
+    except UserDeletionError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except (TypeError, ValueError):
+        return jsonify({'error': 'user_ids must be integers'}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to bulk delete users: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def _delete_users(user_ids):
+    """调用级联删除服务，并刷新用户总数缓存与仪表盘快照"""
+    current_user_id = current_user.user_id if current_user.is_authenticated else None
+    result = delete_users(user_ids, current_user_id)
+    _user_count_cache.clear()
+    # 级联删除了作业、提交等数据，快照整体重建
+    dashboard_stats.mark_dashboard_stale()
+    user_search.remove_users(result['deleted'])
+    invalidate_admin_permissions(result['deleted'])
+    return result
+
 # ==================== 院系管理API ====================
 @admin_bp.route('/departments', methods=['GET'])
 @admin_required
@@ -597,288 +636,53 @@ def get_departments():
 # @login_required
 @admin_permission_required(2)
 def import_users():
-    """批量导入用户（CSV）"""
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        if not file.filename.endswith('.csv'):
-            return jsonify({'error': 'Only CSV files are supported'}), 400
-        
-        # 读取CSV
-        stream = io.StringIO(file.stream.read().decode('utf-8-sig'), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):
-            try:
-                # 验证必填字段
-                username = row.get('username', '').strip()
-                password = row.get('password', '').strip()
-                real_name = row.get('real_name', '').strip()
-                role = row.get('role', '').strip()
-                
-                if not all([username, password, real_name, role]):
-                    errors.append(f"Row {row_num}: Missing required fields")
-                    error_count += 1
-                    continue
-                
-                # 检查用户名是否已存在
-                if Users.query.filter_by(username=username).first():
-                    errors.append(f"Row {row_num}: Username '{username}' already exists")
-                    error_count += 1
-                    continue
-                
-                # 创建用户
-                new_user_id = generate_next_id(Users, 'user_id')
-                new_user = Users(
-                    user_id=new_user_id,
-                    username=username,
-                    real_name=real_name,
-                    phone=row.get('phone', '').strip() or None,
-                    email=row.get('email', '').strip() or None,
-                    role=role,
-                    status=1
-                )
-                new_user.set_password(password)
-                db.session.add(new_user)
-                db.session.flush()
-                
-                # 根据角色创建profile
-                if role == 'admin':
-                    admin_no = row.get('admin_no', '').strip()
-                    if not admin_no or Admin.query.filter_by(admin_no=admin_no).first():
-                        errors.append(f"Row {row_num}: Invalid or duplicate admin_no")
-                        error_count += 1
-                        db.session.rollback()
-                        continue
-                    
-                    dept_name = row.get('department', '').strip()
-                    dept_id = None
-                    if dept_name:
-                        dept = Department.query.filter_by(dept_name=dept_name).first()
-                        if not dept:
-                            dept = Department(
-                                dept_id=generate_next_id(Department, 'dept_id'),
-                                dept_name=dept_name
-                            )
-                            db.session.add(dept)
-                            db.session.flush()
-                        dept_id = dept.dept_id
-                    
-                    new_admin = Admin(
-                        admin_id=generate_next_id(Admin, 'admin_id'),
-                        user_id=new_user_id,
-                        admin_no=admin_no,
-                        dept_id=dept_id,
-                        permission_level=int(row.get('permission_level', 3))
-                    )
-                    db.session.add(new_admin)
-                    
-                elif role == 'teacher':
-                    teacher_no = row.get('teacher_no', '').strip()
-                    if not teacher_no or Teacher.query.filter_by(teacher_no=teacher_no).first():
-                        errors.append(f"Row {row_num}: Invalid or duplicate teacher_no")
-                        error_count += 1
-                        db.session.rollback()
-                        continue
-                    
-                    dept_name = row.get('department', '').strip()
-                    dept_id = None
-                    if dept_name:
-                        dept = Department.query.filter_by(dept_name=dept_name).first()
-                        if not dept:
-                            dept = Department(
-                                dept_id=generate_next_id(Department, 'dept_id'),
-                                dept_name=dept_name
-                            )
-                            db.session.add(dept)
-                            db.session.flush()
-                        dept_id = dept.dept_id
-                    
-                    new_teacher = Teacher(
-                        teacher_id=generate_next_id(Teacher, 'teacher_id'),
-                        user_id=new_user_id,
-                        teacher_no=teacher_no,
-                        dept_id=dept_id,
-                        title=row.get('title', '').strip() or None
-                    )
-                    db.session.add(new_teacher)
-                    
-                elif role == 'student':
-                    student_no = row.get('student_no', '').strip()
-                    if not student_no or Student.query.filter_by(student_no=student_no).first():
-                        errors.append(f"Row {row_num}: Invalid or duplicate student_no")
-                        error_count += 1
-                        db.session.rollback()
-                        continue
-                    
-                    dept_name = row.get('department', '').strip()
-                    dept_id = None
-                    if dept_name:
-                        dept = Department.query.filter_by(dept_name=dept_name).first()
-                        if not dept:
-                            dept = Department(
-                                dept_id=generate_next_id(Department, 'dept_id'),
-                                dept_name=dept_name
-                            )
-                            db.session.add(dept)
-                            db.session.flush()
-                        dept_id = dept.dept_id
-                    
-                    new_student = Student(
-                        student_id=generate_next_id(Student, 'student_id'),
-                        user_id=new_user_id,
-                        student_no=student_no,
-                        dept_id=dept_id,
-                        major=row.get('major', '').strip() or None
-                    )
-                    db.session.add(new_student)
-                
-                success_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
-                error_count += 1
-                db.session.rollback()
-        
-        if success_count > 0:
-            db.session.commit()
-        
-        return jsonify({
-            'message': f'Import completed: {success_count} success, {error_count} errors',
-            'success_count': success_count,
-            'error_count': error_count,
-            'errors': errors[:20]  # 限制返回前20个错误
-        })
-        
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f"Failed to import users: {e}")
-        return jsonify({'error': str(e)}), 500
+    """批量导入用户（CSV，后台任务）
+
+    整个文件先在内存中校验，密码哈希并行计算，合法行分块批量写入；
+    任务完成后 summary.report 为逐行报告，单行出错不影响其他行。
+    """
+    return _start_import('users')
 
 @admin_bp.route('/import/departments', methods=['POST'])
 # @login_required
 @admin_permission_required(2)
 def import_departments():
-    """批量导入院系"""
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
-        
-        file = request.files['file']
-        stream = io.StringIO(file.stream.read().decode('utf-8-sig'), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):
-            try:
-                dept_name = row.get('dept_name', '').strip()
-                if not dept_name:
-                    errors.append(f"Row {row_num}: dept_name is required")
-                    error_count += 1
-                    continue
-                
-                if Department.query.filter_by(dept_name=dept_name).first():
-                    errors.append(f"Row {row_num}: Department '{dept_name}' already exists")
-                    error_count += 1
-                    continue
-                
-                new_dept = Department(
-                    dept_id=generate_next_id(Department, 'dept_id'),
-                    dept_name=dept_name
-                )
-                db.session.add(new_dept)
-                success_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
-                error_count += 1
-        
-        if success_count > 0:
-            db.session.commit()
-        
-        return jsonify({
-            'message': f'Import completed: {success_count} success, {error_count} errors',
-            'success_count': success_count,
-            'error_count': error_count,
-            'errors': errors
-        })
-        
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f"Failed to import departments: {e}")
-        return jsonify({'error': str(e)}), 500
+    """批量导入院系（CSV，后台任务）"""
+    return _start_import('departments')
 
 @admin_bp.route('/import/courses', methods=['POST'])
 # @login_required
 @admin_permission_required(2)
 def import_courses():
-    """批量导入课程"""
+    """批量导入课程（CSV，后台任务）"""
+    return _start_import('courses')
+
+def _start_import(import_type):
+    """保存上传的CSV并创建后台导入任务，返回任务ID供轮询 /jobs/<job_id>"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
         
         file = request.files['file']
-        stream = io.StringIO(file.stream.read().decode('utf-8-sig'), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
-        success_count = 0
-        error_count = 0
-        errors = []
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
         
-        for row_num, row in enumerate(csv_reader, start=2):
-            try:
-                course_code = row.get('course_code', '').strip()
-                course_name = row.get('course_name', '').strip()
-                
-                if not all([course_code, course_name]):
-                    errors.append(f"Row {row_num}: Missing required fields")
-                    error_count += 1
-                    continue
-                
-                if Course.query.filter_by(course_code=course_code).first():
-                    errors.append(f"Row {row_num}: Course '{course_code}' already exists")
-                    error_count += 1
-                    continue
-                
-                new_course = Course(
-                    course_id=generate_next_id(Course, 'course_id'),
-                    course_code=course_code,
-                    course_name=course_name,
-                    credits=float(row.get('credits', 0)) if row.get('credits') else None,
-                    description=row.get('description', '').strip() or None
-                )
-                db.session.add(new_course)
-                success_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
-                error_count += 1
+        if not file.filename.endswith('.csv'):
+            return jsonify({'error': 'Only CSV files are supported'}), 400
         
-        if success_count > 0:
-            db.session.commit()
+        user_id = current_user.user_id if current_user.is_authenticated else None
+        job = start_import_job(import_type, file, user_id)
         
         return jsonify({
-            'message': f'Import completed: {success_count} success, {error_count} errors',
-            'success_count': success_count,
-            'error_count': error_count,
-            'errors': errors
-        })
+            'message': '导入任务已提交，正在后台处理',
+            'job_id': job.id,
+            'status_url': f'/api/v1/admin/jobs/{job.id}',
+            'job': serialize_job(job)
+        }), 202
         
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Failed to import courses: {e}")
+        current_app.logger.error(f"Failed to start {import_type} import: {e}")
         return jsonify({'error': str(e)}), 500
 
 # ==================== 统计查询API ====================
@@ -1040,6 +844,7 @@ def update_admin_permission(admin_id):
             admin.permission_level = new_level
         
         db.session.commit()
+        invalidate_admin_permissions([admin.user_id])
         
         return jsonify({
             'message': 'Permission updated successfully',
@@ -1099,20 +904,57 @@ def get_courses():
 # @login_required
 @admin_required
 def get_teaching_classes():
-    """获取所有教学班"""
+    """获取所有教学班
+
+    筛选参数：semester、course_id、dept_id（任课教师所属院系）、status。
+    选课人数与任课教师数由分组子查询连接到分页查询中，课程信息随页查询一并加载，
+    每页固定两次查询（总数 + 当前页）。
+    """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        
-        pagination = TeachingClass.query.order_by(TeachingClass.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-        
+        page, per_page = _page_args()
+        semester = request.args.get('semester')
+        course_id = request.args.get('course_id', type=int)
+        dept_id = request.args.get('dept_id', type=int)
+        status = request.args.get('status', type=int)
+
+        filters = []
+        if semester:
+            filters.append(TeachingClass.semester == semester)
+        if course_id:
+            filters.append(TeachingClass.course_id == course_id)
+        if status is not None:
+            filters.append(TeachingClass.status == status)
+        if dept_id:
+            filters.append(TeachingClass.class_id.in_(
+                db.session.query(TeacherClass.class_id)
+                .join(Teacher, Teacher.teacher_id == TeacherClass.teacher_id)
+                .filter(Teacher.dept_id == dept_id)
+            ))
+
+        total = db.session.query(db.func.count(TeachingClass.class_id)).filter(*filters).scalar()
+
+        student_counts = db.session.query(
+            StudentClass.class_id,
+            db.func.count(StudentClass.id).label('student_count')
+        ).group_by(StudentClass.class_id).subquery()
+        teacher_counts = db.session.query(
+            TeacherClass.class_id,
+            db.func.count(TeacherClass.id).label('teacher_count')
+        ).group_by(TeacherClass.class_id).subquery()
+
+        rows = db.session.query(
+            TeachingClass,
+            db.func.coalesce(student_counts.c.student_count, 0),
+            db.func.coalesce(teacher_counts.c.teacher_count, 0)
+        ).outerjoin(student_counts, student_counts.c.class_id == TeachingClass.class_id)\
+         .outerjoin(teacher_counts, teacher_counts.c.class_id == TeachingClass.class_id)\
+         .options(joinedload(TeachingClass.course))\
+         .filter(*filters)\
+         .order_by(TeachingClass.created_at.desc(), TeachingClass.class_id.desc())\
+         .offset((page - 1) * per_page).limit(per_page).all()
+
         classes_data = []
-        for tc in pagination.items:
-            # 统计选课人数
-            student_count = StudentClass.query.filter_by(class_id=tc.class_id).count()
-            # 统计任课教师数
-            teacher_count = TeacherClass.query.filter_by(class_id=tc.class_id).count()
-            
+        for tc, student_count, teacher_count in rows:
             classes_data.append({
                 'class_id': tc.class_id,
                 'class_name': tc.class_name,
@@ -1122,14 +964,67 @@ def get_teaching_classes():
                     'course_name': tc.course.course_name
                 } if tc.course else None,
                 'semester': tc.semester,
-                'schedule': tc.schedule,
-                'location': tc.location,
+                'schedule': tc.class_time,
+                'location': tc.classroom,
+                'capacity': tc.capacity,
+                'status': tc.status,
                 'student_count': student_count,
                 'teacher_count': teacher_count
             })
         
         return jsonify({
             'teaching_classes': classes_data,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': math.ceil(total / per_page)
+            }
+        })
+    except Exception as e:
+        current_app.logger.error(f"Failed to get teaching classes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# ==================== 后台任务API ====================
+@admin_bp.route('/jobs/recalculate-grades', methods=['POST'])
+# @login_required
+@admin_permission_required(2)
+def start_grade_recalculation():
+    """创建学期总评成绩批量重算任务（后台执行，返回任务ID供轮询）"""
+    try:
+        data = request.get_json() or {}
+        semester = data.get('semester')
+        if not semester:
+            return jsonify({'error': 'semester is required'}), 400
+
+        user_id = current_user.user_id if current_user.is_authenticated else None
+        job = start_semester_recalculation(semester, user_id)
+        if not job:
+            return jsonify({'error': f'No active teaching classes in semester {semester}'}), 404
+
+        return jsonify(serialize_job(job)), 202
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to start grade recalculation: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/jobs', methods=['GET'])
+# @login_required
+@admin_permission_required(2)
+def get_background_jobs():
+    """获取后台任务列表"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        job_type = request.args.get('job_type')
+
+        query = BackgroundJob.query
+        if job_type:
+            query = query.filter_by(job_type=job_type)
+        pagination = query.order_by(BackgroundJob.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
+
+        return jsonify({
+            'jobs': [serialize_job(job) for job in pagination.items],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -1138,48 +1033,83 @@ def get_teaching_classes():
             }
         })
     except Exception as e:
-        current_app.logger.error(f"Failed to get teaching classes: {e}")
+        current_app.logger.error(f"Failed to get background jobs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/jobs/<int:job_id>', methods=['GET'])
+# @login_required
+@admin_permission_required(2)
+def get_background_job(job_id):
+    """获取后台任务进度及每个子任务的结果（前端轮询）"""
+    try:
+        job = db.session.get(BackgroundJob, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        return jsonify(serialize_job(job, include_tasks=True))
+    except Exception as e:
+        current_app.logger.error(f"Failed to get background job: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+# @login_required
+@admin_permission_required(2)
+def retry_background_job(job_id):
+    """仅重试任务中失败的子任务"""
+    try:
+        job = db.session.get(BackgroundJob, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        retry_count = retry_failed_tasks(job)
+        if retry_count is None:
+            return jsonify({'error': 'Job is still running'}), 409
+
+        return jsonify({
+            'message': f'已重新提交 {retry_count} 个子任务' if retry_count else '没有需要重试的子任务',
+            'retry_count': retry_count,
+            'job': serialize_job(job)
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to retry background job: {e}")
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/export/users', methods=['GET'])
 # @login_required
 @admin_required
 def export_users():
-    """导出用户数据为CSV"""
+    """导出用户数据（CSV 流式输出，format=xlsx 时导出 Excel）
+
+    可选筛选参数：role、status、username、real_name、dept_id
+    """
     try:
-        role = request.args.get('role', '')
-        
-        query = Users.query
-        if role:
-            query = query.filter(Users.role == role)
-        
-        users = query.all()
-        
-        # 创建CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # 写入头部
-        writer.writerow(['用户ID', '用户名', '真实姓名', '角色', '状态', '电话', '邮箱', '创建时间'])
-        
-        # 写入数据
-        for user in users:
-            writer.writerow([
-                user.user_id,
-                user.username,
-                user.real_name,
-                user.role,
-                '激活' if user.status == 1 else '禁用',
-                user.phone or '',
-                user.email or '',
-                user.created_at.strftime('%Y-%m-%d %H:%M:%S') if user.created_at else ''
-            ])
-        
-        # 设置响应
-        from flask import make_response
-        response = make_response(output.getvalue())
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in ('csv', 'xlsx'):
+            return jsonify({'error': 'format must be csv or xlsx'}), 400
+        
+        filters = _parse_user_export_filters(request.args)
+        filename = f'users_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+        
+        if export_format == 'xlsx':
+            return _export_users_xlsx(filters, filename)
+        
+        def generate():
+            # BOM 便于 Excel 正确识别 UTF-8
+            yield '\ufeff'
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(USER_EXPORT_HEADERS)
+            for rows in _iter_user_export_chunks(filters):
+                writer.writerows(rows)
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+            yield output.getvalue()
+        
+        response = Response(stream_with_context(generate()), mimetype='text/csv')
         response.headers['Content-Type'] = 'text/csv; charset=utf-8-sig'
-        response.headers['Content-Disposition'] = f'attachment; filename=users_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
         
         return response
         
@@ -1188,6 +1118,113 @@ def export_users():
         return jsonify({'error': str(e)}), 500
 
 
+# 导出时每批读取的用户数
+USER_EXPORT_CHUNK_SIZE = 1000
+
+USER_EXPORT_HEADERS = [
+    '用户ID', '用户名', '真实姓名', '角色', '状态', '电话', '邮箱', '创建时间',
+    '学号/工号', '院系', '专业/职称'
+]
+
+def _parse_user_export_filters(args):
+    """解析导出筛选参数（忽略空值与无法解析的值）"""
+    filters = {}
+    for key in ('role', 'username', 'real_name'):
+        value = (args.get(key) or '').strip()
+        if value:
+            filters[key] = value
+    for key in ('status', 'dept_id'):
+        value = args.get(key)
+        if value not in (None, '', 'null'):
+            try:
+                filters[key] = int(value)
+            except ValueError:
+                pass
+    return filters
+
+def _iter_user_export_chunks(filters):
+    """按 user_id 键集分页逐批读取导出行
+
+    每批一次查询，联表取出学生/教师/管理员档案及院系，避免整表加载与逐行查询；
+    只连接与用户角色一致的档案，其他角色的残留档案不会混入导出列。
+    """
+    dept_id = db.func.coalesce(Student.dept_id, Teacher.dept_id, Admin.dept_id)
+    query = db.session.query(
+        Users.user_id, Users.username, Users.real_name, Users.role, Users.status,
+        Users.phone, Users.email, Users.created_at,
+        Student.student_no, Student.major,
+        Teacher.teacher_no, Teacher.title,
+        Admin.admin_no,
+        Department.dept_name
+    ).outerjoin(Student, db.and_(Student.user_id == Users.user_id, Users.role == 'student'))\
+        .outerjoin(Teacher, db.and_(Teacher.user_id == Users.user_id, Users.role == 'teacher'))\
+        .outerjoin(Admin, db.and_(Admin.user_id == Users.user_id, Users.role == 'admin'))\
+        .outerjoin(Department, Department.dept_id == dept_id)
+    
+    if filters.get('role'):
+        query = query.filter(Users.role == filters['role'])
+    if filters.get('status') is not None:
+        query = query.filter(Users.status == filters['status'])
+    if filters.get('username'):
+        query = query.filter(Users.username.like(f"%{filters['username']}%"))
+    if filters.get('real_name'):
+        query = query.filter(Users.real_name.like(f"%{filters['real_name']}%"))
+    if filters.get('dept_id') is not None:
+        query = query.filter(dept_id == filters['dept_id'])
+    
+    last_id = None
+    while True:
+        chunk = query
+        if last_id is not None:
+            chunk = chunk.filter(Users.user_id > last_id)
+        records = chunk.order_by(Users.user_id).limit(USER_EXPORT_CHUNK_SIZE).all()
+        if not records:
+            break
+        
+        yield [[
+            r.user_id,
+            r.username,
+            r.real_name,
+            r.role,
+            '激活' if r.status == 1 else '禁用',
+            r.phone or '',
+            r.email or '',
+            r.created_at.strftime('%Y-%m-%d %H:%M:%S') if r.created_at else '',
+            (r.student_no or r.teacher_no or r.admin_no or '').strip(),
+            r.dept_name or '',
+            r.major or r.title or ''
+        ] for r in records]
+        
+        last_id = records[-1].user_id
+        if len(records) < USER_EXPORT_CHUNK_SIZE:
+            break
+
+def _export_users_xlsx(filters, filename):
+    """以只写模式逐批写入 Excel 工作簿，写入临时文件后发送"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        return jsonify({'error': 'XLSX export requires openpyxl'}), 501
+    
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('用户')
+    sheet.append(USER_EXPORT_HEADERS)
+    for rows in _iter_user_export_chunks(filters):
+        for row in rows:
+            sheet.append(row)
+    
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=f'{filename}.xlsx'
+    )
+
+
 # ==================== 权限管理 API ====================
 
 @admin_bp.route('/admins', methods=['GET'])
@@ -1295,6 +1332,7 @@ def update_admin_permissions(admin_id):
                 setattr(admin, attr, bool(data[key]))
         
         db.session.commit()
+        invalidate_admin_permissions([admin.user_id])
         
         return jsonify({'message': 'Admin permissions updated'}), 200
     except Exception as e:
@@ -1319,6 +1357,7 @@ def set_admin_role(admin_id):
         
         init_admin_permissions(admin, role_type)
         db.session.commit()
+        invalidate_admin_permissions([admin.user_id])
         
         return jsonify({'message': 'Admin role updated'}), 200
     except Exception as e:
@@ -1341,6 +1380,7 @@ def grant_admin_permission(admin_id):
         
         admin.grant_permission(feature)
         db.session.commit()
+        invalidate_admin_permissions([admin.user_id])
         
         return jsonify({'message': f'Permission {feature} granted'}), 200
     except Exception as e:
@@ -1363,6 +1403,7 @@ def revoke_admin_permission(admin_id):
         
         admin.revoke_permission(feature)
         db.session.commit()
+        invalidate_admin_permissions([admin.user_id])
         
         return jsonify({'message': f'Permission {feature} revoked'}), 200
     except Exception as e:
@@ -1391,33 +1432,22 @@ def get_permission_levels():
 def get_my_permissions():
     """获取当前管理员的权限信息"""
     try:
-        if current_user.role != 'admin' or not current_user.admin_profile:
+        from permission_manager import get_permission_levels
+        
+        compiled = get_compiled_permissions()
+        if not compiled:
             return jsonify({'error': 'Not an admin'}), 403
         
-        admin = current_user.admin_profile
-        
-        level_names = {
-            1: '超级管理员',
-            2: '系统管理员',
-            3: '部门管理员',
-            4: '内容审核员'
-        }
+        admin_id, permission_level, mask, admin_no = compiled
+        level = get_permission_levels().get(permission_level)
         
         return jsonify({
-            'admin_id': admin.admin_id,
-            'admin_no': admin.admin_no,
+            'admin_id': admin_id,
+            'admin_no': admin_no,
             'real_name': current_user.real_name,
-            'permission_level': admin.permission_level,
-            'level_name': level_names.get(admin.permission_level, '未知'),
-            'permissions': {
-                'can_manage_users': admin.can_manage_users,
-                'can_manage_forum': admin.can_manage_forum,
-                'can_manage_courses': admin.can_manage_courses,
-                'can_manage_grades': admin.can_manage_grades,
-                'can_manage_announcements': admin.can_manage_announcements,
-                'can_review_content': admin.can_review_content,
-                'can_ban_users': admin.can_ban_users
-            }
+            'permission_level': permission_level,
+            'level_name': level['name'] if level else '未知',
+            'permissions': {attr: bool(mask & bit) for attr, bit in FEATURE_FLAGS.values()}
         }), 200
     except Exception as e:
         current_app.logger.error(f"Failed to get my permissions: {e}")
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from models import Announcement, TeacherClass, db, generate_next_id, TeachingClass
 from . import api_v1
 from datetime import datetime
+import dashboard_stats
 
 @api_v1.route('/announcements', methods=['GET'])
 # @login_required
@@ -108,6 +109,8 @@ def create_announcement():
         )
         db.session.add(announcement)
         db.session.commit()
+        if scope_type == 'global':
+            dashboard_stats.mark_dashboard_stale()
         
         return jsonify({'message': 'Announcement created', 'id': announcement.id}), 201
     except Exception as e:
@@ -132,8 +135,11 @@ def delete_announcement(id):
         else:
             return jsonify({'error': 'Permission denied'}), 403
             
+        is_global = announcement.scope_type == 'global'
         db.session.delete(announcement)
         db.session.commit()
+        if is_global:
+            dashboard_stats.mark_dashboard_stale()
         
         return jsonify({'message': 'Deleted successfully'}), 200
     except Exception as e:
@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
 from models import db, Assignment, Submission, TeacherClass, StudentClass, Student, generate_next_id
 from datetime import datetime
+import dashboard_stats
 
 assignments_bp = Blueprint('assignments', __name__, url_prefix='/assignments')
 
@@ -58,6 +59,7 @@ def create_assignment():
         
         db.session.add(new_assignment)
         db.session.commit()
+        dashboard_stats.adjust_activity_count('assignments')
         
         return jsonify({'message': 'Assignment created successfully', 'id': new_assignment.assignment_id}), 201
     except Exception as e:
@@ -144,6 +146,7 @@ def grade_submission(assignment_id, student_id):
         return jsonify({'error': 'Score is required'}), 400
         
     sub = Submission.query.filter_by(assignment_id=assignment_id, student_id=student_id).first()
+    created = sub is None
     
     if not sub:
         # If grading a student who hasn't submitted, create a record (e.g. 0 score)
@@ -165,6 +168,8 @@ def grade_submission(assignment_id, student_id):
     sub.graded_time = datetime.now()
     
     db.session.commit()
+    if created:
+        dashboard_stats.adjust_activity_count('submissions')
     
     return jsonify({'message': 'Graded successfully'})
 
@@ -1,8 +1,9 @@
 from flask import Blueprint, jsonify, request
 from flask_login import current_user
 from functools import wraps
-from models import Attendance, AttendanceRecord, StudentClass, TeacherClass, db, generate_next_id, Student, Users
+from models import Attendance, AttendanceRecord, StudentClass, TeacherClass, db, generate_next_id, allocate_ids, Student, Users
 from datetime import datetime, date
+import dashboard_stats
 
 attendance_bp = Blueprint('attendance', __name__)
 
@@ -102,12 +103,12 @@ def create_attendance(class_id):
             db.session.rollback()
             return jsonify({'error': 'No students enrolled in this class'}), 400
         
-        current_max_id = db.session.query(db.func.max(AttendanceRecord.id)).scalar() or 0
+        record_ids = allocate_ids(AttendanceRecord, len(students))
 
         record_objects = []
-        for i, s in enumerate(students):
+        for record_id, s in zip(record_ids, students):
             rec = AttendanceRecord(
-                id=current_max_id + i + 1,
+                id=record_id,
                 attendance_id=att_id,
                 student_id=s.student_id,
                 status=default_status
@@ -116,6 +117,7 @@ def create_attendance(class_id):
             
         db.session.add_all(record_objects)
         db.session.commit()
+        dashboard_stats.adjust_activity_count('attendance_sessions')
         
         return jsonify({'message': 'Attendance created', 'id': att_id, 'date': new_att.date.isoformat()}), 201
     except Exception as e:
@@ -285,6 +287,7 @@ def delete_attendance(attendance_id):
         # 删除考勤会话
         db.session.delete(att)
         db.session.commit()
+        dashboard_stats.adjust_activity_count('attendance_sessions', -1)
         
         return jsonify({'message': 'Attendance deleted successfully'}), 200
     except Exception as e:
@@ -3,6 +3,8 @@ from flask_login import login_user, logout_user, current_user
 from models import Users, Student, Teacher
 from . import api_v1
 from functools import wraps
+import user_search
+from permission_manager import get_compiled_permissions, invalidate_admin_permissions
 
 # 自定义认证装饰器，用于 API 端点
 def api_login_required(f):
@@ -29,6 +31,9 @@ def api_login():
         return jsonify({'error': 'Account disabled'}), 403
 
     login_user(user)
+    # 登录时重新编译管理员权限
+    invalidate_admin_permissions([user.user_id])
+    get_compiled_permissions(user)
     return jsonify({
         'message': 'Logged in successfully',
         'user': {
@@ -42,6 +47,7 @@ def api_login():
 @api_v1.route('/logout', methods=['POST'])
 @api_login_required
 def api_logout():
+    invalidate_admin_permissions([current_user.user_id])
     logout_user()
     return jsonify({'message': 'Logged out successfully'})
 
@@ -83,30 +89,8 @@ def search_users():
     if not query or len(query) < 2:
         return jsonify([])
     
-    # 搜索用户名或真实姓名
-    users = Users.query.filter(
-        (Users.username.like(f'%{query}%')) | 
-        (Users.real_name.like(f'%{query}%'))
-    ).filter(Users.status == 1).limit(20).all()
-    
-    results = []
-    for u in users:
-        user_info = {
-            'id': u.user_id,
-            'username': u.username,
-            'real_name': u.real_name,
-            'role': u.role
-        }
-        
-        # 添加角色特定信息
-        if u.role == 'student' and u.student_profile:
-            user_info['student_no'] = u.student_profile.student_no
-        elif u.role == 'teacher' and u.teacher_profile:
-            user_info['teacher_no'] = u.teacher_profile.teacher_no
-            
-        results.append(user_info)
-    
-    return jsonify(results)
+    # 在内存索引中按用户名、真实姓名、学号、工号搜索，按相关度排序
+    return jsonify(user_search.search_users(query, limit=20))
 
 @api_v1.route('/profile', methods=['PUT'])
 @api_login_required
@@ -124,6 +108,7 @@ def update_profile():
     try:
         from app import db
         db.session.commit()
+        user_search.index_users([current_user.user_id])
         return jsonify({'message': '信息更新成功'})
     except Exception as e:
         db.session.rollback()
@@ -2,11 +2,33 @@
 from flask import jsonify, request, current_app
 from flask_login import current_user
 from functools import wraps
-from models import ForumPost, ForumComment, TeachingClass, TeacherClass, StudentClass, db, generate_next_id
+from models import ForumPost, ForumComment, TeachingClass, TeacherClass, StudentClass, Users, db, generate_next_id
 from . import api_v1
+from sqlalchemy.orm import joinedload
 from datetime import datetime
+import base64
+import json
 import os
 from werkzeug.utils import secure_filename
+import view_counter
+import forum_search
+import forum_stats
+
+# 帖子列表每页条数（默认/上限）与摘要长度
+FORUM_PAGE_SIZE = 20
+FORUM_MAX_PAGE_SIZE = 100
+POST_PREVIEW_LENGTH = 200
+
+# 帖子详情中一级回复每页条数（默认/上限），以及直接展开的回复层数
+COMMENT_PAGE_SIZE = 50
+COMMENT_MAX_PAGE_SIZE = 200
+REPLY_DEPTH_LIMIT = 3
+
+# 逐层加载楼中楼时每批的父回复ID个数（SQL Server 单条语句最多 2100 个参数）
+COMMENT_CHUNK_SIZE = 1000
+
+# is_pinned 列可为 NULL，排序与游标条件中按未置顶处理
+_POST_PINNED = db.func.coalesce(ForumPost.is_pinned, False)
 
 
 def api_login_required(f):
@@ -66,29 +88,114 @@ def get_my_classes():
 @api_v1.route('/classes/<int:class_id>/forum/posts', methods=['GET'])
 @api_login_required
 def get_forum_posts(class_id):
-    """?????????????"""
-    # ???????????????
-    
-    posts = ForumPost.query.filter_by(class_id=class_id).order_by(ForumPost.is_pinned.desc(), ForumPost.created_at.desc()).all()
-    
+    """获取班级帖子列表（游标分页）
+
+    按置顶、发布时间倒序排列。首页不传 cursor，之后传上一页返回的 next_cursor；
+    每页一次查询：作者信息连接查询，回复数来自分组子查询，摘要在SQL中截取。
+    """
+    limit = min(max(request.args.get('limit', FORUM_PAGE_SIZE, type=int), 1), FORUM_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+
+    reply_counts = db.session.query(
+        ForumComment.post_id,
+        db.func.count(ForumComment.id).label('reply_count')
+    ).group_by(ForumComment.post_id).subquery()
+
+    query = db.session.query(
+        ForumPost.id, ForumPost.title, ForumPost.author_id, ForumPost.created_at, ForumPost.updated_at,
+        ForumPost.view_count, ForumPost.is_pinned, ForumPost.is_solved, ForumPost.file_path,
+        # 多取一个字符，用于判断是否需要省略号
+        db.func.substring(ForumPost.content, 1, POST_PREVIEW_LENGTH + 1).label('preview'),
+        Users.real_name.label('author_name'), Users.role.label('author_role'),
+        db.func.coalesce(reply_counts.c.reply_count, 0).label('reply_count')
+    ).join(Users, Users.user_id == ForumPost.author_id)\
+     .outerjoin(reply_counts, reply_counts.c.post_id == ForumPost.id)\
+     .filter(ForumPost.class_id == class_id)
+
+    if cursor:
+        try:
+            query = query.filter(_after_post_cursor(*_decode_post_cursor(cursor)))
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    rows = query.order_by(_POST_PINNED.desc(), ForumPost.created_at.desc(), ForumPost.id.desc())\
+        .limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_post_cursor(rows[-1])
+
     results = []
-    for p in posts:
+    for p in rows:
+        preview = p.preview or ''
         results.append({
             'id': p.id,
             'title': p.title,
-            'content': p.content[:200] + '...' if len(p.content) > 200 else p.content,
-            'author_name': p.author.real_name,
+            'content': preview[:POST_PREVIEW_LENGTH] + '...' if len(preview) > POST_PREVIEW_LENGTH else preview,
+            'author_name': p.author_name,
             'author_id': p.author_id,
-            'author_role': p.author.role,
+            'author_role': p.author_role,
             'created_at': p.created_at.isoformat() if p.created_at else None,
             'updated_at': p.updated_at.isoformat() if p.updated_at else None,
-            'reply_count': p.comments.count(),
-            'view_count': p.view_count,
+            'reply_count': p.reply_count,
+            'view_count': (p.view_count or 0) + view_counter.pending_views(p.id),
             'is_pinned': p.is_pinned,
             'is_solved': p.is_solved,
             'has_attachment': bool(p.file_path)
         })
-    return jsonify(results)
+    return jsonify({
+        'posts': results,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+
+def _encode_post_cursor(post):
+    """把最后一行的 (is_pinned, created_at, id) 编码为不透明游标"""
+    payload = json.dumps([bool(post.is_pinned), post.created_at.isoformat() if post.created_at else None, post.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_post_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    is_pinned, created_at, post_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    return bool(is_pinned), (datetime.fromisoformat(created_at) if created_at else None), int(post_id)
+
+
+def _after_post_cursor(is_pinned, created_at, post_id):
+    """按 is_pinned DESC（NULL 视为 False）, created_at DESC, id DESC 排序时位于游标之后的行（created_at 为 NULL 的排在组内最后）"""
+    if created_at is None:
+        within = db.and_(ForumPost.created_at.is_(None), ForumPost.id < post_id)
+    else:
+        within = db.or_(
+            ForumPost.created_at < created_at,
+            db.and_(ForumPost.created_at == created_at, ForumPost.id < post_id),
+            ForumPost.created_at.is_(None)
+        )
+    if is_pinned:
+        return db.or_(_POST_PINNED == False, db.and_(_POST_PINNED == True, within))
+    return db.and_(_POST_PINNED == False, within)
+
+@api_v1.route('/classes/<int:class_id>/forum/search', methods=['GET'])
+@api_login_required
+def search_forum_posts(class_id):
+    """在班级讨论区中全文搜索帖子和回复
+
+    查询参数 q 为搜索词，page/per_page 分页；结果按相关度排序，
+    每条带摘要片段 snippet 及命中位置 highlights（[起, 止) 字符区间）。
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'Search query is required'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', forum_search.SEARCH_PAGE_SIZE, type=int), 1),
+                   forum_search.SEARCH_MAX_PAGE_SIZE)
+
+    try:
+        return jsonify(forum_search.search_forum(class_id, q, page, per_page))
+    except Exception as e:
+        current_app.logger.error(f"Failed to search forum: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @api_v1.route('/classes/<int:class_id>/forum/posts', methods=['POST'])
 @api_login_required
@@ -132,35 +239,21 @@ def create_forum_post(class_id):
         post.file_path = f"uploads/forum/{unique_filename}"
     
     db.session.add(post)
+    forum_search.index_post(post)
+    forum_stats.post_created(post)
     db.session.commit()
     return jsonify({'message': 'Post created', 'id': post.id}), 201
 
 @api_v1.route('/forum/posts/<int:post_id>', methods=['GET'])
 @api_login_required
 def get_post_detail(post_id):
-    """?????????"""
-    post = ForumPost.query.get_or_404(post_id)
-    
-    # Update view count
-    post.view_count += 1
-    db.session.commit()
+    """获取帖子详情及第一页回复"""
+    post = ForumPost.query.options(joinedload(ForumPost.author)).filter_by(id=post_id).first_or_404()
     
-    # Fetch top-level comments
-    top_comments = post.comments.filter_by(parent_id=None).order_by(ForumComment.created_at.asc()).all()
+    # 浏览量先记入缓冲区，由后台批量写回
+    view_counter.record_view(current_app._get_current_object(), post.id)
     
-    def format_comment(c):
-        return {
-            'id': c.id,
-            'content': c.content,
-            'author_name': c.author.real_name,
-            'author_id': c.author.user_id,
-            'author_role': c.author.role,
-            'created_at': c.created_at.isoformat() if c.created_at else None,
-            'is_accepted': c.is_accepted_answer,
-            'replies': [format_comment(r) for r in c.replies]
-        }
-
-    return jsonify({
+    data = {
         'id': post.id,
         'title': post.title,
         'content': post.content,
@@ -168,12 +261,118 @@ def get_post_detail(post_id):
         'author_id': post.author_id,
         'author_role': post.author.role,
         'created_at': post.created_at.isoformat() if post.created_at else None,
+        'view_count': (post.view_count or 0) + view_counter.pending_views(post.id),
         'is_pinned': post.is_pinned,
         'is_solved': post.is_solved,
         'file_name': post.file_name,
         'file_url': f'/api/v1/download/{post.id}' if post.file_path else None, # Helper route needed
-        'comments': [format_comment(c) for c in top_comments]
-    })
+    }
+    data.update(_comment_page(
+        post.id,
+        request.args.get('comment_page', 1, type=int),
+        request.args.get('comment_per_page', COMMENT_PAGE_SIZE, type=int)
+    ))
+    return jsonify(data)
+
+
+@api_v1.route('/forum/posts/<int:post_id>/comments', methods=['GET'])
+@api_login_required
+def get_post_comments(post_id):
+    """按页获取帖子的一级回复（含折叠后的楼中楼）"""
+    ForumPost.query.get_or_404(post_id)
+    return jsonify(_comment_page(
+        post_id,
+        request.args.get('page', 1, type=int),
+        request.args.get('per_page', COMMENT_PAGE_SIZE, type=int)
+    ))
+
+
+@api_v1.route('/forum/comments/<int:comment_id>/replies', methods=['GET'])
+@api_login_required
+def get_comment_replies(comment_id):
+    """展开被折叠的回复分支（只加载该分支）"""
+    comment = ForumComment.query.get_or_404(comment_id)
+    replies = [_comment_node(r) for r in _comment_query(comment.post_id)
+               .filter(ForumComment.parent_id == comment_id)]
+    _load_replies(comment.post_id, replies, 1)
+    return jsonify(replies)
+
+
+def _comment_query(post_id):
+    """帖子回复及作者信息，按发布时间正序"""
+    return db.session.query(
+        ForumComment.id, ForumComment.parent_id, ForumComment.content, ForumComment.author_id,
+        ForumComment.created_at, ForumComment.is_accepted_answer,
+        Users.real_name, Users.role
+    ).join(Users, Users.user_id == ForumComment.author_id)\
+     .filter(ForumComment.post_id == post_id)\
+     .order_by(ForumComment.created_at.asc(), ForumComment.id.asc())
+
+
+def _comment_node(r):
+    return {
+        'id': r.id,
+        'content': r.content,
+        'author_name': r.real_name,
+        'author_id': r.author_id,
+        'author_role': r.role,
+        'created_at': r.created_at.isoformat() if r.created_at else None,
+        'is_accepted': r.is_accepted_answer,
+        'replies': [],
+        'reply_count': 0,
+        'collapsed': False
+    }
+
+
+def _load_replies(post_id, nodes, depth=0):
+    """从 depth 层的 nodes 开始按父回复ID逐层加载楼中楼，每层一次 IN 查询（按 COMMENT_CHUNK_SIZE 分批）
+
+    超过 REPLY_DEPTH_LIMIT 层的分支折叠，只统计直接回复数，由 /forum/comments/<id>/replies 展开。
+    """
+    level = {node['id']: node for node in nodes}
+    while level and depth < REPLY_DEPTH_LIMIT:
+        children = {}
+        parent_ids = list(level)
+        for i in range(0, len(parent_ids), COMMENT_CHUNK_SIZE):
+            chunk = parent_ids[i:i + COMMENT_CHUNK_SIZE]
+            for r in _comment_query(post_id).filter(ForumComment.parent_id.in_(chunk)):
+                parent = level[r.parent_id]
+                parent['replies'].append(_comment_node(r))
+                parent['reply_count'] += 1
+                children[r.id] = parent['replies'][-1]
+        level = children
+        depth += 1
+
+    parent_ids = list(level)
+    for i in range(0, len(parent_ids), COMMENT_CHUNK_SIZE):
+        chunk = parent_ids[i:i + COMMENT_CHUNK_SIZE]
+        counts = db.session.query(ForumComment.parent_id, db.func.count(ForumComment.id))\
+            .filter(ForumComment.post_id == post_id, ForumComment.parent_id.in_(chunk))\
+            .group_by(ForumComment.parent_id)
+        for parent_id, count in counts:
+            level[parent_id]['reply_count'] = count
+            level[parent_id]['collapsed'] = True
+
+
+def _comment_page(post_id, page, per_page):
+    """一级回复分页：在数据库中分页一级回复，再只加载本页回复的楼中楼"""
+    per_page = min(max(per_page, 1), COMMENT_MAX_PAGE_SIZE)
+    page = max(page, 1)
+    total = db.session.query(db.func.count(ForumComment.id))\
+        .filter(ForumComment.post_id == post_id, ForumComment.parent_id.is_(None)).scalar()
+    comments = [_comment_node(r) for r in _comment_query(post_id)
+                .filter(ForumComment.parent_id.is_(None))
+                .offset((page - 1) * per_page).limit(per_page)]
+    _load_replies(post_id, comments)
+    return {
+        'comments': comments,
+        'comment_pagination': {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': (total + per_page - 1) // per_page
+        }
+    }
 
 
 @api_v1.route('/download/<int:post_id>')
@@ -226,8 +425,11 @@ def delete_post(post_id):
             except:
                 pass # logging error
 
+    forum_search.remove_post(post_id)
+    forum_stats.post_deleted(post)
     db.session.delete(post)
     db.session.commit()
+    view_counter.discard_views([post_id])
     return jsonify({'message': 'Post deleted'})
 
 @api_v1.route('/forum/posts/<int:post_id>', methods=['PUT'])
@@ -245,7 +447,8 @@ def update_post(post_id):
         post.title = data['title']
     if 'content' in data:
         post.content = data['content']
-        
+
+    forum_search.index_post(post)
     db.session.commit()
     return jsonify({'message': 'Post updated'})
 
@@ -260,6 +463,10 @@ def add_comment(post_id):
     
     if not content:
         return jsonify({'error': 'Content is required'}), 400
+
+    class_id = db.session.query(ForumPost.class_id).filter(ForumPost.id == post_id).scalar()
+    if class_id is None:
+        return jsonify({'error': 'Post not found'}), 404
         
     comment = ForumComment(
         id=generate_next_id(ForumComment, 'id'),
@@ -270,6 +477,8 @@ def add_comment(post_id):
     )
     
     db.session.add(comment)
+    forum_search.index_comment(comment, class_id)
+    forum_stats.comment_created(comment, class_id)
     db.session.commit()
     return jsonify({'message': 'Comment added', 'id': comment.id}), 201
 
@@ -297,6 +506,8 @@ def delete_comment(comment_id):
     if not can_delete:
         return jsonify({'error': 'Permission denied'}), 403
 
+    forum_search.remove_comment(comment.id, comment.post_id)
+    forum_stats.comment_deleted(comment, post.class_id)
     db.session.delete(comment)
     db.session.commit()
     return jsonify({'message': 'Comment deleted'})
@@ -312,6 +523,7 @@ def update_comment(comment_id):
     data = request.get_json()
     if 'content' in data:
         comment.content = data['content']
-        
+
+    forum_search.index_comment(comment, comment.post.class_id)
     db.session.commit()
     return jsonify({'message': 'Comment updated'})
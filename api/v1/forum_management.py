@@ -4,17 +4,23 @@
 from flask import Blueprint, jsonify, request, current_app
 from flask_login import current_user
 from models import (
-    ForumPost, ForumComment, ForumModeration, ForumPostStatus,
-    TeachingClass, TeacherClass, db, generate_next_id
+    ForumPost, ForumComment, ForumModeration, ForumPostStatus, ForumClassStats, ForumAuthorStats,
+    TeachingClass, TeacherClass, Users, db, generate_next_id
 )
 from permission_manager import (
-    forum_admin_required, content_reviewer_required, api_login_required
+    forum_admin_required, content_reviewer_required, api_login_required, current_admin_id
 )
 from datetime import datetime
 import os
+import view_counter
+import forum_search
+import forum_stats
 
 forum_mgmt_bp = Blueprint('forum_management', __name__, url_prefix='/api/v1/forum-management')
 
+# 统计排行榜条数
+STATISTICS_TOP_N = 10
+
 
 # ==================== 论坛内容管理 ====================
 
@@ -63,7 +69,7 @@ def get_all_forum_posts():
                 'author_id': p.author_id,
                 'class_id': p.class_id,
                 'created_at': p.created_at.isoformat() if p.created_at else None,
-                'view_count': p.view_count,
+                'view_count': (p.view_count or 0) + view_counter.pending_views(p.id),
                 'reply_count': p.comments.count(),
                 'is_pinned': p.is_pinned,
                 'is_hidden': status.is_hidden if status else False,
@@ -100,7 +106,7 @@ def pin_post(post_id):
             id=generate_next_id(ForumModeration, 'id'),
             content_type='post',
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='pin',
             reason=reason,
             status='completed'
@@ -132,7 +138,7 @@ def unpin_post(post_id):
             id=generate_next_id(ForumModeration, 'id'),
             content_type='post',
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='unpin',
             reason=reason,
             status='completed'
@@ -159,6 +165,7 @@ def hide_post(post_id):
         
         # 获取或创建状态记录
         status = ForumPostStatus.query.filter_by(post_id=post_id).first()
+        before = forum_stats.status_flags(status)
         if not status:
             status = ForumPostStatus(
                 id=generate_next_id(ForumPostStatus, 'id'),
@@ -167,14 +174,15 @@ def hide_post(post_id):
         
         status.is_hidden = True
         status.hide_reason = reason
-        status.hidden_by = current_user.admin_profile.admin_id
+        status.hidden_by = current_admin_id()
+        forum_stats.post_status_changed(post, before, status)
         
         # 记录审核日志
         moderation = ForumModeration(
             id=generate_next_id(ForumModeration, 'id'),
             content_type='post',
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='hide',
             reason=reason,
             status='completed'
@@ -199,15 +207,17 @@ def unhide_post(post_id):
         
         status = ForumPostStatus.query.filter_by(post_id=post_id).first()
         if status:
+            before = forum_stats.status_flags(status)
             status.is_hidden = False
             status.hide_reason = None
+            forum_stats.post_status_changed(post, before, status)
         
         # 记录审核日志
         moderation = ForumModeration(
             id=generate_next_id(ForumModeration, 'id'),
             content_type='post',
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='unhide',
             reason='管理员恢复显示',
             status='completed'
@@ -236,6 +246,7 @@ def lock_post(post_id):
         
         # 获取或创建状态记录
         status = ForumPostStatus.query.filter_by(post_id=post_id).first()
+        before = forum_stats.status_flags(status)
         if not status:
             status = ForumPostStatus(
                 id=generate_next_id(ForumPostStatus, 'id'),
@@ -244,14 +255,15 @@ def lock_post(post_id):
         
         status.is_locked = True
         status.lock_reason = reason
-        status.locked_by = current_user.admin_profile.admin_id
+        status.locked_by = current_admin_id()
+        forum_stats.post_status_changed(post, before, status)
         
         # 记录审核日志
         moderation = ForumModeration(
             id=generate_next_id(ForumModeration, 'id'),
             content_type='post',
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='lock',
             reason=reason,
             status='completed'
@@ -276,15 +288,17 @@ def unlock_post(post_id):
         
         status = ForumPostStatus.query.filter_by(post_id=post_id).first()
         if status:
+            before = forum_stats.status_flags(status)
             status.is_locked = False
             status.lock_reason = None
+            forum_stats.post_status_changed(post, before, status)
         
         # 记录审核日志
         moderation = ForumModeration(
             id=generate_next_id(ForumModeration, 'id'),
             content_type='post',
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='unlock',
             reason='管理员解锁',
             status='completed'
@@ -316,7 +330,7 @@ def admin_delete_post(post_id):
             id=generate_next_id(ForumModeration, 'id'),
             content_type='post',
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='delete',
             reason=reason,
             content_snapshot=f"标题: {post.title}\n内容: {post.content}",
@@ -333,8 +347,11 @@ def admin_delete_post(post_id):
                 pass
         
         db.session.add(moderation)
+        forum_search.remove_post(post_id)
+        forum_stats.post_deleted(post)
         db.session.delete(post)
         db.session.commit()
+        view_counter.discard_views([post_id])
         
         return jsonify({'message': 'Post deleted by admin', 'post_id': post_id}), 200
     except Exception as e:
@@ -361,7 +378,7 @@ def admin_delete_comment(comment_id):
             content_type='comment',
             comment_id=comment_id,
             post_id=post_id,
-            admin_id=current_user.admin_profile.admin_id,
+            admin_id=current_admin_id(),
             action='delete',
             reason=reason,
             content_snapshot=f"评论: {comment.content}",
@@ -369,6 +386,8 @@ def admin_delete_comment(comment_id):
         )
         
         db.session.add(moderation)
+        forum_search.remove_comment(comment_id, post_id)
+        forum_stats.comment_deleted(comment, comment.post.class_id)
         db.session.delete(comment)
         db.session.commit()
         
@@ -434,6 +453,7 @@ def flag_post_for_review(post_id):
         
         # 获取或创建状态记录
         status = ForumPostStatus.query.filter_by(post_id=post_id).first()
+        before = forum_stats.status_flags(status)
         if not status:
             status = ForumPostStatus(
                 id=generate_next_id(ForumPostStatus, 'id'),
@@ -443,6 +463,7 @@ def flag_post_for_review(post_id):
         status.is_flagged = True
         status.warning_level = warning_level
         status.warning_message = warning_message
+        forum_stats.post_status_changed(post, before, status)
         
         db.session.add(status)
         db.session.commit()
@@ -462,9 +483,11 @@ def unflag_post(post_id):
         
         status = ForumPostStatus.query.filter_by(post_id=post_id).first()
         if status:
+            before = forum_stats.status_flags(status)
             status.is_flagged = False
             status.warning_level = 0
             status.warning_message = None
+            forum_stats.post_status_changed(post, before, status)
             db.session.add(status)
         
         db.session.commit()
@@ -539,7 +562,9 @@ def reverse_moderation_action(log_id):
             if post:
                 status = ForumPostStatus.query.filter_by(post_id=log.post_id).first()
                 if status:
+                    before = forum_stats.status_flags(status)
                     status.is_hidden = False
+                    forum_stats.post_status_changed(post, before, status)
                     db.session.add(status)
         
         elif log.action == 'lock' and log.post_id:
@@ -547,12 +572,14 @@ def reverse_moderation_action(log_id):
             if post:
                 status = ForumPostStatus.query.filter_by(post_id=log.post_id).first()
                 if status:
+                    before = forum_stats.status_flags(status)
                     status.is_locked = False
+                    forum_stats.post_status_changed(post, before, status)
                     db.session.add(status)
         
         log.status = 'reversed'
         log.reversed_at = datetime.now()
-        log.reversed_by = current_user.admin_profile.admin_id
+        log.reversed_by = current_admin_id()
         
         db.session.commit()
         
@@ -567,39 +594,50 @@ def reverse_moderation_action(log_id):
 @forum_mgmt_bp.route('/admin/statistics', methods=['GET'])
 @forum_admin_required
 def get_forum_statistics():
-    """获取论坛统计信息"""
+    """获取论坛统计信息
+
+    总数与排行榜都读取按班级/按用户维护的计数器表，不扫描帖子和回复表。
+    """
     try:
-        total_posts = ForumPost.query.count()
-        total_comments = ForumComment.query.count()
-        total_hidden_posts = ForumPostStatus.query.filter_by(is_hidden=True).count()
-        total_locked_posts = ForumPostStatus.query.filter_by(is_locked=True).count()
-        total_flagged_posts = ForumPostStatus.query.filter_by(is_flagged=True).count()
+        totals = db.session.query(*[
+            db.func.coalesce(db.func.sum(getattr(ForumClassStats, field)), 0)
+            for field in ('post_count', 'comment_count', 'hidden_count', 'locked_count', 'flagged_count')
+        ]).one()
         
         # 最活跃的讨论区（按帖子数）
-        active_classes = db.session.query(
-            ForumPost.class_id,
-            db.func.count(ForumPost.id).label('post_count'),
-            db.func.count(ForumComment.id).label('comment_count')
-        ).outerjoin(ForumComment, ForumPost.id == ForumComment.post_id).group_by(
-            ForumPost.class_id
-        ).order_by(db.func.count(ForumPost.id).desc()).limit(10).all()
-        
-        # 最活跃的用户
-        active_users = db.session.query(
-            ForumPost.author_id,
-            db.func.count(ForumPost.id).label('post_count')
-        ).group_by(ForumPost.author_id).order_by(
-            db.func.count(ForumPost.id).desc()
-        ).limit(10).all()
+        active_classes = db.session.query(ForumClassStats, TeachingClass.class_name)\
+            .outerjoin(TeachingClass, TeachingClass.class_id == ForumClassStats.class_id)\
+            .filter(ForumClassStats.post_count > 0)\
+            .order_by(ForumClassStats.post_count.desc(), ForumClassStats.class_id)\
+            .limit(STATISTICS_TOP_N).all()
+        
+        # 最活跃的用户（按发帖数）
+        active_users = db.session.query(ForumAuthorStats, Users.real_name)\
+            .join(Users, Users.user_id == ForumAuthorStats.user_id)\
+            .filter(ForumAuthorStats.post_count > 0)\
+            .order_by(ForumAuthorStats.post_count.desc(), ForumAuthorStats.user_id)\
+            .limit(STATISTICS_TOP_N).all()
         
         return jsonify({
-            'total_posts': total_posts,
-            'total_comments': total_comments,
-            'total_hidden_posts': total_hidden_posts,
-            'total_locked_posts': total_locked_posts,
-            'total_flagged_posts': total_flagged_posts,
-            'active_classes': len(active_classes),
-            'active_users': len(active_users)
+            'total_posts': int(totals[0]),
+            'total_comments': int(totals[1]),
+            'total_hidden_posts': int(totals[2]),
+            'total_locked_posts': int(totals[3]),
+            'total_flagged_posts': int(totals[4]),
+            'active_classes': [{
+                'class_id': stats.class_id,
+                'class_name': class_name,
+                'post_count': stats.post_count,
+                'comment_count': stats.comment_count,
+                'last_activity_at': stats.last_activity_at.isoformat() if stats.last_activity_at else None
+            } for stats, class_name in active_classes],
+            'active_users': [{
+                'user_id': stats.user_id,
+                'real_name': real_name,
+                'post_count': stats.post_count,
+                'comment_count': stats.comment_count,
+                'last_activity_at': stats.last_activity_at.isoformat() if stats.last_activity_at else None
+            } for stats, real_name in active_users]
         })
     except Exception as e:
         current_app.logger.error(f"Failed to get forum statistics: {e}")
@@ -1,15 +1,26 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, make_response
 from flask_login import current_user
 from functools import wraps
 from models import (
     db, GradeCategory, GradeItem, StudentGradeScore, StudentFinalGrade,
     TeacherClass, StudentClass, Assignment, Submission, Attendance, AttendanceRecord,
-    TeachingClass, Student,
+    TeachingClass, Student, Users,
     generate_next_id
 )
 from datetime import datetime
 from sqlalchemy import func
+from grade_engine import (
+    get_grade_structure, invalidate_grade_structure, load_roster, load_score_matrix,
+    calculate_class_final_grades, calculate_attendance_scores,
+    validate_item_scores, save_item_scores, refresh_final_grades,
+    build_gradebook, load_student_scores, build_transcript
+)
+from grade_statistics import get_class_statistics, invalidate_class_statistics, DEFAULT_PERCENTILES, DEFAULT_HISTOGRAM_EDGES
+import gzip
+import json
+import math
+import struct
 
 grades_bp = Blueprint('grades', __name__, url_prefix='/api/v1/grades')
 
@@ -30,26 +41,25 @@ def api_login_required(f):
 @api_login_required
 def get_grade_categories(class_id):
     """??????????"""
-    categories = GradeCategory.query.filter_by(class_id=class_id).order_by(GradeCategory.order).all()
+    structure = get_grade_structure(class_id)
     
     result = []
-    for cat in categories:
-        items = GradeItem.query.filter_by(category_id=cat.id).all()
+    for cat in structure:
         result.append({
-            'id': cat.id,
-            'name': cat.name,
-            'weight': float(cat.weight) if cat.weight else 0,
-            'description': cat.description,
-            'order': cat.order,
+            'id': cat['id'],
+            'name': cat['name'],
+            'weight': cat['weight'] or 0,
+            'description': cat['description'],
+            'order': cat['order'],
             'items': [{
-                'id': item.id,
-                'name': item.name,
-                'type': item.item_type,
-                'weight': float(item.weight) if item.weight else 0,
-                'max_score': float(item.max_score) if item.max_score else 100,
-                'auto_calculate': item.auto_calculate,
-                'is_published': item.is_published
-            } for item in items]
+                'id': item['id'],
+                'name': item['name'],
+                'type': item['type'],
+                'weight': item['weight'] or 0,
+                'max_score': item['max_score'] or 100,
+                'auto_calculate': item['auto_calculate'],
+                'is_published': item['is_published']
+            } for item in cat['items']]
         })
     
     return jsonify(result)
@@ -75,6 +85,8 @@ def create_grade_category(class_id):
     
     db.session.add(category)
     db.session.commit()
+    invalidate_grade_structure(class_id)
+    invalidate_class_statistics(class_id)
     
     return jsonify({'message': 'Created', 'id': category.id}), 201
 
@@ -99,6 +111,7 @@ def update_grade_category(category_id):
         category.order = data['order']
     
     db.session.commit()
+    invalidate_grade_structure(category.class_id)
     return jsonify({'message': 'Updated'})
 
 
@@ -110,8 +123,11 @@ def delete_grade_category(category_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     category = GradeCategory.query.get_or_404(category_id)
+    class_id = category.class_id
     db.session.delete(category)
     db.session.commit()
+    invalidate_grade_structure(class_id)
+    invalidate_class_statistics(class_id)
     
     return jsonify({'message': 'Deleted'})
 
@@ -144,6 +160,7 @@ def create_grade_item(category_id):
     
     db.session.add(item)
     db.session.commit()
+    invalidate_grade_structure(category.class_id)
     
     return jsonify({'message': 'Created', 'id': item.id}), 201
 
@@ -163,6 +180,7 @@ def update_grade_item(item_id):
             setattr(item, field, data[field])
     
     db.session.commit()
+    invalidate_grade_structure(item.class_id)
     return jsonify({'message': 'Updated'})
 
 
@@ -174,8 +192,10 @@ def delete_grade_item(item_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     item = GradeItem.query.get_or_404(item_id)
+    class_id = item.class_id
     db.session.delete(item)
     db.session.commit()
+    invalidate_grade_structure(class_id)
     
     return jsonify({'message': 'Deleted'})
 
@@ -226,42 +246,21 @@ def batch_update_scores(item_id):
     
     teacher_id = current_user.teacher_profile.teacher_id if current_user.teacher_profile else None
     
-    for score_data in data:
-        student_id = score_data.get('student_id')
-        score_value = score_data.get('score')
-        
-        if score_value is None:
-            continue
-        
-        # ???????
-        percentage = (float(score_value) / float(item.max_score)) * 100 if item.max_score else 0
-        
-        # ?????????
-        score_record = StudentGradeScore.query.filter_by(
-            grade_item_id=item_id,
-            student_id=student_id
-        ).first()
-        
-        if score_record:
-            score_record.score = score_value
-            score_record.percentage = percentage
-            score_record.graded_by = teacher_id
-            score_record.graded_at = datetime.now()
-        else:
-            score_record = StudentGradeScore(
-                id=generate_next_id(StudentGradeScore),
-                grade_item_id=item_id,
-                student_id=student_id,
-                class_id=item.class_id,
-                score=score_value,
-                percentage=percentage,
-                graded_by=teacher_id,
-                graded_at=datetime.now()
-            )
-            db.session.add(score_record)
+    # 整体校验后按已有记录拆分为插入/更新，在同一事务内批量写入
+    rows, errors = validate_item_scores(item, data)
+    updated, created = save_item_scores(item, rows, teacher_id)
+    
+    # 已计算过总评的班级，增量刷新受影响学生的总评与排名
+    refresh_final_grades(item.class_id, [row['student_id'] for row in rows])
     
     db.session.commit()
-    return jsonify({'message': 'Scores updated successfully'})
+    return jsonify({
+        'message': 'Scores updated successfully',
+        'updated': updated,
+        'created': created,
+        'error_count': len(errors),
+        'errors': errors
+    })
 
 
 # ==================== ???????? ====================
@@ -278,66 +277,20 @@ def calculate_attendance_score(item_id):
     if item.item_type != 'attendance':
         return jsonify({'error': 'This is not an attendance item'}), 400
     
-    # ????????
-    attendances = Attendance.query.filter_by(class_id=item.class_id).all()
-    total_sessions = len(attendances)
+    teacher_id = current_user.teacher_profile.teacher_id if current_user.teacher_profile else None
+    
+    # 一次分组查询统计出勤/迟到/请假次数，得分批量写回
+    total_sessions, total_students = calculate_attendance_scores(item, teacher_id)
     
     if total_sessions == 0:
         return jsonify({'error': 'No attendance records found'}), 400
     
-    # ????????
-    students = StudentClass.query.filter_by(class_id=item.class_id, status=1).all()
-    
-    teacher_id = current_user.teacher_profile.teacher_id if current_user.teacher_profile else None
-    
-    for enrollment in students:
-        student_id = enrollment.student_id
-        
-        # ??????
-        present_count = 0
-        late_count = 0
-        
-        for attendance in attendances:
-            record = AttendanceRecord.query.filter_by(
-                attendance_id=attendance.id,
-                student_id=student_id
-            ).first()
-            
-            if record:
-                if record.status == 'present':
-                    present_count += 1
-                elif record.status == 'late':
-                    late_count += 1
-        
-        # ????????????????0.8???????
-        attendance_score = (present_count + late_count * 0.8) / total_sessions * 100
-        
-        # ?????????
-        score_record = StudentGradeScore.query.filter_by(
-            grade_item_id=item_id,
-            student_id=student_id
-        ).first()
-        
-        if score_record:
-            score_record.score = attendance_score
-            score_record.percentage = attendance_score
-            score_record.graded_by = teacher_id
-            score_record.graded_at = datetime.now()
-        else:
-            score_record = StudentGradeScore(
-                id=generate_next_id(StudentGradeScore),
-                grade_item_id=item_id,
-                student_id=student_id,
-                class_id=item.class_id,
-                score=attendance_score,
-                percentage=attendance_score,
-                graded_by=teacher_id,
-                graded_at=datetime.now()
-            )
-            db.session.add(score_record)
-    
     db.session.commit()
-    return jsonify({'message': 'Attendance scores calculated', 'total_sessions': total_sessions})
+    return jsonify({
+        'message': 'Attendance scores calculated',
+        'total_sessions': total_sessions,
+        'total_students': total_students
+    })
 
 
 # ==================== ?????? ====================
@@ -349,96 +302,17 @@ def calculate_final_grades(class_id):
     if current_user.role != 'teacher':
         return jsonify({'error': 'Unauthorized'}), 403
     
-    # ??????
-    categories = GradeCategory.query.filter_by(class_id=class_id).all()
+    # 成绩结构、得分矩阵与已有总评各一次查询，排名后批量写回
+    total_students = calculate_class_final_grades(class_id)
     
-    if not categories:
+    if total_students is None:
         return jsonify({'error': 'No grade categories configured'}), 400
     
-    # ????????
-    students = StudentClass.query.filter_by(class_id=class_id, status=1).all()
-    
-    student_scores = []
-    
-    for enrollment in students:
-        student_id = enrollment.student_id
-        category_scores_dict = {}
-        total_score = 0
-        
-        for category in categories:
-            # ?????????????
-            items = GradeItem.query.filter_by(category_id=category.id).all()
-            
-            if not items:
-                continue
-            
-            # ???????????????
-            category_total = 0
-            category_weight_sum = 0
-            
-            for item in items:
-                score_record = StudentGradeScore.query.filter_by(
-                    grade_item_id=item.id,
-                    student_id=student_id
-                ).first()
-                
-                if score_record and score_record.percentage is not None:
-                    item_weight = float(item.weight) if item.weight else 1
-                    category_total += float(score_record.percentage) * item_weight
-                    category_weight_sum += item_weight
-            
-            # ??????????
-            category_score = category_total / category_weight_sum if category_weight_sum > 0 else 0
-            category_scores_dict[category.name] = round(category_score, 2)
-            
-            # ?????
-            category_weight = float(category.weight) if category.weight else 0
-            total_score += category_score * (category_weight / 100)
-        
-        student_scores.append({
-            'student_id': student_id,
-            'total_score': round(total_score, 2),
-            'category_scores': category_scores_dict
-        })
-    
-    # ???????
-    student_scores.sort(key=lambda x: x['total_score'], reverse=True)
-    
-    for rank, score_data in enumerate(student_scores, 1):
-        student_id = score_data['student_id']
-        total_score = score_data['total_score']
-        category_scores = score_data['category_scores']
-        
-        # ???????????
-        final_grade = StudentFinalGrade.query.filter_by(
-            student_id=student_id,
-            class_id=class_id
-        ).first()
-        
-        if final_grade:
-            final_grade.total_score = total_score
-            final_grade.rank = rank
-            final_grade.rank_percentage = round((rank / len(student_scores)) * 100, 2)
-            final_grade.category_scores = category_scores
-            final_grade.calculated_at = datetime.now()
-        else:
-            final_grade = StudentFinalGrade(
-                id=generate_next_id(StudentFinalGrade),
-                student_id=student_id,
-                class_id=class_id,
-                total_score=total_score,
-                rank=rank,
-                rank_percentage=round((rank / len(student_scores)) * 100, 2),
-                category_scores=category_scores,
-                calculated_at=datetime.now()
-            )
-            db.session.add(final_grade)
-    
     db.session.commit()
     
     return jsonify({
         'message': 'Final grades calculated',
-        'total_students': len(student_scores)
+        'total_students': total_students
     })
 
 
@@ -456,31 +330,41 @@ def get_my_grades(class_id):
         return jsonify({'error': 'Student profile not found'}), 404
     
     # ??????
-    categories = GradeCategory.query.filter_by(class_id=class_id).order_by(GradeCategory.order).all()
+    structure = get_grade_structure(class_id)
     
     result = {
         'categories': [],
         'final_grade': None
     }
     
-    for category in categories:
-        items = GradeItem.query.filter_by(category_id=category.id, is_published=True).all()
-        
+    # 已发布成绩项的本人得分一次查询取回
+    published_ids = [item['id'] for cat in structure for item in cat['items'] if item['is_published']]
+    score_records = {}
+    if published_ids:
+        score_records = {
+            r.grade_item_id: r for r in db.session.query(
+                StudentGradeScore.grade_item_id, StudentGradeScore.score, StudentGradeScore.percentage
+            ).filter(
+                StudentGradeScore.student_id == student.student_id,
+                StudentGradeScore.grade_item_id.in_(published_ids)
+            ).all()
+        }
+    
+    for category in structure:
         category_data = {
-            'name': category.name,
-            'weight': float(category.weight) if category.weight else 0,
+            'name': category['name'],
+            'weight': category['weight'] or 0,
             'items': []
         }
         
-        for item in items:
-            score_record = StudentGradeScore.query.filter_by(
-                grade_item_id=item.id,
-                student_id=student.student_id
-            ).first()
+        for item in category['items']:
+            if not item['is_published']:
+                continue
+            score_record = score_records.get(item['id'])
             
             category_data['items'].append({
-                'name': item.name,
-                'max_score': float(item.max_score) if item.max_score else 100,
+                'name': item['name'],
+                'max_score': item['max_score'] or 100,
                 'score': float(score_record.score) if score_record and score_record.score else None,
                 'percentage': float(score_record.percentage) if score_record and score_record.percentage else None
             })
@@ -514,85 +398,22 @@ def get_grade_statistics(class_id):
     if current_user.role != 'teacher':
         return jsonify({'error': 'Unauthorized'}), 403
     
-    # ???????????
-    categories = GradeCategory.query.filter_by(class_id=class_id).all()
-    has_config = len(categories) > 0
-    
-    final_grades = StudentFinalGrade.query.filter_by(class_id=class_id).order_by(StudentFinalGrade.rank).all()
-    
-    if not final_grades:
-        # ?????????????????
-        return jsonify({
-            'total_students': 0,
-            'average': 0,
-            'highest': 0,
-            'lowest': 0,
-            'pass_rate': 0,
-            'excellent_rate': 0,
-            'distribution': {},
-            'rankings': [],
-            'has_data': False,
-            'has_config': has_config,
-            'message': '?????????????' if has_config else '????????'
-        })
-    
-    scores = [float(g.total_score) for g in final_grades if g.total_score]
-    
-    if not scores:
-        return jsonify({
-            'total_students': 0,
-            'average': 0,
-            'highest': 0,
-            'lowest': 0,
-            'pass_rate': 0,
-            'excellent_rate': 0,
-            'distribution': {},
-            'rankings': [],
-            'has_data': False,
-            'has_config': has_config,
-            'message': '?????????????' if has_config else '????????'
-        })
-    
-    # ????
-    stats = {
-        'total_students': len(scores),
-        'average': round(sum(scores) / len(scores), 2),
-        'highest': max(scores),
-        'lowest': min(scores),
-        'pass_rate': round(len([s for s in scores if s >= 60]) / len(scores) * 100, 2),
-        'excellent_rate': round(len([s for s in scores if s >= 85]) / len(scores) * 100, 2),
-        'has_data': True
-    }
-    
-    # ?????
-    score_distribution = {
-        '90-100': len([s for s in scores if 90 <= s <= 100]),
-        '80-89': len([s for s in scores if 80 <= s < 90]),
-        '70-79': len([s for s in scores if 70 <= s < 80]),
-        '60-69': len([s for s in scores if 60 <= s < 70]),
-        '0-59': len([s for s in scores if s < 60])
-    }
-    
-    stats['distribution'] = score_distribution
-    
-    # ????
-    rankings = []
-    for grade in final_grades:
-        from models import Student, Users
-        student = Student.query.get(grade.student_id)
-        if student:
-            user = Users.query.get(student.user_id)
-            rankings.append({
-                'rank': grade.rank,
-                'student_no': student.student_no,
-                'name': user.real_name if user else '??',
-                'total_score': float(grade.total_score) if grade.total_score else 0,
-                'category_scores': grade.category_scores or {}
-            })
+    # 可选参数：percentiles=25,50,75,90  bins=0,60,70,80,90,100
+    try:
+        percentiles = [float(p) for p in request.args.get('percentiles', '').split(',') if p.strip()] or DEFAULT_PERCENTILES
+        edges = [float(e) for e in request.args.get('bins', '').split(',') if e.strip()] or DEFAULT_HISTOGRAM_EDGES
+    except ValueError:
+        return jsonify({'error': 'percentiles and bins must be comma-separated numbers'}), 400
     
-    stats['rankings'] = rankings
+    # float() 接受 nan/inf，须单独拒绝（nan 与任何数比较都为 False，能绕过范围检查）
+    if not all(math.isfinite(v) for v in list(percentiles) + list(edges)):
+        return jsonify({'error': 'percentiles and bins must be finite numbers'}), 400
+    if any(p < 0 or p > 100 for p in percentiles):
+        return jsonify({'error': 'percentiles must be between 0 and 100'}), 400
+    if len(edges) < 2:
+        return jsonify({'error': 'bins requires at least two edges'}), 400
     
-    return jsonify(stats)
+    return jsonify(get_class_statistics(class_id, percentiles, edges))
 
 
 # ==================== ??API??????????? ====================
@@ -605,21 +426,18 @@ def get_all_grade_items(class_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     # ???????????????????
-    categories = GradeCategory.query.filter_by(class_id=class_id).all()
-    
     result = []
-    for category in categories:
-        items = GradeItem.query.filter_by(category_id=category.id).all()
-        for item in items:
-            # ??????????????
-            if item.item_type in ['attendance', 'participation', 'project', 'other']:
+    for category in get_grade_structure(class_id):
+        for item in category['items']:
+            # 仅返回需要手工录入的成绩项
+            if item['type'] in ['attendance', 'participation', 'project', 'other']:
                 result.append({
-                    'id': item.id,
-                    'name': item.name,
-                    'type': item.item_type,
-                    'max_score': float(item.max_score) if item.max_score else 100,
-                    'category_name': category.name,
-                    'weight': float(item.weight) if item.weight else 0
+                    'id': item['id'],
+                    'name': item['name'],
+                    'type': item['type'],
+                    'max_score': item['max_score'] or 100,
+                    'category_name': category['name'],
+                    'weight': item['weight'] or 0
                 })
     
     return jsonify(result)
@@ -633,10 +451,19 @@ def get_final_grades(class_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     # ??????
-    categories = GradeCategory.query.filter_by(class_id=class_id).order_by(GradeCategory.order).all()
-    
-    # ???????????
-    final_grades = StudentFinalGrade.query.filter_by(class_id=class_id).order_by(StudentFinalGrade.rank).all()
+    structure = get_grade_structure(class_id)
+    
+    # 总评与学生信息一次联表查询
+    final_grades = db.session.query(
+        StudentFinalGrade.student_id,
+        StudentFinalGrade.total_score,
+        StudentFinalGrade.rank,
+        Student.student_no,
+        Users.real_name
+    ).join(Student, Student.student_id == StudentFinalGrade.student_id)\
+        .join(Users, Users.user_id == Student.user_id)\
+        .filter(StudentFinalGrade.class_id == class_id)\
+        .order_by(StudentFinalGrade.rank).all()
     
     def calculate_grade_level(score):
         """????????"""
@@ -653,88 +480,102 @@ def get_final_grades(class_id):
         else:
             return 'F'
     
-    def calculate_category_scores(student_id, categories):
-        """??????????"""
+    def calculate_category_scores(row, item_index):
+        """按成绩项权重计算各分类得分（以分类ID为键）"""
         category_scores = {}
-        for category in categories:
-            items = GradeItem.query.filter_by(category_id=category.id).all()
+        for category in structure:
+            items = category['items']
             if not items:
                 continue
             
-            total_weight = sum(float(item.weight or 0) for item in items)
+            total_weight = sum(item['weight'] or 0 for item in items)
             if total_weight == 0:
                 continue
             
             category_score = 0
             for item in items:
-                score_record = StudentGradeScore.query.filter_by(
-                    grade_item_id=item.id,
-                    student_id=student_id
-                ).first()
-                
-                if score_record and score_record.score is not None:
-                    item_weight = float(item.weight or 0)
-                    item_percentage = (float(score_record.score) / float(item.max_score)) * 100 if item.max_score else 0
+                score = row[item_index[item['id']]]
+                if score is not None:
+                    item_weight = item['weight'] or 0
+                    item_percentage = (score / item['max_score']) * 100 if item['max_score'] else 0
                     category_score += (item_percentage * item_weight / total_weight)
             
-            category_scores[category.id] = round(category_score, 2)
+            category_scores[category['id']] = round(category_score, 2)
         
         return category_scores
     
+    if final_grades:
+        students = [(g.student_id, g.student_no, g.real_name, g) for g in final_grades]
+    else:
+        # 尚未计算总评时列出在读学生
+        students = [(sid, student_no, real_name, None) for sid, student_no, real_name in load_roster(class_id)]
+    
+    matrix = load_score_matrix(class_id, structure, [s[0] for s in students], value='score')
+    
     students_data = []
-    for grade in final_grades:
-        from models import Student, Users
-        student = Student.query.get(grade.student_id)
-        if not student:
-            continue
-        
-        user = Users.query.get(student.user_id)
-        
-        # ????????
-        category_scores = calculate_category_scores(student.student_id, categories)
-        
-        final_score = float(grade.total_score) if grade.total_score else None
+    for (student_id, student_no, real_name, grade), row in zip(students, matrix['rows']):
+        final_score = float(grade.total_score) if grade and grade.total_score else None
         
         students_data.append({
-            'student_id': student.student_id,
-            'student_no': student.student_no,
-            'student_name': user.real_name if user else '??',
+            'student_id': student_id,
+            'student_no': student_no,
+            'student_name': real_name if real_name else '未知',
             'final_score': final_score,
             'grade_level': calculate_grade_level(final_score),
-            'rank': grade.rank,
-            'category_scores': category_scores
+            'rank': grade.rank if grade else None,
+            'category_scores': calculate_category_scores(row, matrix['item_index'])
         })
     
-    # ?????????????????????????
-    if not students_data:
-        enrollments = StudentClass.query.filter_by(class_id=class_id, status=1).all()
-        for enrollment in enrollments:
-            student = enrollment.student
-            user = Users.query.get(student.user_id)
-            
-            # ????????
-            category_scores = calculate_category_scores(student.student_id, categories)
-            
-            students_data.append({
-                'student_id': student.student_id,
-                'student_no': student.student_no,
-                'student_name': user.real_name if user else '??',
-                'final_score': None,
-                'grade_level': None,
-                'rank': None,
-                'category_scores': category_scores
-            })
-    
     return jsonify({
         'students': students_data,
         'categories': [{
-            'id': cat.id,
-            'name': cat.name,
-            'weight': float(cat.weight) if cat.weight else 0
-        } for cat in categories]
+            'id': cat['id'],
+            'name': cat['name'],
+            'weight': cat['weight'] or 0
+        } for cat in structure]
     })
 
 
+# 小于该字节数的成绩册不压缩
+GRADEBOOK_GZIP_MIN_SIZE = 1024
+
+
+@grades_bp.route('/class/<int:class_id>/gradebook', methods=['GET'])
+@api_login_required
+def get_gradebook(class_id):
+    """获取教学班成绩册（列式矩阵）
+
+    查询参数 format:
+        json（默认）- 列式 JSON，客户端支持 gzip 时压缩返回
+        binary - 4 字节小端长度 + JSON 头（除 scores 外的全部字段）
+                 + 小端 float32 得分数组（NaN 表示未录入）
+    """
+    if current_user.role != 'teacher':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    gradebook = build_gradebook(class_id)
+    
+    if request.args.get('format') == 'binary':
+        scores = gradebook.pop('scores')
+        header = json.dumps(gradebook, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        body = struct.pack('<I', len(header)) + header + struct.pack(
+            f'<{len(scores)}f', *(math.nan if v is None else v for v in scores)
+        )
+        response = make_response(body)
+        response.headers['Content-Type'] = 'application/octet-stream'
+    else:
+        body = json.dumps(gradebook, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        response = make_response(body)
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    
+    if len(body) >= GRADEBOOK_GZIP_MIN_SIZE and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    
+    return response
+
+
 @grades_bp.route('/item/<int:item_id>/score', methods=['POST'])
 @api_login_required
 def update_single_score(item_id):
@@ -761,13 +602,19 @@ def update_single_score(item_id):
         score_record = StudentGradeScore(
             id=generate_next_id(StudentGradeScore),
             grade_item_id=item_id,
-            student_id=student_id
+            student_id=student_id,
+            class_id=item.class_id
         )
         db.session.add(score_record)
     
     score_record.score = float(score)
     score_record.percentage = (float(score) / float(item.max_score)) * 100 if item.max_score else 0
+    score_record.graded_by = current_user.teacher_profile.teacher_id if current_user.teacher_profile else None
     score_record.graded_at = datetime.now()
+    db.session.flush()
+    
+    # 已计算过总评的班级，增量刷新该学生总评及名次变动学生的排名
+    refresh_final_grades(item.class_id, [score_record.student_id])
     
     db.session.commit()
     
@@ -790,27 +637,8 @@ def get_student_all_scores(class_id, student_id):
         if not student:
             return jsonify({'error': 'Student not found'}), 404
         
-        # ???????????????
-        categories = GradeCategory.query.filter_by(class_id=class_id).all()
-        
-        all_scores = []
-        for category in categories:
-            items = GradeItem.query.filter_by(category_id=category.id).all()
-            for item in items:
-                score_record = StudentGradeScore.query.filter_by(
-                    grade_item_id=item.id,
-                    student_id=student_id
-                ).first()
-                
-                all_scores.append({
-                    'grade_item_id': item.id,
-                    'item_name': item.name,
-                    'category_id': category.id,
-                    'category_name': category.name,
-                    'max_score': float(item.max_score) if item.max_score else 0,
-                    'weight': float(item.weight) if item.weight else 0,
-                    'score': float(score_record.score) if score_record and score_record.score is not None else None
-                })
+        # 成绩分类/成绩项/得分一次联表查询
+        all_scores = load_student_scores(class_id, student_id)
         
         return jsonify(all_scores)
     except Exception as e:
@@ -818,3 +646,32 @@ def get_student_all_scores(class_id, student_id):
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
+
+
+# 单次成绩单查询的学生/教学班数量上限
+TRANSCRIPT_MAX_IDS = 200
+
+
+@grades_bp.route('/transcript', methods=['GET'])
+@api_login_required
+def get_transcript():
+    """获取一名或多名学生跨教学班的成绩单
+
+    查询参数：student_ids=1,2,3（必填）  class_ids=10,11（可选，默认学生选修的全部教学班）
+    """
+    if current_user.role not in ['teacher', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        student_ids = [int(x) for x in request.args.get('student_ids', '').split(',') if x.strip()]
+        class_ids = [int(x) for x in request.args.get('class_ids', '').split(',') if x.strip()]
+    except ValueError:
+        return jsonify({'error': 'student_ids and class_ids must be comma-separated integers'}), 400
+    
+    if not student_ids:
+        return jsonify({'error': 'student_ids is required'}), 400
+    if len(student_ids) > TRANSCRIPT_MAX_IDS or len(class_ids) > TRANSCRIPT_MAX_IDS:
+        return jsonify({'error': f'At most {TRANSCRIPT_MAX_IDS} student_ids or class_ids per request'}), 400
+    
+    student_ids = list(dict.fromkeys(student_ids))
+    return jsonify({'students': build_transcript(student_ids, class_ids or None)})
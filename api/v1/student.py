@@ -5,6 +5,7 @@ from models import db, VStudentMyAssignments, Submission, Assignment, generate_n
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
+import dashboard_stats
 from . import api_v1
 
 
@@ -137,6 +138,7 @@ def submit_assignment():
         file_name = filename
         file_path_str = file_path
 
+    created = sub is None
     if sub:
         if content is not None:
              sub.content = content
@@ -160,5 +162,7 @@ def submit_assignment():
         db.session.add(sub)
     
     db.session.commit()
+    if created:
+        dashboard_stats.adjust_activity_count('submissions')
     
     return jsonify({'message': 'Assignment submitted successfully'})
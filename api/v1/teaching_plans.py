@@ -1,6 +1,6 @@
 from flask import Blueprint, jsonify, request
 from flask_login import current_user, login_required
-from models import db, TeachingPlan, TeachingClass, TeacherClass, PersonalTask, Student, StudentClass
+from models import db, TeachingPlan, TeachingClass, TeacherClass, PersonalTask, Student, StudentClass, generate_next_id
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import and_, or_, func
 
@@ -111,8 +111,7 @@ def create_teaching_plan():
         return jsonify({'error': 'You do not have permission to this class'}), 403
     
     try:
-        plan_id = db.session.query(db.func.max(TeachingPlan.plan_id)).scalar() or 0
-        plan_id += 1
+        plan_id = generate_next_id(TeachingPlan, 'plan_id')
         
         planned_date = datetime.fromisoformat(data['planned_date'].replace('Z', '+00:00'))
         
@@ -331,8 +330,7 @@ def create_personal_task():
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
     try:
-        task_id = db.session.query(db.func.max(PersonalTask.task_id)).scalar() or 0
-        task_id += 1
+        task_id = generate_next_id(PersonalTask, 'task_id')
         
         planned_date = datetime.fromisoformat(data['planned_date'].replace('Z', '+00:00'))
         
@@ -4,6 +4,7 @@
 from flask import Flask, redirect, url_for, request, flash, abort, send_file, make_response
 from functools import wraps
 from flask_sqlalchemy import SQLAlchemy 
+from sqlalchemy.orm import joinedload
 from flask_login import LoginManager, login_user, logout_user, current_user, login_required 
 from config import DevelopmentConfig
 import csv
@@ -198,6 +199,110 @@ def get_student_grade_display(student_id, class_id):
             'calculation_formula': None
         }
 
+def calculate_class_grades(class_id, student_ids=None):
+    """
+    批量实时计算整个教学班的成绩（不写入数据库），口径同 calculate_student_grade
+    作业/考试数量一次查询，已批改提交按学生和类型一次分组汇总
+    返回: {student_id: calculate_student_grade 的返回结构}
+    """
+    if student_ids is None:
+        student_ids = [e.student_id for e in db.session.query(StudentClass.student_id)
+                       .filter_by(class_id=class_id, status=1).all()]
+
+    # 各类型开放的作业/考试数量（未提交或未批改按0分计入平均）
+    type_counts = dict(
+        db.session.query(Assignment.type, db.func.count(Assignment.assignment_id))
+        .filter(Assignment.class_id == class_id, Assignment.status == 1)
+        .group_by(Assignment.type).all()
+    )
+    homework_count = type_counts.get('homework', 0)
+    exam_count = type_counts.get('exam', 0)
+
+    score_sums = {}
+    if homework_count or exam_count:
+        rows = db.session.query(
+            Submission.student_id,
+            Assignment.type,
+            db.func.sum(Submission.score)
+        ).join(Assignment, Assignment.assignment_id == Submission.assignment_id)\
+            .filter(
+                Assignment.class_id == class_id,
+                Assignment.status == 1,
+                Assignment.type.in_(['homework', 'exam']),
+                Submission.status == 'graded',
+                Submission.score.isnot(None)
+            ).group_by(Submission.student_id, Assignment.type).all()
+        for student_id, assignment_type, total in rows:
+            score_sums[(student_id, assignment_type)] = float(total or 0)
+
+    results = {}
+    for student_id in student_ids:
+        homework_avg = score_sums.get((student_id, 'homework'), 0.0) / homework_count if homework_count else 0.0
+        exam_avg = score_sums.get((student_id, 'exam'), 0.0) / exam_count if exam_count else 0.0
+        current_score = homework_avg * 0.3 + exam_avg * 0.5
+
+        results[student_id] = {
+            'homework_avg': round(homework_avg, 2),
+            'exam_avg': round(exam_avg, 2),
+            'current_score': round(current_score, 2),
+            'has_homework': homework_count > 0,
+            'has_exam': exam_count > 0
+        }
+
+    return results
+
+def get_class_grade_display(class_id, student_ids=None):
+    """
+    批量获取整个教学班的成绩显示，口径同 get_student_grade_display
+    已归档成绩直接返回，其余学生合并批量实时计算结果；查询次数与人数无关
+    返回: {student_id: get_student_grade_display 的返回结构}
+    """
+    if student_ids is None:
+        student_ids = [e.student_id for e in db.session.query(StudentClass.student_id)
+                       .filter_by(class_id=class_id, status=1).all()]
+
+    grades = Grade.query.options(joinedload(Grade.calculator))\
+        .filter(Grade.class_id == class_id).all()
+    grade_map = {g.student_id: g for g in grades}
+
+    pending = [sid for sid in student_ids if not (grade_map.get(sid) and grade_map[sid].is_finalized)]
+    calc_results = calculate_class_grades(class_id, pending) if pending else {}
+
+    results = {}
+    for student_id in student_ids:
+        grade = grade_map.get(student_id)
+
+        if grade and grade.is_finalized:
+            results[student_id] = {
+                'homework_avg': float(grade.homework_avg) if grade.homework_avg else 0.0,
+                'exam_avg': float(grade.exam_avg) if grade.exam_avg else 0.0,
+                'teacher_evaluation': float(grade.teacher_evaluation) if grade.teacher_evaluation else 0.0,
+                'final_grade': float(grade.final_grade) if grade.final_grade else 0.0,
+                'is_finalized': True,
+                'finalized_at': grade.finalized_at,
+                'calculated_by': grade.calculator if grade.calculated_by else None,
+                'remarks': grade.remarks,
+                'calculation_formula': grade.calculation_formula
+            }
+        else:
+            calc_result = calc_results[student_id]
+            teacher_eval = float(grade.teacher_evaluation) if (grade and grade.teacher_evaluation) else 0.0
+            final = calc_result['homework_avg'] * 0.3 + calc_result['exam_avg'] * 0.5 + teacher_eval * 0.2
+
+            results[student_id] = {
+                'homework_avg': calc_result['homework_avg'],
+                'exam_avg': calc_result['exam_avg'],
+                'teacher_evaluation': teacher_eval,
+                'final_grade': round(final, 2),
+                'is_finalized': False,
+                'finalized_at': None,
+                'calculated_by': None,
+                'remarks': grade.remarks if grade else None,
+                'calculation_formula': None
+            }
+
+    return results
+
 # ==================== Flask-Login 配置 ====================
 
 @login_manager.user_loader
@@ -262,10 +367,8 @@ if __name__ == '__main__':
                     admin_no = f'A{counter:03d}'
                 
                 # 生成新的 user_id 和 admin_id
-                max_user = db.session.query(db.func.max(Users.user_id)).scalar()
-                new_user_id = (max_user or 0) + 1
-                max_admin = db.session.query(db.func.max(Admin.admin_id)).scalar()
-                new_admin_id = (max_admin or 0) + 1
+                new_user_id = generate_next_id(Users, 'user_id')
+                new_admin_id = generate_next_id(Admin, 'admin_id')
                 
                 new_user = Users(
                     user_id=new_user_id,
@@ -300,8 +403,7 @@ if __name__ == '__main__':
             if not admin_record:
                 print("检测到admin用户缺少Admin表记录，正在修复...")
                 try:
-                    max_admin = db.session.query(db.func.max(Admin.admin_id)).scalar()
-                    new_admin_id = (max_admin or 0) + 1
+                    new_admin_id = generate_next_id(Admin, 'admin_id')
                     
                     # 查找可用的admin_no
                     admin_no = 'A001'
@@ -8,6 +8,7 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
 MATERIALS_FOLDER = os.path.join(UPLOAD_FOLDER, 'materials')
 ASSIGNMENTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'assignments')
+IMPORT_FOLDER = os.path.join(UPLOAD_FOLDER, 'imports')
 
 # ==================== 数据库连接参数 ====================
 # 提示：如果连接失败，可尝试以下驱动：
@@ -26,6 +27,7 @@ class Config:
     UPLOAD_FOLDER = UPLOAD_FOLDER
     MATERIALS_FOLDER = MATERIALS_FOLDER
     ASSIGNMENTS_FOLDER = ASSIGNMENTS_FOLDER
+    IMPORT_FOLDER = IMPORT_FOLDER  # 待导入的CSV文件（导入任务完成后删除）
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB
     ALLOWED_EXTENSIONS = {
         'pdf', 'doc', 'docx', 'ppt', 'pptx', 'txt', 'zip', 'rar',
@@ -44,6 +46,12 @@ class Config:
         f'Trusted_Connection=yes;'
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # 后台任务进程池大小
+    BACKGROUND_JOB_WORKERS = int(os.environ.get('BACKGROUND_JOB_WORKERS') or 4)
+    
+    # 批量导入用户时计算密码哈希的进程数
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 4)
 
 
 class DevelopmentConfig(Config):
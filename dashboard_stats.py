@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+仪表盘统计快照 - 在进程内保存管理员仪表盘所需的全部统计数据
+
+快照由后台线程按固定周期整体刷新；作业、提交、考勤、用户等写操作提交后就地增量调整
+对应计数，公告、批量导入、级联删除等不便增量维护的变更则把快照标记为过期，
+下次读取时重建。仪表盘读取直接返回快照，不查询数据库。
+其他进程的写入由周期刷新兜底。
+"""
+
+import copy
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+from models import (
+    db, Assignment, Submission, Attendance, Announcement,
+    VAdminUserStatistics, VAdminCourseStatistics
+)
+
+# 快照定时刷新周期（秒）
+DASHBOARD_REFRESH_INTERVAL = 300
+
+# 角色 -> 用户统计中的字段
+ROLE_KEYS = {'admin': 'admins', 'teacher': 'teachers', 'student': 'students'}
+
+_snapshot = None
+_stale = False
+_lock = threading.Lock()
+_refresher = None
+
+
+# ==================== 快照构建 ====================
+
+def build_dashboard_stats():
+    """从数据库构建仪表盘统计（两个统计视图 + 一次计数查询 + 一次公告查询）"""
+    user_stats = VAdminUserStatistics.query.all()
+    admin_count = sum(s.total_admin_count or 0 for s in user_stats)
+    teacher_count = sum(s.total_teacher_count or 0 for s in user_stats)
+    student_count = sum(s.total_student_count or 0 for s in user_stats)
+
+    course_stats = VAdminCourseStatistics.query.all()
+    total_teaching_classes = sum(getattr(s, 'current_year_classes', 0) or getattr(s, 'total_class_count', 0) or 0 for s in course_stats)
+
+    # 三个计数合并为一次查询
+    counts = db.session.execute(select(
+        select(func.count()).select_from(Assignment).scalar_subquery(),
+        select(func.count()).select_from(Submission).scalar_subquery(),
+        select(func.count()).select_from(Attendance).scalar_subquery()
+    )).one()
+
+    latest_announcements = Announcement.query.options(joinedload(Announcement.author))\
+        .filter_by(scope_type='global')\
+        .order_by(Announcement.created_at.desc()).limit(5).all()
+
+    return {
+        'users': {
+            'admins': admin_count,
+            'teachers': teacher_count,
+            'students': student_count,
+            'total': admin_count + teacher_count + student_count
+        },
+        'courses': {
+            'courses': len(course_stats),
+            'teaching_classes': total_teaching_classes
+        },
+        'activities': {
+            'assignments': counts[0],
+            'submissions': counts[1],
+            'attendance_sessions': counts[2]
+        },
+        'announcements': [{
+            'id': a.id,
+            'title': a.title,
+            'content': a.content,
+            'created_at': a.created_at.isoformat() if a.created_at else None,
+            'author': {
+                'id': a.author.user_id,
+                'name': a.author.real_name
+            } if a.author else {'id': None, 'name': '系统'}
+        } for a in latest_announcements],
+        'user_stats_by_dept': [{
+            'dept_id': s.dept_id,
+            'dept_name': s.dept_name or '未分配院系',
+            'admins': s.total_admin_count,
+            'teachers': s.total_teacher_count,
+            'students': s.total_student_count
+        } for s in user_stats]
+    }
+
+
+def refresh_dashboard_snapshot():
+    """重建快照"""
+    global _snapshot, _stale
+    data = build_dashboard_stats()
+    with _lock:
+        _snapshot = {
+            'data': data,
+            'refreshed_at': datetime.now(),
+            'refreshed_ts': time.time(),
+            'incremental_updates': 0
+        }
+        _stale = False
+    return _snapshot
+
+
+def _refresh_loop(app):
+    """后台线程：按周期刷新快照"""
+    while True:
+        time.sleep(DASHBOARD_REFRESH_INTERVAL)
+        with app.app_context():
+            try:
+                refresh_dashboard_snapshot()
+            except Exception as e:
+                app.logger.error(f"Failed to refresh dashboard snapshot: {e}")
+            finally:
+                db.session.remove()
+
+
+def _ensure_refresher(app):
+    global _refresher
+    with _lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_loop, args=(app,), daemon=True)
+            _refresher.start()
+
+
+# ==================== 读取 ====================
+
+def get_dashboard_stats(app):
+    """读取仪表盘统计快照（附带快照新鲜度信息）
+
+    快照不存在、被标记过期或超过刷新周期（后台线程未及时刷新）时同步重建。
+    """
+    _ensure_refresher(app)
+
+    with _lock:
+        snapshot = _snapshot
+        stale = _stale
+    if snapshot is None or stale or time.time() - snapshot['refreshed_ts'] > DASHBOARD_REFRESH_INTERVAL * 2:
+        snapshot = refresh_dashboard_snapshot()
+
+    with _lock:
+        result = copy.deepcopy(snapshot['data'])
+        age = time.time() - snapshot['refreshed_ts']
+        result['snapshot'] = {
+            'refreshed_at': snapshot['refreshed_at'].isoformat(),
+            'age_seconds': round(age, 1),
+            'incremental_updates': snapshot['incremental_updates'],
+            'refresh_interval': DASHBOARD_REFRESH_INTERVAL
+        }
+    return result
+
+
+# ==================== 增量维护 ====================
+
+def adjust_activity_count(key, delta=1):
+    """作业/提交/考勤数量变化后调整计数（key 为 assignments、submissions、attendance_sessions）"""
+    with _lock:
+        if _snapshot is None:
+            return
+        _snapshot['data']['activities'][key] += delta
+        _snapshot['incremental_updates'] += 1
+
+
+def adjust_user_count(role, dept_id, delta=1):
+    """用户增删后调整角色总数与院系分布"""
+    global _stale
+    key = ROLE_KEYS.get(role)
+    with _lock:
+        if _snapshot is None or key is None:
+            return
+        data = _snapshot['data']
+        dept = next((d for d in data['user_stats_by_dept'] if d['dept_id'] == dept_id), None)
+        if dept is None:
+            # 新院系或未分配院系的用户，分布需要重建
+            _stale = True
+            return
+        dept[key] = (dept[key] or 0) + delta
+        data['users'][key] += delta
+        data['users']['total'] += delta
+        _snapshot['incremental_updates'] += 1
+
+
+def mark_dashboard_stale():
+    """标记快照过期（公告、课程、批量导入、级联删除等变更后调用）"""
+    global _stale
+    with _lock:
+        _stale = True
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+文件清理模块 - 在后台线程中删除已不再被引用的上传文件
+
+删除数据库记录的请求只需在事务提交后把文件路径放入队列即可返回，
+磁盘删除由后台线程逐个完成；文件不存在或删除失败只记录日志，不影响请求。
+"""
+
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _clean_loop():
+    """后台线程：逐个删除队列中的文件"""
+    while True:
+        path = _queue.get()
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to remove file {path}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_clean_loop, daemon=True)
+            _worker.start()
+
+
+def queue_file_removal(paths):
+    """把待删除的文件路径放入清理队列（应在数据库事务提交后调用）
+
+    Returns:
+        入队的文件数
+    """
+    paths = [p for p in paths if p]
+    if not paths:
+        return 0
+
+    _ensure_worker()
+    for path in paths:
+        _queue.put(path)
+    return len(paths)
+
+
+def wait_until_clean():
+    """阻塞直到队列中的文件都已处理（用于脚本退出前）"""
+    _queue.join()
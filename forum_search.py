@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+论坛全文检索 - 基于数据库倒排索引表 ForumSearchTerm 的班级内帖子/回复搜索
+
+分词：先做 NFKC 规范化并转小写（全角/半角、片假名/平假名视为同一字符，与数据库默认排序规则一致）；
+连续的中日韩汉字切成二元组，并为每个汉字建立一元组，使单字查询也能命中词中的字；
+其余字母数字按词切分。查询时只对单字使用一元组，多字仍按二元组匹配。
+帖子标题与正文、回复正文分别作为文档写入索引，标题词项按 TITLE_WEIGHT 加权。
+索引随帖子/回复的增删改在同一事务中更新，不需要进程内状态，多进程部署下也保持一致。
+
+查询：查询词切分后要求文档包含全部词项（AND），按 词频权重 x idf 求和排序；
+每个词项都走 (class_id, term) 主键范围查找，不扫描帖子正文。
+结果只加载当前页的文档生成摘要片段，并给出命中位置供前端高亮。
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from sqlalchemy import case, func
+from models import db, ForumPost, ForumComment, ForumSearchTerm, Users
+
+# 标题词项权重（正文为 1）
+TITLE_WEIGHT = 3
+
+# 单个词项最大长度（与 ForumSearchTerm.term 列宽一致）
+MAX_TERM_LENGTH = 50
+
+# 一次查询最多使用的词项数
+MAX_QUERY_TERMS = 16
+
+# 摘要片段长度
+SNIPPET_LENGTH = 80
+
+# 搜索结果每页条数（默认/上限）
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+
+# 重建索引时每批处理的帖子数
+REBUILD_BATCH_SIZE = 500
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'([{_CJK}]+)|([^\\W_{_CJK}]+)')
+
+
+def _fold(chars):
+    """一个字符（连同其后的组合附加符号）的规范形式：NFKC + 小写 + 片假名转平假名"""
+    folded = unicodedata.normalize('NFKC', chars).lower()
+    return ''.join(chr(ord(c) - 0x60) if '\u30a1' <= c <= '\u30f6' else c for c in folded)
+
+
+def normalize(text):
+    """规范化文本，返回 (规范化后的文本, 各字符对应的原文区间 [(起, 止), ...])
+
+    按 基字符+组合附加符号 逐段规范化，以便把规范化文本中的命中位置映射回原文。
+    """
+    text = text or ''
+    chars = []
+    origins = []
+    start = 0
+    for i in range(1, len(text) + 1):
+        if i < len(text) and unicodedata.combining(text[i]):
+            continue
+        folded = _fold(text[start:i])
+        chars.append(folded)
+        origins += [(start, i)] * len(folded)
+        start = i
+    return ''.join(chars), origins
+
+
+def tokenize(text, query=False):
+    """切分文本，返回 {词项: 出现次数}
+
+    query 为真时按查询切分：连续多个汉字只取二元组，不再逐字展开。
+    """
+    counts = Counter()
+    for cjk, word in _TOKEN_RE.findall(normalize(text)[0]):
+        if cjk:
+            if len(cjk) == 1 or not query:
+                counts.update(cjk)
+            for i in range(len(cjk) - 1):
+                counts[cjk[i:i + 2]] += 1
+        else:
+            counts[word[:MAX_TERM_LENGTH]] += 1
+    return counts
+
+
+def _term_rows(class_id, doc_type, doc_id, post_id, fields):
+    """fields: [(文本, 权重), ...] -> 倒排索引行"""
+    weights = Counter()
+    for text, weight in fields:
+        for term, count in tokenize(text).items():
+            weights[term] += count * weight
+    return [
+        {'class_id': class_id, 'term': term, 'doc_type': doc_type,
+         'doc_id': doc_id, 'post_id': post_id, 'weight': weight}
+        for term, weight in weights.items()
+    ]
+
+
+def _insert(rows):
+    if rows:
+        db.session.execute(ForumSearchTerm.__table__.insert(), rows)
+
+
+def _post_rows(post):
+    return _term_rows(post.class_id, 'post', post.id, post.id,
+                      [(post.title, TITLE_WEIGHT), (post.content, 1)])
+
+
+def _comment_rows(comment, class_id):
+    return _term_rows(class_id, 'comment', comment.id, comment.post_id, [(comment.content, 1)])
+
+
+# ==================== 索引维护（调用方负责提交事务） ====================
+
+def index_post(post):
+    """新建或修改帖子后（重新）索引帖子标题与正文"""
+    ForumSearchTerm.query.filter_by(post_id=post.id, doc_type='post', doc_id=post.id)\
+        .delete(synchronize_session=False)
+    _insert(_post_rows(post))
+
+
+def index_comment(comment, class_id=None):
+    """新建或修改回复后（重新）索引回复正文"""
+    if class_id is None:
+        class_id = db.session.query(ForumPost.class_id).filter(ForumPost.id == comment.post_id).scalar()
+    ForumSearchTerm.query.filter_by(post_id=comment.post_id, doc_type='comment', doc_id=comment.id)\
+        .delete(synchronize_session=False)
+    _insert(_comment_rows(comment, class_id))
+
+
+def remove_post(post_id):
+    """删除帖子及其全部回复的索引"""
+    ForumSearchTerm.query.filter_by(post_id=post_id).delete(synchronize_session=False)
+
+
+def remove_comment(comment_id, post_id):
+    """删除单条回复的索引"""
+    ForumSearchTerm.query.filter_by(post_id=post_id, doc_type='comment', doc_id=comment_id)\
+        .delete(synchronize_session=False)
+
+
+def rebuild_forum_search_index(class_id=None, batch_size=REBUILD_BATCH_SIZE):
+    """从帖子/回复表整体重建索引（迁移或修复时使用），按帖子ID分批提交
+
+    Returns:
+        已索引的帖子数
+    """
+    clear = ForumSearchTerm.query
+    if class_id is not None:
+        clear = clear.filter_by(class_id=class_id)
+    clear.delete(synchronize_session=False)
+    db.session.commit()
+
+    indexed = 0
+    last_id = None
+    while True:
+        query = ForumPost.query
+        if class_id is not None:
+            query = query.filter(ForumPost.class_id == class_id)
+        if last_id is not None:
+            query = query.filter(ForumPost.id > last_id)
+        posts = query.order_by(ForumPost.id).limit(batch_size).all()
+        if not posts:
+            break
+
+        class_of = {p.id: p.class_id for p in posts}
+        rows = []
+        for post in posts:
+            rows += _post_rows(post)
+        for comment in ForumComment.query.filter(ForumComment.post_id.in_(list(class_of))):
+            rows += _comment_rows(comment, class_of[comment.post_id])
+        _insert(rows)
+        db.session.commit()
+
+        indexed += len(posts)
+        last_id = posts[-1].id
+        db.session.expunge_all()
+    return indexed
+
+
+# ==================== 查询 ====================
+
+def _highlights(text, terms):
+    """返回 text 中各词项出现位置合并后的 [[起, 止), ...]（原文中的位置）"""
+    folded, origins = normalize(text)
+    spans = []
+    for term in terms:
+        pos = folded.find(term)
+        while pos >= 0:
+            spans.append([origins[pos][0], origins[pos + len(term) - 1][1]])
+            pos = folded.find(term, pos + 1)
+    spans.sort()
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def make_snippet(text, terms, length=SNIPPET_LENGTH):
+    """截取首个命中位置附近的片段
+
+    Returns:
+        (片段, 片段内的命中位置列表)
+    """
+    text = ' '.join((text or '').split())
+    hits = _highlights(text, terms)
+    start = max(hits[0][0] - length // 4, 0) if hits else 0
+    end = min(start + length, len(text))
+    start = max(end - length, 0)
+
+    snippet = text[start:end]
+    offset = -start
+    if start > 0:
+        snippet = '…' + snippet
+        offset += 1
+    if end < len(text):
+        snippet += '…'
+    spans = [[max(s, start) + offset, min(e, end) + offset] for s, e in hits if e > start and s < end]
+    return snippet, spans
+
+
+def search_forum(class_id, query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """在班级讨论区中搜索帖子和回复
+
+    Returns:
+        {'results': [...], 'terms': [...], 'page', 'per_page', 'has_more'}
+    """
+    terms = sorted(tokenize(query, query=True))[:MAX_QUERY_TERMS]
+    response = {'results': [], 'terms': terms, 'page': page, 'per_page': per_page, 'has_more': False}
+    if not terms:
+        return response
+
+    # 各词项的文档频率；任一词项不存在则不可能全部命中
+    doc_freq = dict(db.session.query(ForumSearchTerm.term, func.count())
+                    .filter(ForumSearchTerm.class_id == class_id, ForumSearchTerm.term.in_(terms))
+                    .group_by(ForumSearchTerm.term).all())
+    if len(doc_freq) < len(terms):
+        return response
+
+    total_docs = max(db.session.query(func.count(ForumPost.id)).filter(ForumPost.class_id == class_id).scalar() or 0,
+                     max(doc_freq.values()))
+    idf = {term: math.log(1 + total_docs / df) for term, df in doc_freq.items()}
+
+    score = func.sum(ForumSearchTerm.weight * case(idf, value=ForumSearchTerm.term, else_=0)).label('score')
+    hits = db.session.query(
+        ForumSearchTerm.doc_type, ForumSearchTerm.doc_id, ForumSearchTerm.post_id, score
+    ).filter(
+        ForumSearchTerm.class_id == class_id,
+        ForumSearchTerm.term.in_(terms)
+    ).group_by(
+        ForumSearchTerm.doc_type, ForumSearchTerm.doc_id, ForumSearchTerm.post_id
+    ).having(func.count() == len(terms))\
+     .order_by(score.desc(), ForumSearchTerm.doc_id.desc())\
+     .offset((page - 1) * per_page).limit(per_page + 1).all()
+
+    if len(hits) > per_page:
+        hits = hits[:per_page]
+        response['has_more'] = True
+    if not hits:
+        return response
+
+    # 只加载当前页涉及的帖子与回复
+    posts = {p.id: p for p in db.session.query(
+        ForumPost.id, ForumPost.title, ForumPost.content, ForumPost.created_at,
+        ForumPost.author_id, Users.real_name.label('author_name')
+    ).join(Users, Users.user_id == ForumPost.author_id)
+     .filter(ForumPost.id.in_({h.post_id for h in hits}))}
+    comment_ids = [h.doc_id for h in hits if h.doc_type == 'comment']
+    comments = {c.id: c for c in db.session.query(
+        ForumComment.id, ForumComment.content, ForumComment.created_at,
+        ForumComment.author_id, Users.real_name.label('author_name')
+    ).join(Users, Users.user_id == ForumComment.author_id)
+     .filter(ForumComment.id.in_(comment_ids))} if comment_ids else {}
+
+    for hit in hits:
+        post = posts.get(hit.post_id)
+        doc = post if hit.doc_type == 'post' else comments.get(hit.doc_id)
+        if post is None or doc is None:
+            continue
+        snippet, highlights = make_snippet(doc.content, terms)
+        response['results'].append({
+            'type': hit.doc_type,
+            'post_id': hit.post_id,
+            'comment_id': hit.doc_id if hit.doc_type == 'comment' else None,
+            'title': post.title,
+            'title_highlights': _highlights(post.title, terms),
+            'snippet': snippet,
+            'highlights': highlights,
+            'author_id': doc.author_id,
+            'author_name': doc.author_name,
+            'created_at': doc.created_at.isoformat() if doc.created_at else None,
+            'score': round(float(hit.score), 4)
+        })
+    return response
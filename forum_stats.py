@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+论坛计数器 - 按班级（ForumClassStats）和按用户（ForumAuthorStats）维护的帖子/回复/隐藏/锁定/待审核计数
+
+每次论坛写操作在同一事务中用 UPDATE ... SET x = x + n 原子地调整计数，并更新最近活动时间；
+计数行不存在时在保存点中插入，与并发插入冲突时退回到 UPDATE。
+统计与排行榜因此只需读取计数器表，不再对帖子、回复全表计数或连接分组。
+集合式的大批量删除（如批量删除用户）改为对受影响的班级/用户按原表重新计算。
+"""
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from models import db, ForumPost, ForumComment, ForumPostStatus, ForumClassStats, ForumAuthorStats
+
+# 帖子状态字段 -> 计数字段
+STATUS_FIELDS = (('is_hidden', 'hidden_count'), ('is_locked', 'locked_count'), ('is_flagged', 'flagged_count'))
+
+# 重新计算时每批的班级/用户ID个数（SQL Server 单条语句最多 2100 个参数）
+RECOMPUTE_CHUNK_SIZE = 1000
+
+
+def _bump(model, key_name, key, deltas, touch=False):
+    """调整一行计数器（不提交）；touch 为真时把最近活动时间更新为当前时间"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas and not touch:
+        return
+
+    key_col = getattr(model, key_name)
+    values = {field: getattr(model, field) + delta for field, delta in deltas.items()}
+    if touch:
+        values['last_activity_at'] = func.now()
+    if model.query.filter(key_col == key).update(values, synchronize_session=False):
+        return
+
+    row = model(**{key_name: key}, **{field: max(delta, 0) for field, delta in deltas.items()})
+    if touch:
+        row.last_activity_at = func.now()
+    try:
+        with db.session.begin_nested():
+            db.session.add(row)
+    except IntegrityError:
+        # 并发事务已插入该行
+        model.query.filter(key_col == key).update(values, synchronize_session=False)
+
+
+def _bump_both(class_id, author_id, deltas, touch=False):
+    _bump(ForumClassStats, 'class_id', class_id, deltas, touch)
+    _bump(ForumAuthorStats, 'user_id', author_id, deltas, touch)
+
+
+def status_flags(status):
+    """帖子状态记录 -> (是否隐藏, 是否锁定, 是否待审核)；无记录时全为 False"""
+    return tuple(bool(status is not None and getattr(status, attr)) for attr, _ in STATUS_FIELDS)
+
+
+def _status_deltas(before, after):
+    return {field: int(a) - int(b) for b, a, (_, field) in zip(before, after, STATUS_FIELDS)}
+
+
+# ==================== 增量维护（调用方负责提交事务） ====================
+
+def post_created(post):
+    _bump_both(post.class_id, post.author_id, {'post_count': 1}, touch=True)
+
+
+def comment_created(comment, class_id):
+    _bump_both(class_id, comment.author_id, {'comment_count': 1}, touch=True)
+
+
+def comment_deleted(comment, class_id):
+    _bump_both(class_id, comment.author_id, {'comment_count': -1})
+
+
+def post_deleted(post):
+    """须在删除帖子之前调用：帖子下的回复和状态随帖子一起删除"""
+    flags = status_flags(ForumPostStatus.query.filter_by(post_id=post.id).first())
+    status_deltas = _status_deltas(flags, (False,) * len(STATUS_FIELDS))
+    by_author = db.session.query(ForumComment.author_id, func.count(ForumComment.id))\
+        .filter(ForumComment.post_id == post.id)\
+        .group_by(ForumComment.author_id).all()
+
+    _bump(ForumClassStats, 'class_id', post.class_id, {
+        'post_count': -1,
+        'comment_count': -sum(count for _, count in by_author),
+        **status_deltas
+    })
+    _bump(ForumAuthorStats, 'user_id', post.author_id, {'post_count': -1, **status_deltas})
+    for author_id, count in by_author:
+        _bump(ForumAuthorStats, 'user_id', author_id, {'comment_count': -count})
+
+
+def post_status_changed(post, before, status):
+    """帖子隐藏/锁定/审核标记变化后调用，before 为修改前的 status_flags()"""
+    deltas = _status_deltas(before, status_flags(status))
+    _bump_both(post.class_id, post.author_id, deltas)
+
+
+# ==================== 按原表重新计算 ====================
+
+def _status_sums():
+    return [func.sum(case((getattr(ForumPostStatus, attr) == True, 1), else_=0)) for attr, _ in STATUS_FIELDS]
+
+
+def _merge(posts, comments, statuses):
+    """合并 帖子数/回复数/状态计数 三个分组查询的结果"""
+    stats = {}
+
+    def entry(key):
+        return stats.setdefault(key, {
+            'post_count': 0, 'comment_count': 0, 'hidden_count': 0,
+            'locked_count': 0, 'flagged_count': 0, 'last_activity_at': None
+        })
+
+    for key, count, last in posts:
+        e = entry(key)
+        e['post_count'] = count
+        e['last_activity_at'] = last
+    for key, count, last in comments:
+        e = entry(key)
+        e['comment_count'] = count
+        if last is not None and (e['last_activity_at'] is None or last > e['last_activity_at']):
+            e['last_activity_at'] = last
+    for key, *sums in statuses:
+        e = entry(key)
+        for (_, field), value in zip(STATUS_FIELDS, sums):
+            e[field] = int(value or 0)
+    return stats
+
+
+def _scoped(query, column, ids):
+    return query if ids is None else query.filter(column.in_(ids))
+
+
+def _class_stats(class_ids):
+    posts = _scoped(db.session.query(
+        ForumPost.class_id, func.count(ForumPost.id), func.max(ForumPost.created_at)
+    ), ForumPost.class_id, class_ids).group_by(ForumPost.class_id)
+    comments = _scoped(db.session.query(
+        ForumPost.class_id, func.count(ForumComment.id), func.max(ForumComment.created_at)
+    ).join(ForumComment, ForumComment.post_id == ForumPost.id), ForumPost.class_id, class_ids)\
+        .group_by(ForumPost.class_id)
+    statuses = _scoped(db.session.query(ForumPost.class_id, *_status_sums())
+                       .join(ForumPostStatus, ForumPostStatus.post_id == ForumPost.id), ForumPost.class_id, class_ids)\
+        .group_by(ForumPost.class_id)
+    return _merge(posts, comments, statuses)
+
+
+def _author_stats(user_ids):
+    posts = _scoped(db.session.query(
+        ForumPost.author_id, func.count(ForumPost.id), func.max(ForumPost.created_at)
+    ), ForumPost.author_id, user_ids).group_by(ForumPost.author_id)
+    comments = _scoped(db.session.query(
+        ForumComment.author_id, func.count(ForumComment.id), func.max(ForumComment.created_at)
+    ), ForumComment.author_id, user_ids).group_by(ForumComment.author_id)
+    statuses = _scoped(db.session.query(ForumPost.author_id, *_status_sums())
+                       .join(ForumPostStatus, ForumPostStatus.post_id == ForumPost.id), ForumPost.author_id, user_ids)\
+        .group_by(ForumPost.author_id)
+    return _merge(posts, comments, statuses)
+
+
+def _recompute(model, key_name, collect, ids):
+    key_col = getattr(model, key_name)
+    if ids is None:
+        chunks = [None]
+    else:
+        ids = list(dict.fromkeys(ids))
+        chunks = [ids[i:i + RECOMPUTE_CHUNK_SIZE] for i in range(0, len(ids), RECOMPUTE_CHUNK_SIZE)]
+    for chunk in chunks:
+        stats = collect(chunk)
+        _scoped(model.query, key_col, chunk).delete(synchronize_session=False)
+        if stats:
+            db.session.execute(model.__table__.insert(), [{key_name: key, **values} for key, values in stats.items()])
+
+
+def recompute_class_stats(class_ids=None):
+    """按帖子/回复表重新计算班级计数器（不提交）；class_ids 为 None 时全量重建"""
+    _recompute(ForumClassStats, 'class_id', _class_stats, class_ids)
+
+
+def recompute_author_stats(user_ids=None):
+    """按帖子/回复表重新计算用户计数器（不提交）；user_ids 为 None 时全量重建"""
+    _recompute(ForumAuthorStats, 'user_id', _author_stats, user_ids)
@@ -0,0 +1,738 @@
+# -*- coding: utf-8 -*-
+"""
+成绩计算引擎 - 以教学班为单位批量加载成绩结构和得分，集合化计算总评与排名
+"""
+
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import and_, case, func
+from models import (
+    db, GradeCategory, GradeItem, StudentGradeScore, StudentFinalGrade,
+    StudentClass, Student, Users, TeachingClass, Course,
+    Attendance, AttendanceRecord, allocate_ids
+)
+from grade_statistics import invalidate_class_statistics
+
+# 迟到按出勤的 80% 计分
+LATE_ATTENDANCE_FACTOR = 0.8
+
+# 一次变更涉及的学生数超过该值时，增量维护退化为整班重算
+INCREMENTAL_MAX_STUDENTS = 100
+
+# 成绩结构缓存容量（教学班数）与有效期（秒）；本进程内的结构变更会主动失效，其他进程靠过期兜底
+STRUCTURE_CACHE_SIZE = 512
+STRUCTURE_CACHE_TTL = 300
+
+_structure_cache = OrderedDict()
+_structure_generation = {}
+_structure_lock = threading.Lock()
+
+
+# ==================== 数据加载 ====================
+
+def load_grade_structure(class_id):
+    """一次性加载教学班的成绩分类/成绩项树（两次查询）
+
+    Returns:
+        分类列表，按 order 排序；每个分类为 dict，items 为该分类下的成绩项 dict 列表。
+        返回纯数据而非 ORM 对象，便于跨请求复用。
+    """
+    categories = GradeCategory.query.filter_by(class_id=class_id)\
+        .order_by(GradeCategory.order, GradeCategory.id).all()
+    items = GradeItem.query.filter_by(class_id=class_id).order_by(GradeItem.id).all()
+
+    structure = []
+    by_id = {}
+    for cat in categories:
+        node = {
+            'id': cat.id,
+            'name': cat.name,
+            'weight': float(cat.weight) if cat.weight is not None else None,
+            'description': cat.description,
+            'order': cat.order,
+            'items': []
+        }
+        structure.append(node)
+        by_id[cat.id] = node
+
+    for item in items:
+        node = by_id.get(item.category_id)
+        if node is None:
+            continue
+        node['items'].append({
+            'id': item.id,
+            'category_id': item.category_id,
+            'name': item.name,
+            'type': item.item_type,
+            'weight': float(item.weight) if item.weight is not None else None,
+            'max_score': float(item.max_score) if item.max_score is not None else None,
+            'related_assignment_id': item.related_assignment_id,
+            'auto_calculate': item.auto_calculate,
+            'is_published': item.is_published
+        })
+
+    return structure
+
+
+def get_enrolled_student_ids(class_id):
+    """获取教学班在读学生ID列表"""
+    rows = db.session.query(StudentClass.student_id).filter_by(class_id=class_id, status=1).all()
+    return [r.student_id for r in rows]
+
+
+def load_roster(class_id):
+    """一次联表查询获取教学班在读学生名单（按学号排序）
+
+    Returns:
+        [(student_id, student_no, real_name), ...]
+    """
+    rows = db.session.query(Student.student_id, Student.student_no, Users.real_name)\
+        .join(StudentClass, StudentClass.student_id == Student.student_id)\
+        .join(Users, Users.user_id == Student.user_id)\
+        .filter(StudentClass.class_id == class_id, StudentClass.status == 1)\
+        .order_by(Student.student_no).all()
+    return [(r.student_id, r.student_no.strip() if r.student_no else r.student_no, r.real_name) for r in rows]
+
+
+def load_score_matrix(class_id, structure, student_ids, value='percentage', only_students=False):
+    """一次查询加载学生×成绩项得分矩阵
+
+    Args:
+        class_id: 教学班ID
+        structure: load_grade_structure 的返回值
+        student_ids: 矩阵行对应的学生ID列表
+        value: 取 'percentage'（得分率）或 'score'（原始分）
+        only_students: 为 True 时仅查询 student_ids 中学生的得分（用于少量学生的增量计算）
+
+    Returns:
+        {'student_index': {student_id: 行号}, 'item_index': {item_id: 列号},
+         'item_ids': [...], 'rows': [[float 或 None, ...], ...]}
+    """
+    item_ids = [item['id'] for cat in structure for item in cat['items']]
+    student_index = {sid: i for i, sid in enumerate(student_ids)}
+    item_index = {iid: j for j, iid in enumerate(item_ids)}
+    rows = [[None] * len(item_ids) for _ in student_ids]
+
+    if item_ids and student_ids:
+        column = getattr(StudentGradeScore, value)
+        records = db.session.query(
+            StudentGradeScore.student_id,
+            StudentGradeScore.grade_item_id,
+            column
+        ).join(GradeItem, GradeItem.id == StudentGradeScore.grade_item_id)\
+            .filter(GradeItem.class_id == class_id)
+        if only_students:
+            records = records.filter(StudentGradeScore.student_id.in_(student_ids))
+
+        for student_id, item_id, cell in records.all():
+            i = student_index.get(student_id)
+            j = item_index.get(item_id)
+            if i is None or j is None or cell is None:
+                continue
+            rows[i][j] = float(cell)
+
+    return {
+        'student_index': student_index,
+        'item_index': item_index,
+        'item_ids': item_ids,
+        'rows': rows
+    }
+
+
+def count_attendance_by_student(class_id):
+    """一次分组查询统计教学班每名学生的出勤/迟到/请假次数
+
+    Returns:
+        {student_id: {'present': n, 'late': n, 'leave': n}}
+    """
+    def status_count(status):
+        return func.sum(case((AttendanceRecord.status == status, 1), else_=0))
+
+    rows = db.session.query(
+        AttendanceRecord.student_id,
+        status_count('present').label('present'),
+        status_count('late').label('late'),
+        status_count('leave').label('leave')
+    ).join(Attendance, Attendance.id == AttendanceRecord.attendance_id)\
+        .filter(Attendance.class_id == class_id)\
+        .group_by(AttendanceRecord.student_id).all()
+
+    return {
+        r.student_id: {'present': r.present or 0, 'late': r.late or 0, 'leave': r.leave or 0}
+        for r in rows
+    }
+
+
+# ==================== 成绩结构缓存 ====================
+
+def get_grade_structure(class_id):
+    """获取教学班成绩结构（按教学班 LRU 缓存，命中时不查询数据库）
+
+    返回值在多个请求间共享，调用方只读不改。
+    """
+    with _structure_lock:
+        entry = _structure_cache.get(class_id)
+        if entry and time.time() - entry[0] < STRUCTURE_CACHE_TTL:
+            _structure_cache.move_to_end(class_id)
+            return entry[1]
+        generation = _structure_generation.get(class_id, 0)
+
+    structure = load_grade_structure(class_id)
+    with _structure_lock:
+        # 加载期间结构被修改过则不写入缓存，避免缓存旧数据
+        if _structure_generation.get(class_id, 0) != generation:
+            return structure
+        _structure_cache[class_id] = (time.time(), structure)
+        _structure_cache.move_to_end(class_id)
+        while len(_structure_cache) > STRUCTURE_CACHE_SIZE:
+            _structure_cache.popitem(last=False)
+    return structure
+
+
+def invalidate_grade_structure(class_id):
+    """使教学班的成绩结构缓存失效（成绩分类/成绩项增删改时调用）"""
+    with _structure_lock:
+        _structure_cache.pop(class_id, None)
+        _structure_generation[class_id] = _structure_generation.get(class_id, 0) + 1
+
+
+# ==================== 成绩写入 ====================
+
+def save_item_scores(item, rows, teacher_id=None):
+    """批量写入某成绩项的学生得分（一次查询已有记录 + 批量插入/更新）
+
+    Args:
+        item: GradeItem 对象
+        rows: [{'student_id': ..., 'score': ..., 'percentage': ...}, ...]
+        teacher_id: 评分教师ID
+
+    Returns:
+        (更新条数, 插入条数)
+    """
+    existing = dict(
+        db.session.query(StudentGradeScore.student_id, StudentGradeScore.id)
+        .filter_by(grade_item_id=item.id).all()
+    )
+    now = datetime.now()
+
+    updates = []
+    inserts = []
+    for row in rows:
+        values = {
+            'score': row['score'],
+            'percentage': row['percentage'],
+            'graded_by': teacher_id,
+            'graded_at': now
+        }
+        score_id = existing.get(row['student_id'])
+        if score_id is not None:
+            values['id'] = score_id
+            updates.append(values)
+        else:
+            values.update(grade_item_id=item.id, student_id=row['student_id'], class_id=item.class_id)
+            inserts.append(values)
+
+    if updates:
+        db.session.bulk_update_mappings(StudentGradeScore, updates)
+    if inserts:
+        for new_id, values in zip(allocate_ids(StudentGradeScore, len(inserts)), inserts):
+            values['id'] = new_id
+        db.session.bulk_insert_mappings(StudentGradeScore, inserts)
+
+    if updates or inserts:
+        invalidate_class_statistics(item.class_id)
+    return len(updates), len(inserts)
+
+
+def validate_item_scores(item, payload):
+    """校验批量录入的成绩数据
+
+    空分数的行直接跳过；学生不在该教学班、分数非数字或超出 [0, 满分]、
+    同一学生重复出现的行记入错误列表，不影响其他行写入。
+
+    Returns:
+        (rows, errors)，rows 可直接传给 save_item_scores，
+        errors 为 [{'index': 行号, 'student_id': ..., 'error': 原因}, ...]
+    """
+    enrolled = set(get_enrolled_student_ids(item.class_id))
+    max_score = float(item.max_score) if item.max_score else None
+
+    rows = []
+    errors = []
+    seen = set()
+    for index, score_data in enumerate(payload):
+        if not isinstance(score_data, dict):
+            errors.append({'index': index, 'student_id': None, 'error': 'Invalid row'})
+            continue
+
+        student_id = score_data.get('student_id')
+        score_value = score_data.get('score')
+        if score_value is None or score_value == '':
+            continue
+
+        try:
+            student_id = int(student_id)
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'student_id': student_id, 'error': 'Invalid student_id'})
+            continue
+        if student_id not in enrolled:
+            errors.append({'index': index, 'student_id': student_id, 'error': 'Student not enrolled in this class'})
+            continue
+        if student_id in seen:
+            errors.append({'index': index, 'student_id': student_id, 'error': 'Duplicate student_id'})
+            continue
+
+        try:
+            score = float(score_value)
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'student_id': student_id, 'error': 'Score must be a number'})
+            continue
+        if score < 0 or (max_score is not None and score > max_score):
+            errors.append({'index': index, 'student_id': student_id, 'error': f'Score out of range (0-{max_score:g})'})
+            continue
+
+        seen.add(student_id)
+        rows.append({
+            'student_id': student_id,
+            'score': score,
+            'percentage': (score / max_score) * 100 if max_score else 0
+        })
+
+    return rows, errors
+
+
+def calculate_attendance_scores(item, teacher_id=None):
+    """按考勤记录计算考勤类成绩项得分并批量写入（由调用方提交事务）
+
+    得分 = (出勤次数 + 迟到次数 × 0.8) / 考勤总次数 × 100
+
+    Returns:
+        (考勤总次数, 学生人数)；没有考勤记录时返回 (0, 0)
+    """
+    total_sessions = Attendance.query.filter_by(class_id=item.class_id).count()
+    if total_sessions == 0:
+        return 0, 0
+
+    counts = count_attendance_by_student(item.class_id)
+    empty = {'present': 0, 'late': 0, 'leave': 0}
+
+    rows = []
+    for student_id in get_enrolled_student_ids(item.class_id):
+        c = counts.get(student_id, empty)
+        attendance_score = (c['present'] + c['late'] * LATE_ATTENDANCE_FACTOR) / total_sessions * 100
+        rows.append({
+            'student_id': student_id,
+            'score': attendance_score,
+            'percentage': attendance_score
+        })
+
+    if rows:
+        save_item_scores(item, rows, teacher_id)
+    return total_sessions, len(rows)
+
+
+# ==================== 成绩册 ====================
+
+def build_gradebook(class_id):
+    """按列式结构构建整个教学班的成绩册
+
+    学生与成绩项分别给出索引数组，得分为按行主序展开的稠密数组
+    （scores[i * 成绩项数 + j] 为第 i 名学生第 j 个成绩项的原始分，未录入为 None）。
+    """
+    structure = get_grade_structure(class_id)
+    roster = load_roster(class_id)
+    student_ids = [r[0] for r in roster]
+    matrix = load_score_matrix(class_id, structure, student_ids, value='score')
+
+    finals = dict(
+        (r.student_id, r) for r in db.session.query(
+            StudentFinalGrade.student_id, StudentFinalGrade.total_score, StudentFinalGrade.rank
+        ).filter_by(class_id=class_id).all()
+    )
+
+    items = [item for cat in structure for item in cat['items']]
+    scores = []
+    for row in matrix['rows']:
+        scores.extend(round(v, 2) if v is not None else None for v in row)
+
+    return {
+        'class_id': class_id,
+        'shape': [len(student_ids), len(items)],
+        'categories': [{
+            'id': cat['id'],
+            'name': cat['name'],
+            'weight': cat['weight'] or 0
+        } for cat in structure],
+        'students': {
+            'student_id': student_ids,
+            'student_no': [r[1] for r in roster],
+            'name': [r[2] for r in roster],
+            'total_score': [
+                float(finals[sid].total_score) if sid in finals and finals[sid].total_score is not None else None
+                for sid in student_ids
+            ],
+            'rank': [finals[sid].rank if sid in finals else None for sid in student_ids]
+        },
+        'items': {
+            'id': [item['id'] for item in items],
+            'name': [item['name'] for item in items],
+            'category_id': [item['category_id'] for item in items],
+            'type': [item['type'] for item in items],
+            'max_score': [item['max_score'] if item['max_score'] else 100 for item in items],
+            'weight': [item['weight'] or 0 for item in items]
+        },
+        'scores': scores
+    }
+
+
+# ==================== 成绩明细 ====================
+
+def load_student_scores(class_id, student_id):
+    """一次联表查询获取学生在某教学班的全部成绩项及得分（未录入为 None）"""
+    rows = db.session.query(
+        GradeItem.id,
+        GradeItem.name,
+        GradeItem.max_score,
+        GradeItem.weight,
+        GradeCategory.id.label('category_id'),
+        GradeCategory.name.label('category_name'),
+        StudentGradeScore.score
+    ).join(GradeCategory, GradeCategory.id == GradeItem.category_id)\
+        .outerjoin(StudentGradeScore, and_(
+            StudentGradeScore.grade_item_id == GradeItem.id,
+            StudentGradeScore.student_id == student_id
+        ))\
+        .filter(GradeItem.class_id == class_id)\
+        .order_by(GradeCategory.order, GradeCategory.id, GradeItem.id).all()
+
+    return [{
+        'grade_item_id': r.id,
+        'item_name': r.name,
+        'category_id': r.category_id,
+        'category_name': r.category_name,
+        'max_score': float(r.max_score) if r.max_score else 0,
+        'weight': float(r.weight) if r.weight else 0,
+        'score': float(r.score) if r.score is not None else None
+    } for r in rows]
+
+
+def build_transcript(student_ids, class_ids=None):
+    """一次联表查询构建多名学生跨教学班的成绩单
+
+    以选课记录为起点联结教学班、课程、成绩分类/成绩项、得分与总评；
+    不指定 class_ids 时包含学生选修的全部教学班。
+
+    Returns:
+        [{'student_id': ..., 'classes': [{班级信息, 'final_grade': {...},
+          'categories': [{分类信息, 'items': [...]}]}]}]，按 student_ids 顺序
+    """
+    query = db.session.query(
+        StudentClass.student_id,
+        StudentClass.status.label('enrollment_status'),
+        TeachingClass.class_id,
+        TeachingClass.class_name,
+        TeachingClass.semester,
+        Course.course_code,
+        Course.course_name,
+        GradeCategory.id.label('category_id'),
+        GradeCategory.name.label('category_name'),
+        GradeCategory.weight.label('category_weight'),
+        GradeItem.id.label('item_id'),
+        GradeItem.name.label('item_name'),
+        GradeItem.max_score,
+        GradeItem.weight.label('item_weight'),
+        StudentGradeScore.score,
+        StudentGradeScore.percentage,
+        StudentFinalGrade.total_score,
+        StudentFinalGrade.rank
+    ).join(TeachingClass, TeachingClass.class_id == StudentClass.class_id)\
+        .join(Course, Course.course_id == TeachingClass.course_id)\
+        .outerjoin(GradeCategory, GradeCategory.class_id == StudentClass.class_id)\
+        .outerjoin(GradeItem, GradeItem.category_id == GradeCategory.id)\
+        .outerjoin(StudentGradeScore, and_(
+            StudentGradeScore.grade_item_id == GradeItem.id,
+            StudentGradeScore.student_id == StudentClass.student_id
+        ))\
+        .outerjoin(StudentFinalGrade, and_(
+            StudentFinalGrade.class_id == StudentClass.class_id,
+            StudentFinalGrade.student_id == StudentClass.student_id
+        ))\
+        .filter(StudentClass.student_id.in_(student_ids))
+    if class_ids:
+        query = query.filter(StudentClass.class_id.in_(class_ids))
+
+    rows = query.order_by(
+        StudentClass.student_id, TeachingClass.semester, TeachingClass.class_id,
+        GradeCategory.order, GradeCategory.id, GradeItem.id
+    ).all()
+
+    students = {sid: {'student_id': sid, 'classes': []} for sid in student_ids}
+    classes = {}
+    categories = {}
+    for r in rows:
+        class_key = (r.student_id, r.class_id)
+        class_node = classes.get(class_key)
+        if class_node is None:
+            class_node = {
+                'class_id': r.class_id,
+                'class_name': r.class_name,
+                'semester': r.semester,
+                'course_code': r.course_code,
+                'course_name': r.course_name,
+                'enrollment_status': r.enrollment_status,
+                'final_grade': {
+                    'total_score': float(r.total_score) if r.total_score is not None else None,
+                    'rank': r.rank
+                },
+                'categories': []
+            }
+            classes[class_key] = class_node
+            students[r.student_id]['classes'].append(class_node)
+
+        if r.category_id is None:
+            continue
+        category_key = (r.student_id, r.category_id)
+        category_node = categories.get(category_key)
+        if category_node is None:
+            category_node = {
+                'category_id': r.category_id,
+                'category_name': r.category_name,
+                'weight': float(r.category_weight) if r.category_weight else 0,
+                'items': []
+            }
+            categories[category_key] = category_node
+            class_node['categories'].append(category_node)
+
+        if r.item_id is None:
+            continue
+        category_node['items'].append({
+            'grade_item_id': r.item_id,
+            'item_name': r.item_name,
+            'max_score': float(r.max_score) if r.max_score else 0,
+            'weight': float(r.item_weight) if r.item_weight else 0,
+            'score': float(r.score) if r.score is not None else None,
+            'percentage': float(r.percentage) if r.percentage is not None else None
+        })
+
+    return [students[sid] for sid in student_ids]
+
+
+# ==================== 总评计算 ====================
+
+def compute_student_total(structure, item_index, row):
+    """根据一名学生的得分率行计算各分类得分与总评
+
+    计算口径：分类得分 = 已录入成绩项得分率的加权平均（未设权重按1计），
+    总评 = Σ 分类得分 × 分类权重%；没有成绩项的分类不计入。
+
+    Returns:
+        (category_scores, total_score)，category_scores 以分类名称为键
+    """
+    category_scores = {}
+    total_score = 0
+
+    for category in structure:
+        if not category['items']:
+            continue
+
+        category_total = 0
+        category_weight_sum = 0
+        for item in category['items']:
+            percentage = row[item_index[item['id']]]
+            if percentage is None:
+                continue
+            item_weight = item['weight'] if item['weight'] else 1
+            category_total += percentage * item_weight
+            category_weight_sum += item_weight
+
+        category_score = category_total / category_weight_sum if category_weight_sum > 0 else 0
+        category_scores[category['name']] = round(category_score, 2)
+
+        category_weight = category['weight'] if category['weight'] else 0
+        total_score += category_score * (category_weight / 100)
+
+    return category_scores, round(total_score, 2)
+
+
+def rank_results(results):
+    """按总评降序排名，就地写入 rank 与 rank_percentage"""
+    results.sort(key=lambda r: r['total_score'], reverse=True)
+    count = len(results)
+    for rank, result in enumerate(results, 1):
+        result['rank'] = rank
+        result['rank_percentage'] = round((rank / count) * 100, 2)
+    return results
+
+
+def compute_class_results(class_id, structure=None, student_ids=None):
+    """计算整个教学班的分类得分、总评与排名（不写库）"""
+    if structure is None:
+        structure = load_grade_structure(class_id)
+    if student_ids is None:
+        student_ids = get_enrolled_student_ids(class_id)
+
+    matrix = load_score_matrix(class_id, structure, student_ids)
+
+    results = []
+    for student_id, row in zip(student_ids, matrix['rows']):
+        category_scores, total_score = compute_student_total(structure, matrix['item_index'], row)
+        results.append({
+            'student_id': student_id,
+            'total_score': total_score,
+            'category_scores': category_scores
+        })
+
+    return rank_results(results)
+
+
+def save_final_grades(class_id, results):
+    """批量写入 StudentFinalGrade（一次查询已有记录 + 批量插入/更新）"""
+    existing = dict(
+        db.session.query(StudentFinalGrade.student_id, StudentFinalGrade.id)
+        .filter_by(class_id=class_id).all()
+    )
+    now = datetime.now()
+
+    updates = []
+    inserts = []
+    for result in results:
+        values = {
+            'total_score': result['total_score'],
+            'rank': result['rank'],
+            'rank_percentage': result['rank_percentage'],
+            'category_scores': result['category_scores'],
+            'calculated_at': now
+        }
+        grade_id = existing.get(result['student_id'])
+        if grade_id is not None:
+            values['id'] = grade_id
+            updates.append(values)
+        else:
+            values.update(student_id=result['student_id'], class_id=class_id)
+            inserts.append(values)
+
+    if updates:
+        db.session.bulk_update_mappings(StudentFinalGrade, updates)
+    if inserts:
+        for new_id, values in zip(allocate_ids(StudentFinalGrade, len(inserts)), inserts):
+            values['id'] = new_id
+        db.session.bulk_insert_mappings(StudentFinalGrade, inserts)
+
+    invalidate_class_statistics(class_id)
+    return len(updates), len(inserts)
+
+
+def calculate_class_final_grades(class_id):
+    """重新计算并保存教学班总评成绩（由调用方提交事务）
+
+    Returns:
+        参与计算的学生人数；未配置成绩分类时返回 None
+    """
+    structure = load_grade_structure(class_id)
+    if not structure:
+        return None
+
+    results = compute_class_results(class_id, structure)
+    save_final_grades(class_id, results)
+    return len(results)
+
+
+# ==================== 增量维护 ====================
+
+def refresh_final_grades(class_id, student_ids):
+    """成绩变更后增量维护总评与排名（由调用方提交事务）
+
+    只重算 student_ids 中学生的分类得分与总评，在按排名有序的总分序列中
+    二分定位其新位置，并仅更新名次或排名百分位发生变化的学生。
+    教学班尚未计算过总评时不做处理；变更学生过多时直接整班重算。
+
+    Returns:
+        被写入的总评记录数
+    """
+    changed = list(dict.fromkeys(int(sid) for sid in student_ids))
+    if not changed:
+        return 0
+
+    standings = db.session.query(
+        StudentFinalGrade.id,
+        StudentFinalGrade.student_id,
+        StudentFinalGrade.total_score,
+        StudentFinalGrade.rank,
+        StudentFinalGrade.rank_percentage
+    ).filter_by(class_id=class_id).order_by(StudentFinalGrade.rank, StudentFinalGrade.id).all()
+    if not standings:
+        return 0
+
+    structure = get_grade_structure(class_id)
+    if not structure:
+        return 0
+
+    if len(changed) > INCREMENTAL_MAX_STUDENTS:
+        results = compute_class_results(class_id, structure)
+        save_final_grades(class_id, results)
+        return len(results)
+
+    existing = {s.student_id: s for s in standings}
+    enrolled = set(get_enrolled_student_ids(class_id))
+    changed = [sid for sid in changed if sid in existing or sid in enrolled]
+    if not changed:
+        return 0
+
+    # 重算变更学生的分类得分与总评
+    matrix = load_score_matrix(class_id, structure, changed, only_students=True)
+    recalculated = {}
+    for student_id, row in zip(changed, matrix['rows']):
+        recalculated[student_id] = compute_student_total(structure, matrix['item_index'], row)
+
+    # 其余学生保持原有次序，变更学生按新总分二分插入（同分排在已有学生之后）
+    keys = []
+    order = []
+    for s in standings:
+        if s.student_id in recalculated:
+            continue
+        keys.append(-(float(s.total_score) if s.total_score is not None else 0))
+        order.append(s.student_id)
+    for student_id, (_, total_score) in recalculated.items():
+        position = bisect_right(keys, -total_score)
+        keys.insert(position, -total_score)
+        order.insert(position, student_id)
+
+    count = len(order)
+    now = datetime.now()
+    updates = []
+    inserts = []
+    for rank, student_id in enumerate(order, 1):
+        rank_percentage = round((rank / count) * 100, 2)
+        previous = existing.get(student_id)
+
+        if student_id in recalculated:
+            category_scores, total_score = recalculated[student_id]
+            values = {
+                'total_score': total_score,
+                'rank': rank,
+                'rank_percentage': rank_percentage,
+                'category_scores': category_scores,
+                'calculated_at': now
+            }
+            if previous is None:
+                values.update(student_id=student_id, class_id=class_id)
+                inserts.append(values)
+            else:
+                values['id'] = previous.id
+                updates.append(values)
+        elif previous.rank != rank or previous.rank_percentage is None \
+                or float(previous.rank_percentage) != rank_percentage:
+            updates.append({'id': previous.id, 'rank': rank, 'rank_percentage': rank_percentage})
+
+    if updates:
+        db.session.bulk_update_mappings(StudentFinalGrade, updates)
+    if inserts:
+        for new_id, values in zip(allocate_ids(StudentFinalGrade, len(inserts)), inserts):
+            values['id'] = new_id
+        db.session.bulk_insert_mappings(StudentFinalGrade, inserts)
+
+    invalidate_class_statistics(class_id)
+    return len(updates) + len(inserts)
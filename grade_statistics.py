@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+成绩统计模块 - 按教学班缓存总评快照，单次遍历计算均值、分位数、分布等统计量
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_right
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, GradeCategory, StudentFinalGrade, Student, Users
+
+# 及格线与优秀线
+PASS_SCORE = 60
+EXCELLENT_SCORE = 85
+
+# 默认分位数与直方图分段边界
+DEFAULT_PERCENTILES = (25, 50, 75, 90)
+DEFAULT_HISTOGRAM_EDGES = (0, 60, 70, 80, 90, 100)
+
+# 快照缓存有效期（秒）；本进程内的成绩写入会主动失效，其他进程的写入靠过期兜底
+STATISTICS_CACHE_TTL = 300
+
+# 会话中待提交后再次失效的教学班
+_PENDING_KEY = 'pending_statistics_invalidation'
+
+_cache = {}
+_generation = {}
+_cache_lock = threading.Lock()
+
+
+# ==================== 缓存管理 ====================
+
+def _invalidate(class_ids):
+    with _cache_lock:
+        for class_id in class_ids:
+            _cache.pop(class_id, None)
+            _generation[class_id] = _generation.get(class_id, 0) + 1
+
+
+def invalidate_class_statistics(class_id):
+    """使教学班的统计快照失效（总评重算、成绩变更、成绩结构变更时调用）
+
+    写入通常在调用方提交事务之前调用：此时立即失效一次，并在当前会话提交后再失效一次，
+    避免提交前这段时间内其他请求读到旧数据重新写入缓存。
+    """
+    _invalidate([class_id])
+    db.session().info.setdefault(_PENDING_KEY, set()).add(class_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        _invalidate(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _load_snapshot(class_id):
+    """加载教学班总评快照：升序总分列表 + 排名名单（两次查询）"""
+    has_config = db.session.query(GradeCategory.id).filter_by(class_id=class_id).first() is not None
+
+    rows = db.session.query(
+        StudentFinalGrade.rank,
+        StudentFinalGrade.total_score,
+        StudentFinalGrade.category_scores,
+        Student.student_no,
+        Users.real_name
+    ).join(Student, Student.student_id == StudentFinalGrade.student_id)\
+        .join(Users, Users.user_id == Student.user_id)\
+        .filter(StudentFinalGrade.class_id == class_id)\
+        .order_by(StudentFinalGrade.rank).all()
+
+    rankings = [{
+        'rank': r.rank,
+        'student_no': r.student_no.strip() if r.student_no else r.student_no,
+        'name': r.real_name or '未知',
+        'total_score': float(r.total_score) if r.total_score is not None else 0,
+        'category_scores': r.category_scores or {}
+    } for r in rows]
+
+    return {
+        'has_config': has_config,
+        'scores': sorted(float(r.total_score) for r in rows if r.total_score is not None),
+        'rankings': rankings,
+        'loaded_at': time.time()
+    }
+
+
+def get_class_snapshot(class_id):
+    """获取教学班总评快照（命中缓存时不查询数据库）"""
+    with _cache_lock:
+        snapshot = _cache.get(class_id)
+        generation = _generation.get(class_id, 0)
+    if snapshot and time.time() - snapshot['loaded_at'] < STATISTICS_CACHE_TTL:
+        return snapshot
+
+    snapshot = _load_snapshot(class_id)
+    with _cache_lock:
+        # 加载期间成绩被修改过则不写入缓存，避免缓存旧数据
+        if _generation.get(class_id, 0) == generation:
+            _cache[class_id] = snapshot
+    return snapshot
+
+
+# ==================== 统计计算 ====================
+
+def percentile(sorted_scores, p):
+    """线性插值分位数（与 numpy 默认口径一致）"""
+    if not sorted_scores:
+        return None
+    position = (len(sorted_scores) - 1) * p / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_scores[lower]
+    return sorted_scores[lower] + (sorted_scores[upper] - sorted_scores[lower]) * (position - lower)
+
+
+def summarize_scores(sorted_scores, percentiles=DEFAULT_PERCENTILES, edges=DEFAULT_HISTOGRAM_EDGES):
+    """对升序总分列表单次遍历计算统计量
+
+    直方图各分段为左闭右开区间，最后一段包含上边界；超出边界的分数不计入。
+    """
+    count = len(sorted_scores)
+    edges = sorted(edges)
+    histogram = [0] * max(len(edges) - 1, 0)
+    distribution = {'90-100': 0, '80-89': 0, '70-79': 0, '60-69': 0, '0-59': 0}
+
+    mean = 0.0
+    m2 = 0.0
+    pass_count = 0
+    excellent_count = 0
+    for n, s in enumerate(sorted_scores, 1):
+        delta = s - mean
+        mean += delta / n
+        m2 += delta * (s - mean)
+
+        if s >= PASS_SCORE:
+            pass_count += 1
+        if s >= EXCELLENT_SCORE:
+            excellent_count += 1
+
+        if 90 <= s <= 100:
+            distribution['90-100'] += 1
+        elif 80 <= s < 90:
+            distribution['80-89'] += 1
+        elif 70 <= s < 80:
+            distribution['70-79'] += 1
+        elif 60 <= s < 70:
+            distribution['60-69'] += 1
+        elif s < 60:
+            distribution['0-59'] += 1
+
+        if histogram and edges[0] <= s <= edges[-1]:
+            histogram[min(bisect_right(edges, s) - 1, len(histogram) - 1)] += 1
+
+    return {
+        'total_students': count,
+        'average': round(mean, 2),
+        'median': round(percentile(sorted_scores, 50), 2),
+        'stddev': round(math.sqrt(m2 / count), 2),
+        'highest': sorted_scores[-1],
+        'lowest': sorted_scores[0],
+        'percentiles': {f'p{p:g}': round(percentile(sorted_scores, p), 2) for p in percentiles},
+        'pass_rate': round(pass_count / count * 100, 2),
+        'excellent_rate': round(excellent_count / count * 100, 2),
+        'distribution': distribution,
+        'histogram': [{
+            'range': [edges[i], edges[i + 1]],
+            'count': histogram[i]
+        } for i in range(len(histogram))]
+    }
+
+
+def get_class_statistics(class_id, percentiles=DEFAULT_PERCENTILES, edges=DEFAULT_HISTOGRAM_EDGES):
+    """获取教学班成绩统计
+
+    Returns:
+        统计结果字典；没有总评数据时 has_data 为 False
+    """
+    snapshot = get_class_snapshot(class_id)
+
+    if not snapshot['scores']:
+        return {
+            'total_students': 0,
+            'average': 0,
+            'highest': 0,
+            'lowest': 0,
+            'pass_rate': 0,
+            'excellent_rate': 0,
+            'distribution': {},
+            'rankings': [],
+            'has_data': False,
+            'has_config': snapshot['has_config'],
+            'message': '请先计算总评成绩' if snapshot['has_config'] else '请先配置成绩结构'
+        }
+
+    stats = summarize_scores(snapshot['scores'], percentiles, edges)
+    stats['rankings'] = snapshot['rankings']
+    stats['has_data'] = True
+    stats['has_config'] = snapshot['has_config']
+    return stats
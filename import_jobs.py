@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+数据导入任务 - 上传的CSV先落盘，再由后台任务导入，前端轮询任务进度与结果
+"""
+
+import os
+import uuid
+from flask import current_app
+from models import db, Department, Course, allocate_ids
+from job_manager import start_background_job
+from dashboard_stats import mark_dashboard_stale
+from user_search import invalidate_user_search_index
+from user_import import (
+    IMPORT_CHUNK_SIZE, parse_csv, import_users, write_in_chunks, build_report
+)
+
+
+def _clean(row, key):
+    return (row.get(key) or '').strip()
+
+
+# ==================== 院系/课程导入 ====================
+
+def _import_records(rows, records, errors, model, id_field, key, chunk_size, progress):
+    """分块批量写入已校验的单表记录，返回逐行报告"""
+    total = len(rows)
+    invalid_count = total - len(records)
+    if progress:
+        progress(invalid_count, total, 0, errors)
+
+    def insert_chunk(chunk):
+        ids = allocate_ids(model, len(chunk), id_field)
+        db.session.bulk_insert_mappings(model, [
+            dict(r['values'], **{id_field: new_id}) for new_id, r in zip(ids, chunk)
+        ])
+
+    on_chunk = None
+    if progress:
+        on_chunk = lambda written, success: progress(invalid_count + written, total, success, errors)
+    created = write_in_chunks(records, insert_chunk, errors, chunk_size, on_chunk)
+
+    return build_report(rows, created, errors, key)
+
+
+def import_departments(rows, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """导入院系（CSV列：dept_name, description）"""
+    existing = {r[0] for r in db.session.query(Department.dept_name).all()}
+
+    records = []
+    errors = {}
+    for row_num, row in rows:
+        dept_name = _clean(row, 'dept_name')
+        if not dept_name:
+            errors[row_num] = 'dept_name is required'
+            continue
+        if dept_name in existing:
+            errors[row_num] = f"Department '{dept_name}' already exists"
+            continue
+
+        existing.add(dept_name)
+        records.append({'row': row_num, 'values': {
+            'dept_name': dept_name,
+            'description': _clean(row, 'description') or None
+        }})
+
+    return _import_records(rows, records, errors, Department, 'dept_id', 'dept_name', chunk_size, progress)
+
+
+def import_courses(rows, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """导入课程（CSV列：course_code, course_name, credits, hours, course_type, description）"""
+    existing = {r[0] for r in db.session.query(Course.course_code).all()}
+
+    records = []
+    errors = {}
+    for row_num, row in rows:
+        course_code = _clean(row, 'course_code')
+        course_name = _clean(row, 'course_name')
+        if not all([course_code, course_name]):
+            errors[row_num] = 'Missing required fields'
+            continue
+        if course_code in existing:
+            errors[row_num] = f"Course '{course_code}' already exists"
+            continue
+
+        try:
+            credits = _clean(row, 'credits') or _clean(row, 'credit')
+            hours = _clean(row, 'hours')
+            values = {
+                'course_code': course_code,
+                'course_name': course_name,
+                'credit': float(credits) if credits else None,
+                'hours': int(hours) if hours else None,
+                'course_type': _clean(row, 'course_type') or None,
+                'description': _clean(row, 'description') or None
+            }
+        except ValueError:
+            errors[row_num] = 'Invalid credits or hours'
+            continue
+
+        existing.add(course_code)
+        records.append({'row': row_num, 'values': values})
+
+    return _import_records(rows, records, errors, Course, 'course_id', 'course_code', chunk_size, progress)
+
+
+# ==================== 导入任务 ====================
+
+# 导入类型 -> (任务类型, 导入函数)
+IMPORT_TYPES = {
+    'users': ('import_users', import_users),
+    'departments': ('import_departments', import_departments),
+    'courses': ('import_courses', import_courses),
+}
+
+
+def save_upload(file):
+    """把上传文件分块写入导入目录（不整体读入内存），返回文件路径"""
+    folder = current_app.config.get('IMPORT_FOLDER') or os.path.join(current_app.config['UPLOAD_FOLDER'], 'imports')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{uuid.uuid4().hex}.csv')
+    file.save(path)
+    return path
+
+
+def start_import_job(import_type, file, user_id=None):
+    """保存上传文件并创建后台导入任务
+
+    Returns:
+        新建的 BackgroundJob
+    """
+    job_type, importer = IMPORT_TYPES[import_type]
+    path = save_upload(file)
+
+    def runner(job, progress):
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                rows = parse_csv(f)
+            if import_type == 'users':
+                return importer(rows, hash_workers=current_app.config.get('PASSWORD_HASH_WORKERS'), progress=progress)
+            return importer(rows, progress=progress)
+        finally:
+            os.remove(path)
+            mark_dashboard_stale()
+            if import_type == 'users':
+                invalidate_user_search_index()
+
+    try:
+        return start_background_job(job_type, {'filename': file.filename}, runner, user_id)
+    except Exception:
+        os.remove(path)
+        raise
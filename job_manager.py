@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务模块 - 学期成绩批量重算等耗时任务
+
+任务拆分为子任务（每个教学班一个）交给进程池并行执行，进度与每个子任务的结果
+持久化在 BackgroundJob / BackgroundJobTask 表中，前端轮询任务状态即可；
+失败的子任务可以单独重试，而不必重跑整个学期。
+数据导入等不便拆分的任务则在后台线程中整体执行，通过进度回调更新任务记录。
+
+多个工作进程之间用租约协调：执行任务的进程在任务及其 running 子任务上记录自身标识
+（owner_id），并由心跳线程每 JOB_HEARTBEAT_INTERVAL 秒续约（heartbeat_at）。
+心跳超过 JOB_LEASE_TIMEOUT 秒未更新的任务视为中断；重试只接管租约已失效的任务，
+只重置失败的子任务和租约已失效的子任务，其他进程仍在执行的子任务不会被重复执行。
+"""
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, BackgroundJob, BackgroundJobTask, TeachingClass, generate_next_id, allocate_ids
+from grade_statistics import invalidate_class_statistics
+
+JOB_TYPE_RECALCULATE_GRADES = 'recalculate_grades'
+
+# 任务进度中保留的错误条数上限
+JOB_ERROR_LIMIT = 200
+
+# 心跳续约周期与租约超时（秒）
+JOB_HEARTBEAT_INTERVAL = 15
+JOB_LEASE_TIMEOUT = 60
+
+# 本工作进程的租约持有者标识
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# 本进程中正在调度的任务ID（由心跳线程续约）
+_active_jobs = set()
+_active_lock = threading.Lock()
+_heartbeat = None
+
+
+# ==================== 进程池 ====================
+
+def _get_executor(max_workers):
+    """懒加载进程池（spawn 方式启动，避免复制父进程的数据库连接）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def recalculate_class_grades_task(class_id):
+    """子进程入口：重算单个教学班的总评成绩"""
+    from app import app
+    from grade_engine import calculate_class_final_grades
+
+    with app.app_context():
+        try:
+            count = calculate_class_final_grades(class_id)
+            db.session.commit()
+            return {
+                'total_students': count or 0,
+                'skipped': count is None
+            }
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+TASK_HANDLERS = {
+    JOB_TYPE_RECALCULATE_GRADES: recalculate_class_grades_task,
+}
+
+# 子任务成功后在调度进程中执行的回调（参数为 target_id）
+# 子任务在子进程中执行，其中的缓存失效只作用于子进程自身，需要在此处再清理本进程的缓存
+TASK_SUCCESS_HOOKS = {
+    JOB_TYPE_RECALCULATE_GRADES: invalidate_class_statistics,
+}
+
+
+# ==================== 租约 ====================
+
+def _lease_cutoff():
+    return datetime.now() - timedelta(seconds=JOB_LEASE_TIMEOUT)
+
+
+def is_job_active(job):
+    """任务是否正由某个工作进程执行（租约未过期）"""
+    return (
+        job.status in ('pending', 'running')
+        and job.owner_id is not None
+        and job.heartbeat_at is not None
+        and job.heartbeat_at >= _lease_cutoff()
+    )
+
+
+def _claim_job(job):
+    """原子地接管租约已失效（或已结束）的任务；其他进程仍持有租约时返回 False"""
+    claimed = BackgroundJob.query.filter(
+        BackgroundJob.id == job.id,
+        db.or_(
+            BackgroundJob.status.notin_(['pending', 'running']),
+            BackgroundJob.owner_id.is_(None),
+            BackgroundJob.heartbeat_at.is_(None),
+            BackgroundJob.heartbeat_at < _lease_cutoff()
+        )
+    ).update({'owner_id': WORKER_ID, 'heartbeat_at': datetime.now()}, synchronize_session=False)
+    db.session.expire(job)
+    return bool(claimed)
+
+
+def _renew_leases(job_ids):
+    """续约本进程持有的任务及其 running 子任务"""
+    now = datetime.now()
+    BackgroundJob.query.filter(
+        BackgroundJob.id.in_(job_ids),
+        BackgroundJob.owner_id == WORKER_ID
+    ).update({'heartbeat_at': now}, synchronize_session=False)
+    BackgroundJobTask.query.filter(
+        BackgroundJobTask.job_id.in_(job_ids),
+        BackgroundJobTask.status == 'running',
+        BackgroundJobTask.owner_id == WORKER_ID
+    ).update({'heartbeat_at': now}, synchronize_session=False)
+
+
+def _heartbeat_loop(app):
+    """心跳线程：定期为本进程中执行的任务续约"""
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _active_lock:
+            job_ids = list(_active_jobs)
+        if not job_ids:
+            continue
+        with app.app_context():
+            try:
+                _renew_leases(job_ids)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Failed to renew background job leases: {e}")
+            finally:
+                db.session.remove()
+
+
+def _ensure_heartbeat(app):
+    global _heartbeat
+    with _active_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_heartbeat_loop, args=(app,), daemon=True)
+            _heartbeat.start()
+
+
+def _release(job):
+    """任务结束时释放租约"""
+    job.owner_id = None
+    job.heartbeat_at = None
+
+
+# ==================== 调度 ====================
+
+
+def _dispatch(app, job_id):
+    """调度线程：提交待执行子任务，并在每个子任务完成时持久化结果与进度"""
+    with app.app_context():
+        try:
+            job = db.session.get(BackgroundJob, job_id)
+            handler = TASK_HANDLERS[job.job_type]
+            on_success = TASK_SUCCESS_HOOKS.get(job.job_type)
+
+            tasks = BackgroundJobTask.query.filter_by(job_id=job_id, status='pending').all()
+            executor = _get_executor(app.config.get('BACKGROUND_JOB_WORKERS', 4))
+
+            job.status = 'running'
+            job.started_at = job.started_at or datetime.now()
+            futures = {}
+            now = datetime.now()
+            for task in tasks:
+                task.status = 'running'
+                task.attempts = (task.attempts or 0) + 1
+                task.owner_id = WORKER_ID
+                task.heartbeat_at = now
+                futures[executor.submit(handler, task.target_id)] = task.id
+            db.session.commit()
+
+            for future in as_completed(futures):
+                task = db.session.get(BackgroundJobTask, futures[future])
+                try:
+                    task.result = future.result()
+                    task.status = 'success'
+                    task.error = None
+                    if on_success:
+                        on_success(task.target_id)
+                except Exception as e:
+                    task.status = 'failed'
+                    task.error = str(e)
+                task.finished_at = datetime.now()
+                db.session.flush()
+                _update_progress(job)
+                db.session.commit()
+
+            _summarize(job)
+            job.status = 'failed' if job.failed_count else 'completed'
+            job.finished_at = datetime.now()
+            _release(job)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Background job {job_id} failed: {e}")
+            job = db.session.get(BackgroundJob, job_id)
+            if job:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = datetime.now()
+                _release(job)
+                db.session.commit()
+        finally:
+            with _active_lock:
+                _active_jobs.discard(job_id)
+            db.session.remove()
+
+
+def _update_progress(job):
+    """按子任务状态汇总任务进度"""
+    counts = dict(db.session.query(
+        BackgroundJobTask.status, db.func.count(BackgroundJobTask.id)
+    ).filter(BackgroundJobTask.job_id == job.id).group_by(BackgroundJobTask.status).all())
+
+    job.success_count = counts.get('success', 0)
+    job.failed_count = counts.get('failed', 0)
+
+
+def _summarize(job):
+    """任务结束时汇总各子任务结果"""
+    results = [t.result or {} for t in BackgroundJobTask.query.filter_by(job_id=job.id, status='success')]
+    job.summary = {
+        'total_students': sum(r.get('total_students', 0) for r in results),
+        'skipped_classes': sum(1 for r in results if r.get('skipped'))
+    }
+
+
+def _run_single(app, job_id, runner):
+    """后台线程：整体执行单个任务，runner 通过进度回调更新任务记录"""
+    with app.app_context():
+        try:
+            job = db.session.get(BackgroundJob, job_id)
+            job.status = 'running'
+            job.started_at = datetime.now()
+            db.session.commit()
+
+            def progress(processed, total, success_count, errors=None):
+                job.total_count = total
+                job.success_count = success_count
+                job.failed_count = processed - success_count
+                if errors:
+                    job.summary = {'errors': _format_errors(errors)}
+                db.session.commit()
+
+            summary = runner(job, progress)
+
+            job.summary = summary
+            job.success_count = summary.get('success_count', job.success_count)
+            job.failed_count = summary.get('error_count', job.failed_count)
+            job.status = 'completed'
+            job.finished_at = datetime.now()
+            _release(job)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Background job {job_id} failed: {e}")
+            job = db.session.get(BackgroundJob, job_id)
+            if job:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = datetime.now()
+                _release(job)
+                db.session.commit()
+        finally:
+            with _active_lock:
+                _active_jobs.discard(job_id)
+            db.session.remove()
+
+
+def _format_errors(errors):
+    """{行号: 错误信息} 转为按行号排序的列表（截断到 JOB_ERROR_LIMIT 条）"""
+    return [{'row': row, 'error': errors[row]} for row in sorted(errors)[:JOB_ERROR_LIMIT]]
+
+
+def _start(job_id, target=_dispatch, *args):
+    """启动任务线程（调用前本进程须已持有任务租约）"""
+    with _active_lock:
+        if job_id in _active_jobs:
+            return False
+        _active_jobs.add(job_id)
+
+    app = current_app._get_current_object()
+    _ensure_heartbeat(app)
+    threading.Thread(target=target, args=(app, job_id) + args, daemon=True).start()
+    return True
+
+
+# ==================== 对外接口 ====================
+
+def start_semester_recalculation(semester, user_id=None):
+    """为学期内所有开课中的教学班创建总评重算任务并开始执行
+
+    Returns:
+        新建的 BackgroundJob；该学期没有教学班时返回 None
+    """
+    class_ids = [row.class_id for row in db.session.query(TeachingClass.class_id).filter(
+        TeachingClass.semester == semester,
+        TeachingClass.status == 1
+    ).order_by(TeachingClass.class_id).all()]
+    if not class_ids:
+        return None
+
+    job = BackgroundJob(
+        id=generate_next_id(BackgroundJob),
+        job_type=JOB_TYPE_RECALCULATE_GRADES,
+        params={'semester': semester},
+        status='pending',
+        total_count=len(class_ids),
+        success_count=0,
+        failed_count=0,
+        created_by=user_id,
+        owner_id=WORKER_ID,
+        heartbeat_at=datetime.now()
+    )
+    db.session.add(job)
+
+    task_ids = allocate_ids(BackgroundJobTask, len(class_ids))
+    db.session.bulk_insert_mappings(BackgroundJobTask, [{
+        'id': task_id,
+        'job_id': job.id,
+        'target_id': class_id,
+        'status': 'pending',
+        'attempts': 0
+    } for task_id, class_id in zip(task_ids, class_ids)])
+    db.session.commit()
+
+    _start(job.id)
+    return job
+
+
+def start_background_job(job_type, params, runner, user_id=None):
+    """创建任务并在后台线程中整体执行
+
+    Args:
+        runner: runner(job, progress)，返回写入任务 summary 的汇总字典；
+            progress(已处理数, 总数, 成功数, 错误字典) 用于上报进度
+
+    Returns:
+        新建的 BackgroundJob
+    """
+    job = BackgroundJob(
+        id=generate_next_id(BackgroundJob),
+        job_type=job_type,
+        params=params,
+        status='pending',
+        total_count=0,
+        success_count=0,
+        failed_count=0,
+        created_by=user_id,
+        owner_id=WORKER_ID,
+        heartbeat_at=datetime.now()
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _start(job.id, _run_single, runner)
+    return job
+
+
+def retry_failed_tasks(job):
+    """重试任务中失败的子任务，以及执行进程已中断（租约过期）的子任务
+
+    Returns:
+        重新排队的子任务数；任务仍由某个工作进程执行时返回 None
+    """
+    if not _claim_job(job):
+        db.session.commit()
+        return None
+
+    BackgroundJobTask.query.filter(
+        BackgroundJobTask.job_id == job.id,
+        db.or_(
+            BackgroundJobTask.status == 'failed',
+            db.and_(
+                BackgroundJobTask.status == 'running',
+                db.or_(BackgroundJobTask.heartbeat_at.is_(None), BackgroundJobTask.heartbeat_at < _lease_cutoff())
+            )
+        )
+    ).update({'status': 'pending', 'error': None, 'owner_id': None, 'heartbeat_at': None}, synchronize_session=False)
+
+    # 中断前尚未开始的子任务也由本次调度执行
+    retry_count = BackgroundJobTask.query.filter_by(job_id=job.id, status='pending').count()
+    if not retry_count:
+        _release(job)
+        db.session.commit()
+        return 0
+
+    job.status = 'pending'
+    job.error = None
+    job.finished_at = None
+    _update_progress(job)
+    db.session.commit()
+
+    _start(job.id)
+    return retry_count
+
+
+def serialize_job(job, include_tasks=False):
+    """任务状态序列化（供前端轮询）"""
+    # 租约已过期的 pending/running 任务说明执行进程已退出，提示前端可重试
+    status = job.status
+    if status in ('pending', 'running') and not is_job_active(job):
+        status = 'interrupted'
+
+    finished = (job.success_count or 0) + (job.failed_count or 0)
+    data = {
+        'job_id': job.id,
+        'job_type': job.job_type,
+        'params': job.params or {},
+        'status': status,
+        'total': job.total_count or 0,
+        'processed': finished,
+        'success': job.success_count or 0,
+        'failed': job.failed_count or 0,
+        'progress': round(finished / job.total_count * 100, 2) if job.total_count else 100,
+        'summary': job.summary or {},
+        'error': job.error,
+        'created_by': job.created_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+    if include_tasks:
+        data['tasks'] = [{
+            'task_id': t.id,
+            'target_id': t.target_id,
+            'status': t.status,
+            'attempts': t.attempts or 0,
+            'result': t.result,
+            'error': t.error,
+            'finished_at': t.finished_at.isoformat() if t.finished_at else None
+        } for t in job.tasks.order_by(BackgroundJobTask.target_id).all()]
+
+    return data
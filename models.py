@@ -1,14 +1,101 @@
+import threading
 from flask_sqlalchemy import SQLAlchemy  # type: ignore
 from flask_login import UserMixin   # type: ignore
+from sqlalchemy import select  # type: ignore
+from sqlalchemy.exc import IntegrityError  # type: ignore
 from sqlalchemy.sql import func  # type: ignore
 from werkzeug.security import generate_password_hash, check_password_hash   # type: ignore
 
 db = SQLAlchemy()
 
+# ==================== ID 分配 ====================
+
+# 每次从序列表预取的ID块大小；进程退出时块内未用完的ID会被跳过
+ID_BLOCK_SIZE = 50
+
+
+class IdSequence(db.Model):
+    """主键序列表：每张表一行，记录下一个待分配ID块的起点"""
+    __tablename__ = 'IdSequence'
+
+    name = db.Column(db.String(100), primary_key=True)  # 表名
+    next_id = db.Column(db.BigInteger, nullable=False)
+
+
+class IdAllocator:
+    """按表分块（hi/lo）分配主键ID
+
+    进程在独立的短事务中把表的序列推进一个块，块内ID在进程内加锁顺序发放，
+    因此多进程、多线程并发插入不会拿到重复ID，也不再每次插入前 SELECT MAX。
+    序列首次使用时从表中现有最大ID开始，此后所有插入都应经由分配器取ID。
+    """
+
+    def __init__(self, block_size=ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._blocks = {}  # {表名: [下一个可用ID, 块结束ID（不含）]}
+        self._lock = threading.Lock()
+
+    def allocate(self, model, n=1, id_field='id'):
+        """分配 n 个ID，返回ID列表（递增，但跨块时不保证连续）"""
+        key = model.__tablename__
+        ids = []
+        with self._lock:
+            block = self._blocks.get(key)
+            while len(ids) < n:
+                if block is None or block[0] >= block[1]:
+                    size = max(self.block_size, n - len(ids))
+                    start = self._reserve(model, id_field, size)
+                    block = self._blocks[key] = [start, start + size]
+                take = min(n - len(ids), block[1] - block[0])
+                ids.extend(range(block[0], block[0] + take))
+                block[0] += take
+        return ids
+
+    def reset(self):
+        """丢弃进程内已预取的ID块（如数据库被恢复后）"""
+        with self._lock:
+            self._blocks.clear()
+
+    def _reserve(self, model, id_field, size):
+        """在独立事务中推进序列，返回预留的 size 个连续ID的起点"""
+        key = model.__tablename__
+        table = IdSequence.__table__
+
+        for _ in range(3):
+            # 独立短事务：请求事务回滚不会收回已发出的ID，序列行的锁也只持有片刻
+            with db.engine.begin() as conn:
+                updated = conn.execute(
+                    table.update().where(table.c.name == key)
+                    .values(next_id=table.c.next_id + size)
+                ).rowcount
+                if updated:
+                    end = conn.execute(select(table.c.next_id).where(table.c.name == key)).scalar()
+                    return end - size
+
+            # 序列尚未初始化：在当前会话中读取现有最大ID（能看到本事务未提交的行，不会与自身的锁冲突）
+            max_id = db.session.query(func.max(getattr(model, id_field))).scalar() or 0
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(table.insert().values(name=key, next_id=max_id + 1 + size))
+                return max_id + 1
+            except IntegrityError:
+                # 其他进程已初始化同一序列，重试走更新分支
+                continue
+
+        raise RuntimeError(f'Failed to allocate ids for {key}')
+
+
+id_allocator = IdAllocator()
+
+
 def generate_next_id(model, id_field='id'):
     """生成模型的下一个ID"""
-    max_id = db.session.query(db.func.max(getattr(model, id_field))).scalar()
-    return (max_id or 0) + 1
+    return id_allocator.allocate(model, 1, id_field)[0]
+
+
+def allocate_ids(model, n, id_field='id'):
+    """为批量插入一次分配 n 个ID"""
+    return id_allocator.allocate(model, n, id_field)
 
 # ==================== 基础数据模块 ====================
 
@@ -201,7 +288,7 @@ class Teacher(db.Model):
     user_id = db.Column(db.BigInteger, db.ForeignKey('Users.user_id', name='FK_Teacher_User'), unique=True, nullable=False)
     teacher_no = db.Column(db.String(20), unique=True, nullable=False)
     title = db.Column(db.String(50))
-    dept_id = db.Column(db.BigInteger, db.ForeignKey('Department.dept_id', name='FK_Teacher_Department'))
+    dept_id = db.Column(db.BigInteger, db.ForeignKey('Department.dept_id', name='FK_Teacher_Department'), index=True)
     created_at = db.Column(db.DateTime(timezone=True), default=func.now())
     updated_at = db.Column(db.DateTime(timezone=True), default=func.now(), onupdate=func.now())
 
@@ -246,7 +333,7 @@ class TeachingClass(db.Model):
     __tablename__ = 'TeachingClass'
 
     class_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
-    course_id = db.Column(db.BigInteger, db.ForeignKey('Course.course_id', name='FK_TeachingClass_Course'), nullable=False)
+    course_id = db.Column(db.BigInteger, db.ForeignKey('Course.course_id', name='FK_TeachingClass_Course'), nullable=False, index=True)
     class_name = db.Column(db.String(100), nullable=False)
     semester = db.Column(db.String(20), nullable=False, index=True)
     class_time = db.Column(db.String(200))
@@ -263,6 +350,11 @@ class TeachingClass(db.Model):
     assignments = db.relationship('Assignment', backref='teaching_class', lazy='dynamic')
     grades = db.relationship('Grade', backref='teaching_class', lazy='dynamic')
 
+    __table_args__ = (
+        # 管理端教学班列表：按学期/状态筛选并按创建时间排序
+        db.Index('IX_TeachingClass_Semester_Status_Created', 'semester', 'status', 'created_at'),
+    )
+
 
 class StudentClass(db.Model):
     """学生选课关系表"""
@@ -276,6 +368,7 @@ class StudentClass(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('student_id', 'class_id', name='UK_StudentClass_Student_Class'),
+        db.Index('IX_StudentClass_Class', 'class_id', 'status'),
     )
 
 
@@ -291,6 +384,7 @@ class TeacherClass(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('teacher_id', 'class_id', name='UK_TeacherClass_Teacher_Class'),
+        db.Index('IX_TeacherClass_Class', 'class_id'),
     )
 
 # ==================== 教学资源模块 ====================
@@ -643,13 +737,18 @@ class ForumPost(db.Model):
     author = db.relationship('Users', backref='posts')
     comments = db.relationship('ForumComment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # 帖子列表：班级内按置顶、发布时间倒序
+        db.Index('IX_ForumPost_Class_Pinned_Created', 'class_id', 'is_pinned', 'created_at'),
+    )
+
 
 class ForumComment(db.Model):
     """帖子回复/评论"""
     __tablename__ = 'ForumComment'
 
     id = db.Column(db.BigInteger, primary_key=True)
-    post_id = db.Column(db.BigInteger, db.ForeignKey('ForumPost.id'), nullable=False)
+    post_id = db.Column(db.BigInteger, db.ForeignKey('ForumPost.id'), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
     author_id = db.Column(db.BigInteger, db.ForeignKey('Users.user_id'), nullable=False)
     parent_id = db.Column(db.BigInteger, db.ForeignKey('ForumComment.id'), nullable=True) # 支持楼中楼
@@ -661,6 +760,28 @@ class ForumComment(db.Model):
     author = db.relationship('Users', backref='comments')
     replies = db.relationship('ForumComment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
 
+    __table_args__ = (
+        # 帖子详情：按帖子分页一级回复，按父回复逐层加载楼中楼
+        db.Index('IX_ForumComment_Post_Parent_Created', 'post_id', 'parent_id', 'created_at'),
+    )
+
+
+class ForumSearchTerm(db.Model):
+    """论坛全文检索倒排索引（班级 + 词项 -> 帖子/回复）"""
+    __tablename__ = 'ForumSearchTerm'
+
+    class_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    term = db.Column(db.String(50), primary_key=True)
+    doc_type = db.Column(db.String(10), primary_key=True)  # 'post', 'comment'
+    doc_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    post_id = db.Column(db.BigInteger, nullable=False)  # 回复所属帖子；帖子即自身
+    weight = db.Column(db.Integer, nullable=False, default=1)  # 词频 x 字段权重
+
+    __table_args__ = (
+        # 帖子/回复修改或删除时按文档清除词项
+        db.Index('IX_ForumSearchTerm_Post', 'post_id', 'doc_type', 'doc_id'),
+    )
+
 
 class Message(db.Model):
     """站内信 (私信)"""
@@ -746,6 +867,99 @@ class ForumPostStatus(db.Model):
     locker = db.relationship('Admin', foreign_keys=[locked_by], backref='locked_posts')
 
 
+class ForumClassStats(db.Model):
+    """班级讨论区计数器（随论坛写操作在同一事务中增量维护）"""
+    __tablename__ = 'ForumClassStats'
+
+    class_id = db.Column(db.BigInteger, db.ForeignKey('TeachingClass.class_id'), primary_key=True, autoincrement=False)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    hidden_count = db.Column(db.Integer, nullable=False, default=0)  # 被隐藏的帖子数
+    locked_count = db.Column(db.Integer, nullable=False, default=0)  # 被锁定的帖子数
+    flagged_count = db.Column(db.Integer, nullable=False, default=0)  # 待审核的帖子数
+    last_activity_at = db.Column(db.DateTime(timezone=True))  # 最近发帖/回复时间
+
+    teaching_class = db.relationship('TeachingClass')
+
+    __table_args__ = (
+        # 最活跃讨论区排行
+        db.Index('IX_ForumClassStats_Posts', 'post_count'),
+    )
+
+
+class ForumAuthorStats(db.Model):
+    """用户论坛计数器（隐藏/锁定/待审核为该用户所发帖子的状态）"""
+    __tablename__ = 'ForumAuthorStats'
+
+    user_id = db.Column(db.BigInteger, db.ForeignKey('Users.user_id'), primary_key=True, autoincrement=False)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    hidden_count = db.Column(db.Integer, nullable=False, default=0)
+    locked_count = db.Column(db.Integer, nullable=False, default=0)
+    flagged_count = db.Column(db.Integer, nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime(timezone=True))
+
+    user = db.relationship('Users')
+
+    __table_args__ = (
+        # 最活跃用户排行
+        db.Index('IX_ForumAuthorStats_Posts', 'post_count'),
+    )
+
+
+# ==================== 后台任务模块 ====================
+
+class BackgroundJob(db.Model):
+    """后台任务表（如学期成绩批量重算）"""
+    __tablename__ = 'BackgroundJob'
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    job_type = db.Column(db.String(50), nullable=False, index=True)  # 'recalculate_grades'
+    params = db.Column(db.JSON)  # 任务参数，如 {"semester": "2024-2025-1"}
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # 'pending', 'running', 'completed', 'failed'
+
+    # 进度
+    total_count = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    summary = db.Column(db.JSON)  # 任务完成后的汇总信息
+    error = db.Column(db.Text)
+
+    created_by = db.Column(db.BigInteger, db.ForeignKey('Users.user_id'), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+    started_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    # 执行租约：持有任务的工作进程及其最近心跳，心跳超时即视为中断
+    owner_id = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime(timezone=True))
+
+    # Relationships
+    tasks = db.relationship('BackgroundJobTask', backref='job', lazy='dynamic', cascade='all, delete-orphan')
+
+
+class BackgroundJobTask(db.Model):
+    """后台子任务表（一个任务拆分为多个可单独重试的子任务，如每个教学班一个）"""
+    __tablename__ = 'BackgroundJobTask'
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    job_id = db.Column(db.BigInteger, db.ForeignKey('BackgroundJob.id'), nullable=False, index=True)
+    target_id = db.Column(db.BigInteger, nullable=False)  # 处理对象ID，如 class_id
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running', 'success', 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    # 执行租约（running 状态时有效）
+    owner_id = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'target_id', name='UK_BackgroundJobTask_Job_Target'),
+    )
+
+
 # ==================== 子模式视图（只读） ====================
 
 class VStudentMyCourses(db.Model):
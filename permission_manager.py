@@ -1,13 +1,37 @@
 # -*- coding: utf-8 -*-
 """
 权限管理模块 - 权限装饰器、中间件和权限检查函数
+
+管理员的权限等级与各项功能权限在登录时（或缓存过期后首次请求时）编译为
+(admin_id, 等级, 功能位掩码)，保存在按用户ID索引的进程内TTL缓存中；
+各装饰器与权限检查函数只做位运算，不再逐请求加载管理员档案。
+修改权限的接口调用 invalidate_admin_permissions 使缓存失效。
 """
 
+import threading
+import time
 from functools import wraps
 from flask import jsonify, current_app
 from flask_login import current_user
 from models import Admin
 
+# 编译后权限的缓存时间（秒），多进程部署时其他进程的权限修改最迟在此时间后生效
+PERMISSION_CACHE_TTL = 300
+
+# 功能权限名称 -> (Admin 字段, 位)
+FEATURE_FLAGS = {
+    'user_manage': ('can_manage_users', 1 << 0),
+    'forum_manage': ('can_manage_forum', 1 << 1),
+    'courses_manage': ('can_manage_courses', 1 << 2),
+    'grades_manage': ('can_manage_grades', 1 << 3),
+    'announcements_manage': ('can_manage_announcements', 1 << 4),
+    'content_review': ('can_review_content', 1 << 5),
+    'ban_users': ('can_ban_users', 1 << 6),
+}
+
+_permission_cache = {}
+_permission_lock = threading.Lock()
+
 
 class PermissionDeniedError(Exception):
     """权限拒绝异常"""
@@ -17,6 +41,61 @@ class PermissionDeniedError(Exception):
         super().__init__(self.message)
 
 
+# ==================== 编译权限 ====================
+
+def compile_admin_permissions(admin_profile):
+    """把管理员档案编译为 (admin_id, 等级, 功能位掩码, 管理员编号)"""
+    mask = 0
+    for attr, bit in FEATURE_FLAGS.values():
+        if getattr(admin_profile, attr, False):
+            mask |= bit
+    return admin_profile.admin_id, admin_profile.permission_level, mask, admin_profile.admin_no
+
+
+def get_compiled_permissions(user=None):
+    """获取用户编译后的权限（默认当前用户），非管理员或无管理员档案时返回 None"""
+    user = user if user is not None else current_user
+    if not user.is_authenticated or user.role != 'admin':
+        return None
+
+    now = time.time()
+    with _permission_lock:
+        cached = _permission_cache.get(user.user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    admin_profile = user.admin_profile
+    compiled = compile_admin_permissions(admin_profile) if admin_profile else None
+    with _permission_lock:
+        _permission_cache[user.user_id] = (now + PERMISSION_CACHE_TTL, compiled)
+    return compiled
+
+
+def invalidate_admin_permissions(user_ids=None):
+    """使编译权限缓存失效（user_ids 为空时清空全部）"""
+    with _permission_lock:
+        if user_ids is None:
+            _permission_cache.clear()
+        else:
+            for user_id in user_ids:
+                _permission_cache.pop(user_id, None)
+
+
+def has_features(compiled, *features):
+    """检查编译权限是否包含全部功能（未知功能名视为无权限）"""
+    for feature in features:
+        flag = FEATURE_FLAGS.get(feature)
+        if not flag or not compiled[2] & flag[1]:
+            return False
+    return True
+
+
+def current_admin_id():
+    """当前管理员的 admin_id（非管理员返回 None）"""
+    compiled = get_compiled_permissions()
+    return compiled[0] if compiled else None
+
+
 # ==================== 权限装饰器 ====================
 
 def api_login_required(f):
@@ -61,13 +140,13 @@ def admin_permission_required(min_level):
             if current_user.role != 'admin':
                 return jsonify({'error': 'Admin access required'}), 403
             
-            admin_profile = current_user.admin_profile
-            if not admin_profile:
+            compiled = get_compiled_permissions()
+            if not compiled:
                 return jsonify({'error': 'Admin profile not found'}), 403
             
-            if admin_profile.permission_level > min_level:
+            if compiled[1] > min_level:
                 return jsonify({
-                    'error': f'Insufficient permissions. Required level: {min_level}, Your level: {admin_profile.permission_level}'
+                    'error': f'Insufficient permissions. Required level: {min_level}, Your level: {compiled[1]}'
                 }), 403
             
             return f(*args, **kwargs)
@@ -90,13 +169,13 @@ def feature_permission_required(*features):
             if current_user.role != 'admin':
                 return jsonify({'error': 'Admin access required'}), 403
             
-            admin_profile = current_user.admin_profile
-            if not admin_profile:
+            compiled = get_compiled_permissions()
+            if not compiled:
                 return jsonify({'error': 'Admin profile not found'}), 403
             
             # 检查所有要求的功能权限
             for feature in features:
-                if not admin_profile.has_feature_permission(feature):
+                if not has_features(compiled, feature):
                     return jsonify({
                         'error': f'Permission denied: {feature}',
                         'required_permission': feature
@@ -117,8 +196,8 @@ def forum_admin_required(f):
         if current_user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        admin_profile = current_user.admin_profile
-        if not admin_profile or not admin_profile.can_manage_forum:
+        compiled = get_compiled_permissions()
+        if not compiled or not has_features(compiled, 'forum_manage'):
             return jsonify({'error': 'Forum management permission required'}), 403
         
         return f(*args, **kwargs)
@@ -135,8 +214,8 @@ def content_reviewer_required(f):
         if current_user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        admin_profile = current_user.admin_profile
-        if not admin_profile or not admin_profile.can_review_content:
+        compiled = get_compiled_permissions()
+        if not compiled or not has_features(compiled, 'content_review'):
             return jsonify({'error': 'Content review permission required'}), 403
         
         return f(*args, **kwargs)
@@ -154,14 +233,8 @@ def check_admin_permission(permission_level):
     Returns:
         True 如果有权限, False 否则
     """
-    if not current_user.is_authenticated or current_user.role != 'admin':
-        return False
-    
-    admin_profile = current_user.admin_profile
-    if not admin_profile:
-        return False
-    
-    return admin_profile.permission_level <= permission_level
+    compiled = get_compiled_permissions()
+    return bool(compiled) and compiled[1] <= permission_level
 
 
 def check_feature_permission(feature):
@@ -173,14 +246,8 @@ def check_feature_permission(feature):
     Returns:
         True 如果有权限, False 否则
     """
-    if not current_user.is_authenticated or current_user.role != 'admin':
-        return False
-    
-    admin_profile = current_user.admin_profile
-    if not admin_profile:
-        return False
-    
-    return admin_profile.has_feature_permission(feature)
+    compiled = get_compiled_permissions()
+    return bool(compiled) and has_features(compiled, feature)
 
 
 def get_admin_permissions():
@@ -189,23 +256,14 @@ def get_admin_permissions():
     Returns:
         权限信息字典，如果不是管理员返回 None
     """
-    if not current_user.is_authenticated or current_user.role != 'admin':
-        return None
-    
-    admin_profile = current_user.admin_profile
-    if not admin_profile:
+    compiled = get_compiled_permissions()
+    if not compiled:
         return None
     
-    return {
-        'level': admin_profile.permission_level,
-        'can_manage_users': admin_profile.can_manage_users,
-        'can_manage_forum': admin_profile.can_manage_forum,
-        'can_manage_courses': admin_profile.can_manage_courses,
-        'can_manage_grades': admin_profile.can_manage_grades,
-        'can_manage_announcements': admin_profile.can_manage_announcements,
-        'can_review_content': admin_profile.can_review_content,
-        'can_ban_users': admin_profile.can_ban_users,
-    }
+    permissions = {'level': compiled[1]}
+    for attr, bit in FEATURE_FLAGS.values():
+        permissions[attr] = bool(compiled[2] & bit)
+    return permissions
 
 
 def require_admin_permission(permission_level):
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+用户删除模块 - 集合式级联删除，支持一次删除大批用户
+
+所有关联数据按依赖顺序用 DELETE/UPDATE ... WHERE ... IN (子查询) 一次性删除，
+不逐条加载对象；整批用户在同一个事务中删除，任一步失败整体回滚。
+被删除记录引用的上传文件在事务提交后交给后台清理线程删除。
+
+级联范围：
+- 学生：选课、提交、成绩、成绩明细、总评、考勤记录、个人任务
+- 教师：作业（及其提交）、教学资料、任课关系、教学计划；
+  其批改/计算记录中的教师引用置空
+- 管理员：其审核日志；帖子状态中的隐藏/锁定人置空
+- 所有用户：发表的帖子（及帖子下全部回复、状态、审核日志、检索索引）、发表的回复、
+  收发的私信、发布的公告、论坛计数器；创建的后台任务保留，创建人置空；
+  受影响班级和其他回复者的论坛计数器按剩余数据重新计算
+"""
+
+import os
+from flask import current_app
+from sqlalchemy import select, or_
+from models import (
+    db, Users, Admin, Teacher, Student, StudentClass, TeacherClass, Material,
+    Assignment, Submission, Grade, GradeItem, StudentGradeScore, StudentFinalGrade,
+    TeachingPlan, PersonalTask, Announcement, AttendanceRecord, ForumPost, ForumComment,
+    Message, ForumModeration, ForumPostStatus, ForumSearchTerm, ForumAuthorStats, BackgroundJob
+)
+from file_cleaner import queue_file_removal
+from forum_stats import recompute_class_stats, recompute_author_stats
+
+# 每批子查询中的用户ID个数（SQL Server 单条语句最多 2100 个参数）
+DELETE_CHUNK_SIZE = 1000
+
+
+class UserDeletionError(Exception):
+    """用户删除被拒绝（如删除当前用户或超级管理员）"""
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+def _delete(model, condition):
+    return model.query.filter(condition).delete(synchronize_session=False)
+
+
+def _nullify(model, column, ids):
+    model.query.filter(column.in_(ids)).update({column.name: None}, synchronize_session=False)
+
+
+def _collect_files(student_ids, teacher_ids, post_ids):
+    """收集将被删除的记录所引用的文件（须在删除前读取）"""
+    materials_folder = current_app.config.get('MATERIALS_FOLDER', 'uploads/materials')
+    paths = [os.path.join(materials_folder, r.file_path) for r in db.session.query(Material.file_path).filter(
+        Material.teacher_id.in_(teacher_ids), Material.file_path.isnot(None)
+    )]
+    paths += [r.file_path for r in db.session.query(Submission.file_path).filter(
+        or_(Submission.student_id.in_(student_ids),
+            Submission.assignment_id.in_(select(Assignment.assignment_id).where(Assignment.teacher_id.in_(teacher_ids)))),
+        Submission.file_path.isnot(None)
+    )]
+    paths += [os.path.join(current_app.root_path, r.file_path) for r in db.session.query(ForumPost.file_path).filter(
+        ForumPost.id.in_(post_ids), ForumPost.file_path.isnot(None)
+    )]
+    return paths
+
+
+def _delete_chunk(user_ids):
+    """删除一批用户及其关联数据（不提交），返回待清理的文件列表"""
+    student_ids = select(Student.student_id).where(Student.user_id.in_(user_ids))
+    teacher_ids = select(Teacher.teacher_id).where(Teacher.user_id.in_(user_ids))
+    admin_ids = select(Admin.admin_id).where(Admin.user_id.in_(user_ids))
+    assignment_ids = select(Assignment.assignment_id).where(Assignment.teacher_id.in_(teacher_ids))
+    post_ids = select(ForumPost.id).where(ForumPost.author_id.in_(user_ids))
+    comment_condition = or_(ForumComment.author_id.in_(user_ids), ForumComment.post_id.in_(post_ids))
+    comment_ids = select(ForumComment.id).where(comment_condition)
+
+    files = _collect_files(student_ids, teacher_ids, post_ids)
+
+    # 论坛计数器受影响的班级和其他用户（被删帖子下其他人的回复也随之删除）
+    affected_classes = [r.class_id for r in db.session.query(ForumPost.class_id).filter(or_(
+        ForumPost.id.in_(post_ids),
+        ForumPost.id.in_(select(ForumComment.post_id).where(comment_condition))
+    )).distinct()]
+    affected_authors = [r.author_id for r in db.session.query(ForumComment.author_id).filter(
+        ForumComment.post_id.in_(post_ids),
+        ~ForumComment.author_id.in_(user_ids)
+    ).distinct()]
+
+    # 论坛：审核日志、帖子状态与检索索引 -> 其他人对被删回复的楼中楼回复提升为一级回复 -> 回复 -> 帖子
+    _delete(ForumModeration, or_(
+        ForumModeration.post_id.in_(post_ids),
+        ForumModeration.comment_id.in_(comment_ids),
+        ForumModeration.admin_id.in_(admin_ids)
+    ))
+    _nullify(ForumModeration, ForumModeration.reversed_by, admin_ids)
+    _delete(ForumPostStatus, ForumPostStatus.post_id.in_(post_ids))
+    _delete(ForumSearchTerm, or_(
+        ForumSearchTerm.post_id.in_(post_ids),
+        (ForumSearchTerm.doc_type == 'comment') & ForumSearchTerm.doc_id.in_(comment_ids)
+    ))
+    _nullify(ForumPostStatus, ForumPostStatus.hidden_by, admin_ids)
+    _nullify(ForumPostStatus, ForumPostStatus.locked_by, admin_ids)
+    ForumComment.query.filter(
+        ForumComment.parent_id.in_(comment_ids),
+        ~comment_condition
+    ).update({'parent_id': None}, synchronize_session=False)
+    _delete(ForumComment, ForumComment.id.in_(comment_ids))
+    _delete(ForumPost, ForumPost.id.in_(post_ids))
+    _delete(ForumAuthorStats, ForumAuthorStats.user_id.in_(user_ids))
+    recompute_class_stats(affected_classes)
+    recompute_author_stats(affected_authors)
+
+    _delete(Message, or_(Message.sender_id.in_(user_ids), Message.recipient_id.in_(user_ids)))
+    _delete(Announcement, Announcement.author_id.in_(user_ids))
+    _nullify(BackgroundJob, BackgroundJob.created_by, user_ids)
+
+    # 学生
+    for model in (StudentClass, Submission, Grade, StudentGradeScore, StudentFinalGrade, AttendanceRecord, PersonalTask):
+        _delete(model, model.student_id.in_(student_ids))
+
+    # 教师：作业的提交 -> 成绩项对作业的关联 -> 作业
+    _delete(Submission, Submission.assignment_id.in_(assignment_ids))
+    _nullify(GradeItem, GradeItem.related_assignment_id, assignment_ids)
+    _delete(Assignment, Assignment.assignment_id.in_(assignment_ids))
+    for model in (Material, TeacherClass, TeachingPlan):
+        _delete(model, model.teacher_id.in_(teacher_ids))
+    _nullify(Grade, Grade.calculated_by, teacher_ids)
+    _nullify(Submission, Submission.graded_by, teacher_ids)
+    _nullify(GradeItem, GradeItem.created_by, teacher_ids)
+    _nullify(StudentGradeScore, StudentGradeScore.graded_by, teacher_ids)
+
+    # 角色档案与用户本身
+    for model in (Student, Teacher, Admin):
+        _delete(model, model.user_id.in_(user_ids))
+    _delete(Users, Users.user_id.in_(user_ids))
+
+    return files
+
+
+def delete_users(user_ids, current_user_id=None):
+    """在一个事务中删除多个用户及其全部关联数据
+
+    Args:
+        user_ids: 待删除的用户ID列表
+        current_user_id: 当前操作者（不能删除自己）
+
+    Returns:
+        {'deleted': [已删除的用户ID], 'not_found': [不存在的用户ID], 'files_queued': 待清理文件数}
+
+    Raises:
+        UserDeletionError: 列表中包含当前用户或超级管理员时整批拒绝
+    """
+    user_ids = list(dict.fromkeys(int(uid) for uid in user_ids))
+    if current_user_id is not None and current_user_id in user_ids:
+        raise UserDeletionError('Cannot delete current user')
+
+    existing = set()
+    for start in range(0, len(user_ids), DELETE_CHUNK_SIZE):
+        chunk = user_ids[start:start + DELETE_CHUNK_SIZE]
+        existing.update(r.user_id for r in db.session.query(Users.user_id).filter(Users.user_id.in_(chunk)))
+
+    super_admin_user = db.session.query(Admin.user_id).order_by(Admin.admin_id).limit(1).scalar()
+    if super_admin_user is not None and super_admin_user in existing:
+        raise UserDeletionError('Cannot delete super admin')
+
+    deleted = [uid for uid in user_ids if uid in existing]
+    files = []
+    try:
+        for start in range(0, len(deleted), DELETE_CHUNK_SIZE):
+            files += _delete_chunk(deleted[start:start + DELETE_CHUNK_SIZE])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'deleted': deleted,
+        'not_found': [uid for uid in user_ids if uid not in existing],
+        'files_queued': queue_file_removal(files)
+    }
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+用户批量导入模块 - 预加载校验、进程池哈希密码、分块批量写入
+
+导入分三步：
+1. 预加载已有用户名、学号/工号/管理员编号和院系，在内存中校验整个文件；
+2. 在进程池中并行计算密码哈希；
+3. 按块批量插入，每块一个事务。某块写入失败时逐行重试该块，
+   只有真正出错的行被跳过，不影响文件中的其他行。
+最后返回逐行报告。
+"""
+
+import csv
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash
+from models import db, Users, Admin, Teacher, Student, Department, allocate_ids
+
+# 每个事务批量写入的行数
+IMPORT_CHUNK_SIZE = 500
+
+# 少于该行数时直接在当前进程计算密码哈希（进程池启动开销不划算）
+PARALLEL_HASH_MIN_ROWS = 50
+
+# 各角色对应的档案模型、编号字段与主键字段
+PROFILE_MODELS = {
+    'admin': (Admin, 'admin_no', 'admin_id'),
+    'teacher': (Teacher, 'teacher_no', 'teacher_id'),
+    'student': (Student, 'student_no', 'student_id'),
+}
+
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+
+
+# ==================== 密码哈希 ====================
+
+def _get_hash_executor(max_workers=None):
+    """懒加载密码哈希进程池"""
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _hash_executor
+
+
+def hash_password(raw_password):
+    """计算密码哈希（已是哈希值的原样返回，与 Users.set_password 一致）"""
+    if Users.is_hashed_password(raw_password):
+        return raw_password
+    return generate_password_hash(raw_password)
+
+
+def hash_passwords(passwords, max_workers=None):
+    """批量计算密码哈希，行数较多时交给进程池并行计算"""
+    if len(passwords) < PARALLEL_HASH_MIN_ROWS:
+        return [hash_password(p) for p in passwords]
+
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(_get_hash_executor(workers).map(hash_password, passwords, chunksize=chunksize))
+
+
+# ==================== 解析与校验 ====================
+
+def parse_csv(stream):
+    """解析上传的CSV（二进制内容或已打开的文本流）
+
+    Returns:
+        [(行号, 行字典), ...]，行号与表格中的行号一致（表头为第1行）
+    """
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.StringIO(stream.decode('utf-8-sig'), newline=None)
+    reader = csv.DictReader(stream)
+    return [(row_num, row) for row_num, row in enumerate(reader, start=2)]
+
+
+def _clean(row, key):
+    return (row.get(key) or '').strip()
+
+
+def _load_existing():
+    """一次性加载已有的用户名、各类编号与院系"""
+    existing = {
+        'username': {r[0] for r in db.session.query(Users.username).all()},
+        'departments': {r.dept_name: r.dept_id for r in db.session.query(Department.dept_id, Department.dept_name).all()},
+    }
+    for role, (model, no_field, _) in PROFILE_MODELS.items():
+        existing[no_field] = {(r[0] or '').strip() for r in db.session.query(getattr(model, no_field)).all()}
+    return existing
+
+
+def validate_user_rows(rows, existing):
+    """在内存中校验整个文件
+
+    Returns:
+        (valid, errors)：valid 为待导入的记录列表，errors 为 {行号: 错误信息}
+    """
+    usernames = set(existing['username'])
+    numbers = {no_field: set(existing[no_field]) for _, no_field, _ in PROFILE_MODELS.values()}
+
+    valid = []
+    errors = {}
+    for row_num, row in rows:
+        username = _clean(row, 'username')
+        password = _clean(row, 'password')
+        real_name = _clean(row, 'real_name')
+        role = _clean(row, 'role')
+
+        if not all([username, password, real_name, role]):
+            errors[row_num] = 'Missing required fields'
+            continue
+        if role not in PROFILE_MODELS:
+            errors[row_num] = f"Invalid role '{role}'"
+            continue
+        if username in usernames:
+            errors[row_num] = f"Username '{username}' already exists"
+            continue
+
+        model, no_field, _ = PROFILE_MODELS[role]
+        profile_no = _clean(row, no_field)
+        if not profile_no or profile_no in numbers[no_field]:
+            errors[row_num] = f'Invalid or duplicate {no_field}'
+            continue
+        max_length = getattr(model, no_field).type.length
+        if max_length and len(profile_no) > max_length:
+            errors[row_num] = f'{no_field} exceeds {max_length} characters'
+            continue
+
+        record = {
+            'row': row_num,
+            'username': username,
+            'password': password,
+            'real_name': real_name,
+            'phone': _clean(row, 'phone') or None,
+            'email': _clean(row, 'email') or None,
+            'role': role,
+            'profile_no': profile_no,
+            'department': _clean(row, 'department') or None,
+            'major': _clean(row, 'major') or None,
+            'title': _clean(row, 'title') or None,
+        }
+        if role == 'admin':
+            try:
+                record['permission_level'] = int(row.get('permission_level') or 3)
+            except ValueError:
+                errors[row_num] = 'Invalid permission_level'
+                continue
+
+        usernames.add(username)
+        numbers[no_field].add(profile_no)
+        valid.append(record)
+
+    return valid, errors
+
+
+# ==================== 写入 ====================
+
+def _ensure_departments(records, departments):
+    """批量创建文件中出现的新院系，返回 {院系名: dept_id}"""
+    missing = sorted({r['department'] for r in records if r['department'] and r['department'] not in departments})
+    if missing:
+        dept_ids = allocate_ids(Department, len(missing), 'dept_id')
+        db.session.bulk_insert_mappings(Department, [
+            {'dept_id': dept_id, 'dept_name': name} for dept_id, name in zip(dept_ids, missing)
+        ])
+        db.session.commit()
+        departments.update(zip(missing, dept_ids))
+    return departments
+
+
+def _insert_chunk(records, departments):
+    """批量插入一块记录（用户 + 各角色档案），由调用方提交事务"""
+    # 先分配好所有ID再写入，序列推进不会夹在本事务的写操作之间
+    user_ids = allocate_ids(Users, len(records), 'user_id')
+    profiles = {}
+    for role, (model, no_field, id_field) in PROFILE_MODELS.items():
+        members = [(user_id, r) for user_id, r in zip(user_ids, records) if r['role'] == role]
+        if members:
+            profiles[role] = zip(allocate_ids(model, len(members), id_field), members)
+
+    db.session.bulk_insert_mappings(Users, [{
+        'user_id': user_id,
+        'username': r['username'],
+        'password_hash': r['password_hash'],
+        'real_name': r['real_name'],
+        'phone': r['phone'],
+        'email': r['email'],
+        'role': r['role'],
+        'status': 1
+    } for user_id, r in zip(user_ids, records)])
+
+    for role, members in profiles.items():
+        model, no_field, id_field = PROFILE_MODELS[role]
+        mappings = []
+        for profile_id, (user_id, r) in members:
+            mapping = {
+                id_field: profile_id,
+                'user_id': user_id,
+                no_field: r['profile_no'],
+                'dept_id': departments.get(r['department'])
+            }
+            if role == 'admin':
+                mapping['permission_level'] = r['permission_level']
+            elif role == 'teacher':
+                mapping['title'] = r['title']
+            else:
+                mapping['major'] = r['major']
+            mappings.append(mapping)
+        db.session.bulk_insert_mappings(model, mappings)
+
+
+def write_in_chunks(records, insert_chunk, errors, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """分块写入已校验的记录，每块一个事务
+
+    某块写入失败时回滚并逐行重试，出错行的错误信息写入 errors（以行号为键）。
+
+    Args:
+        records: 记录列表，每条记录含 'row'（行号）
+        insert_chunk: insert_chunk(记录列表)，批量插入但不提交
+        errors: {行号: 错误信息}，就地追加
+        on_chunk: 可选回调 on_chunk(已写入记录数, 成功数)，每块完成后调用
+
+    Returns:
+        写入成功的行号集合
+    """
+    created = set()
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        try:
+            insert_chunk(chunk)
+            db.session.commit()
+            created.update(r['row'] for r in chunk)
+        except Exception:
+            db.session.rollback()
+            # 整块失败时逐行重试，定位出错的行
+            for record in chunk:
+                try:
+                    insert_chunk([record])
+                    db.session.commit()
+                    created.add(record['row'])
+                except Exception as e:
+                    db.session.rollback()
+                    errors[record['row']] = str(e.__cause__ or e).splitlines()[0]
+
+        if on_chunk:
+            on_chunk(start + len(chunk), len(created))
+    return created
+
+
+def build_report(rows, created, errors, key):
+    """生成逐行导入报告，key 为报告中标识每行的列名"""
+    report = []
+    for row_num, row in rows:
+        entry = {'row': row_num, key: _clean(row, key)}
+        if row_num in created:
+            entry['status'] = 'created'
+        else:
+            entry['status'] = 'error'
+            entry['error'] = errors.get(row_num, 'Not imported')
+        report.append(entry)
+
+    return {
+        'total': len(rows),
+        'success_count': len(created),
+        'error_count': len(rows) - len(created),
+        'report': report
+    }
+
+
+def import_users(rows, chunk_size=IMPORT_CHUNK_SIZE, hash_workers=None, progress=None):
+    """导入用户
+
+    Args:
+        rows: parse_csv 的返回值
+        chunk_size: 每个事务写入的行数
+        hash_workers: 密码哈希进程数（默认为CPU核数，仅首次创建进程池时生效）
+        progress: 可选回调 progress(已处理行数, 总行数, 成功数, 错误字典)，
+            校验完成后及每写完一块调用一次
+
+    Returns:
+        {'total', 'success_count', 'error_count',
+         'report': [{'row', 'username', 'status': 'created'|'error', 'error'}, ...]}
+    """
+    existing = _load_existing()
+    records, errors = validate_user_rows(rows, existing)
+
+    total = len(rows)
+    invalid_count = total - len(records)
+    if progress:
+        progress(invalid_count, total, 0, errors)
+
+    hashes = hash_passwords([r['password'] for r in records], hash_workers)
+    for record, password_hash in zip(records, hashes):
+        record['password_hash'] = password_hash
+
+    departments = _ensure_departments(records, existing['departments'])
+
+    on_chunk = None
+    if progress:
+        on_chunk = lambda written, success: progress(invalid_count + written, total, success, errors)
+    created = write_in_chunks(records, lambda chunk: _insert_chunk(chunk, departments), errors, chunk_size, on_chunk)
+
+    return build_report(rows, created, errors, 'username')
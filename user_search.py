@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+用户搜索索引 - 进程内二元组（bigram）倒排索引，用于站内信收件人等用户搜索
+
+索引覆盖用户名、真实姓名、学号和工号。查询时取查询词各二元组倒排表的交集作为候选，
+再逐个校验子串并打分：完全匹配 > 前缀匹配 > 包含，学号/工号 > 用户名/姓名。
+首次搜索时一次查询建好索引；用户增删改后就地更新单个用户，批量导入后整体重建，
+并按固定周期重建以同步其他进程中的写入。
+
+周期重建和批量导入后的重建在后台线程中进行，期间继续使用旧索引响应搜索；
+重建期间的增量更新同时记入日志，新索引替换旧索引前按顺序重放，不会丢失。
+同一时刻只有一个重建在进行。
+"""
+
+import threading
+import time
+from flask import current_app
+from models import db, Users, Student, Teacher
+
+# 索引整体重建周期（秒）
+USER_SEARCH_REBUILD_INTERVAL = 600
+
+# 参与搜索的字段及权重
+SEARCH_FIELDS = (('student_no', 3), ('teacher_no', 3), ('username', 2), ('real_name', 2))
+
+_docs = {}
+_grams = {}
+_built_at = None
+_stale = False
+_journal = None  # 重建期间的增量更新日志：[('index', user_ids, rows) | ('remove', user_ids, None), ...]
+_refreshing = False
+_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+
+
+def _normalize(value):
+    return (value or '').strip().lower()
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _load_rows(user_ids=None):
+    """一次查询加载用户及其学号/工号"""
+    query = db.session.query(
+        Users.user_id, Users.username, Users.real_name, Users.role, Users.status,
+        Student.student_no, Teacher.teacher_no
+    ).outerjoin(Student, Student.user_id == Users.user_id)\
+     .outerjoin(Teacher, Teacher.user_id == Users.user_id)
+    if user_ids is not None:
+        query = query.filter(Users.user_id.in_(user_ids))
+    return query.all()
+
+
+def _make_doc(row):
+    doc = {
+        'id': row.user_id,
+        'username': row.username,
+        'real_name': row.real_name,
+        'role': row.role,
+        'status': row.status,
+        'student_no': (row.student_no or '').strip() or None,
+        'teacher_no': (row.teacher_no or '').strip() or None,
+    }
+    doc['keys'] = {field: _normalize(doc[field]) for field, _ in SEARCH_FIELDS}
+    return doc
+
+
+def _doc_grams(doc):
+    grams = set()
+    for key in doc['keys'].values():
+        grams |= _bigrams(key)
+    return grams
+
+
+def _add(docs, grams, doc):
+    docs[doc['id']] = doc
+    for gram in _doc_grams(doc):
+        grams.setdefault(gram, set()).add(doc['id'])
+
+
+def _apply(docs, grams, op, user_ids, rows):
+    for user_id in user_ids:
+        _remove(docs, grams, user_id)
+    if op == 'index':
+        for row in rows:
+            _add(docs, grams, _make_doc(row))
+
+
+def _remove(docs, grams, user_id):
+    doc = docs.pop(user_id, None)
+    if doc is None:
+        return
+    for gram in _doc_grams(doc):
+        postings = grams.get(gram)
+        if postings is not None:
+            postings.discard(user_id)
+            if not postings:
+                del grams[gram]
+
+
+# ==================== 索引维护 ====================
+
+def _rebuild():
+    """整体重建（调用方须持有 _rebuild_lock）"""
+    global _docs, _grams, _built_at, _stale, _journal
+    with _lock:
+        _journal = []
+        _stale = False
+    try:
+        docs, grams = {}, {}
+        for row in _load_rows():
+            _add(docs, grams, _make_doc(row))
+    except Exception:
+        with _lock:
+            _journal = None
+            _stale = True
+        raise
+
+    with _lock:
+        # 重放重建期间的增量更新后再替换
+        for op, user_ids, rows in _journal:
+            _apply(docs, grams, op, user_ids, rows)
+        _docs, _grams, _built_at, _journal = docs, grams, time.time(), None
+
+
+def rebuild_user_search_index():
+    """从数据库整体重建索引"""
+    with _rebuild_lock:
+        _rebuild()
+
+
+def _ensure_built():
+    """索引从未建立时在当前请求中建立（并发请求只建一次）"""
+    with _rebuild_lock:
+        if _built_at is None:
+            _rebuild()
+
+
+def _refresh_in_background(app):
+    """在后台线程中重建索引，期间继续使用旧索引"""
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return
+        _refreshing = True
+
+    def run():
+        global _refreshing
+        with app.app_context():
+            try:
+                rebuild_user_search_index()
+            except Exception as e:
+                app.logger.error(f"Failed to rebuild user search index: {e}")
+            finally:
+                db.session.remove()
+                with _lock:
+                    _refreshing = False
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _record(op, user_ids, rows=None):
+    with _lock:
+        _apply(_docs, _grams, op, user_ids, rows)
+        if _journal is not None:
+            _journal.append((op, list(user_ids), rows))
+
+
+def index_users(user_ids):
+    """用户新增或修改后重新索引这些用户（索引尚未建立且未在重建时不做任何事）"""
+    if _built_at is None and _journal is None:
+        return
+    _record('index', user_ids, _load_rows(user_ids))
+
+
+def remove_users(user_ids):
+    """用户删除后从索引中移除"""
+    _record('remove', user_ids)
+
+
+def invalidate_user_search_index():
+    """批量导入等大范围变更后调用，下次搜索时在后台整体重建"""
+    global _stale
+    with _lock:
+        _stale = True
+
+
+# ==================== 查询 ====================
+
+def _score(doc, term):
+    """返回 (得分, 命中字段长度)；未命中时得分为 0"""
+    best = (0, 0)
+    for field, weight in SEARCH_FIELDS:
+        key = doc['keys'][field]
+        pos = key.find(term)
+        if pos < 0:
+            continue
+        score = weight * (3 if key == term else 2 if pos == 0 else 1)
+        if score > best[0] or (score == best[0] and len(key) < best[1]):
+            best = (score, len(key))
+    return best
+
+
+def search_users(term, limit=20):
+    """按相关度搜索启用状态的用户（term 至少2个字符）
+
+    Returns:
+        [{'id', 'username', 'real_name', 'role', 'student_no'/'teacher_no'}, ...]
+    """
+    term = _normalize(term)
+    if len(term) < 2:
+        return []
+    if _built_at is None:
+        _ensure_built()
+    elif _stale or time.time() - _built_at > USER_SEARCH_REBUILD_INTERVAL:
+        _refresh_in_background(current_app._get_current_object())
+
+    with _lock:
+        postings = sorted((_grams.get(gram, set()) for gram in _bigrams(term)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:]) if postings else set()
+        matches = []
+        for user_id in candidates:
+            doc = _docs[user_id]
+            if doc['status'] != 1:
+                continue
+            score, length = _score(doc, term)
+            if score:
+                matches.append((-score, length, user_id, doc))
+
+    matches.sort(key=lambda m: m[:3])
+
+    results = []
+    for _, _, _, doc in matches[:limit]:
+        user_info = {
+            'id': doc['id'],
+            'username': doc['username'],
+            'real_name': doc['real_name'],
+            'role': doc['role']
+        }
+        if doc['role'] == 'student' and doc['student_no']:
+            user_info['student_no'] = doc['student_no']
+        elif doc['role'] == 'teacher' and doc['teacher_no']:
+            user_info['teacher_no'] = doc['teacher_no']
+        results.append(user_info)
+    return results
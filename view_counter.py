@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+帖子浏览量缓冲 - 浏览量先在进程内累加，由后台线程批量写回数据库
+
+查看帖子只在内存中记一次浏览，不再为每次浏览开写事务、锁住热门帖子所在行；
+后台线程每 VIEW_FLUSH_INTERVAL 秒，或累计浏览数达到 VIEW_FLUSH_THRESHOLD 时，
+把各帖子的增量用一条批量 UPDATE（executemany）写回。写回失败的增量放回缓冲区下次重试。
+读取浏览量时加上尚未写回的增量，前端看到的计数仍然是实时的。
+"""
+
+import atexit
+import threading
+from sqlalchemy import bindparam, func
+from models import db, ForumPost
+
+# 定时写回周期（秒）
+VIEW_FLUSH_INTERVAL = 10
+
+# 缓冲区累计浏览数达到该值时立即写回
+VIEW_FLUSH_THRESHOLD = 500
+
+_pending = {}
+_pending_total = 0
+_lock = threading.Lock()
+_flush_event = threading.Event()
+_flusher = None
+_app = None
+
+
+def _take_pending():
+    """取出并清空缓冲区"""
+    global _pending, _pending_total
+    with _lock:
+        pending, _pending, _pending_total = _pending, {}, 0
+    return pending
+
+
+def _restore_pending(pending):
+    """写回失败时把增量放回缓冲区"""
+    global _pending_total
+    with _lock:
+        for post_id, delta in pending.items():
+            _pending[post_id] = _pending.get(post_id, 0) + delta
+            _pending_total += delta
+
+
+def flush_views():
+    """把缓冲的浏览量增量批量写回数据库（需在应用上下文中调用）
+
+    Returns:
+        写回的帖子数
+    """
+    pending = _take_pending()
+    if not pending:
+        return 0
+
+    table = ForumPost.__table__
+    stmt = table.update()\
+        .where(table.c.id == bindparam('post_id'))\
+        .values(view_count=func.coalesce(table.c.view_count, 0) + bindparam('delta'))
+    try:
+        db.session.execute(stmt, [{'post_id': post_id, 'delta': delta} for post_id, delta in pending.items()])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _restore_pending(pending)
+        raise
+    return len(pending)
+
+
+def _flush_loop(app):
+    """后台线程：定时或达到阈值时写回"""
+    while True:
+        _flush_event.wait(VIEW_FLUSH_INTERVAL)
+        _flush_event.clear()
+        with app.app_context():
+            try:
+                flush_views()
+            except Exception as e:
+                app.logger.error(f"Failed to flush post view counts: {e}")
+            finally:
+                db.session.remove()
+
+
+def _flush_at_exit():
+    if _app is not None:
+        with _app.app_context():
+            try:
+                flush_views()
+            except Exception:
+                pass
+
+
+def _ensure_flusher(app):
+    global _flusher, _app
+    with _lock:
+        if _flusher is None:
+            _app = app
+            _flusher = threading.Thread(target=_flush_loop, args=(app,), daemon=True)
+            _flusher.start()
+            atexit.register(_flush_at_exit)
+
+
+def record_view(app, post_id):
+    """记录一次浏览"""
+    global _pending_total
+    _ensure_flusher(app)
+    with _lock:
+        _pending[post_id] = _pending.get(post_id, 0) + 1
+        _pending_total += 1
+        reached = _pending_total >= VIEW_FLUSH_THRESHOLD
+    if reached:
+        _flush_event.set()
+
+
+def pending_views(post_id):
+    """帖子尚未写回的浏览增量"""
+    with _lock:
+        return _pending.get(post_id, 0)
+
+
+def discard_views(post_ids):
+    """帖子删除后丢弃其缓冲的浏览量"""
+    global _pending_total
+    with _lock:
+        for post_id in post_ids:
+            _pending_total -= _pending.pop(post_id, 0)
@@ -6,7 +6,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import app, db
-from models import Attendance, AttendanceRecord, StudentClass, TeacherClass, generate_next_id
+from models import Attendance, AttendanceRecord, StudentClass, TeacherClass, generate_next_id, allocate_ids
 from datetime import datetime, date
 
 def create_test_attendance():
@@ -48,12 +48,12 @@ def create_test_attendance():
         db.session.add(new_att)
         
         # 为所有学生创建考勤记录，状态设为 absent（未签到）
-        current_max_id = db.session.query(db.func.max(AttendanceRecord.id)).scalar() or 0
+        record_ids = allocate_ids(AttendanceRecord, len(students))
         
         record_objects = []
-        for i, s in enumerate(students):
+        for record_id, s in zip(record_ids, students):
             rec = AttendanceRecord(
-                id=current_max_id + i + 1,
+                id=record_id,
                 attendance_id=att_id,
                 student_id=s.student_id,
                 status='absent'  # 默认未签到
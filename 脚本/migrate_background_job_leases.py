@@ -0,0 +1,42 @@
+"""
+后台任务租约迁移脚本
+为已存在的 BackgroundJob / BackgroundJobTask 表补充执行租约字段（owner_id, heartbeat_at）
+多个工作进程据此判断任务是否仍在执行，避免重试时重复执行其他进程中的子任务
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import BackgroundJob, BackgroundJobTask
+from sqlalchemy import inspect, text
+
+LEASE_COLUMNS = ['owner_id', 'heartbeat_at']
+
+def migrate_background_job_leases():
+    """添加任务租约字段"""
+    with app.app_context():
+        try:
+            print("开始添加后台任务租约字段...")
+
+            inspector = inspect(db.engine)
+            with db.engine.begin() as conn:
+                for model in (BackgroundJob, BackgroundJobTask):
+                    existing = {c['name'] for c in inspector.get_columns(model.__tablename__)}
+                    for name in LEASE_COLUMNS:
+                        if name in existing:
+                            print(f"  - {model.__tablename__}.{name} 已存在，跳过")
+                            continue
+                        column_type = model.__table__.c[name].type.compile(dialect=db.engine.dialect)
+                        conn.execute(text(f"ALTER TABLE {model.__tablename__} ADD {name} {column_type} NULL"))
+                        print(f"  - {model.__tablename__}.{name}")
+
+            print("✓ 租约字段添加成功！")
+
+        except Exception as e:
+            print(f"✗ 添加字段时出错: {str(e)}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_background_job_leases()
@@ -0,0 +1,32 @@
+"""
+后台任务数据表迁移脚本
+用于创建学期成绩批量重算等后台任务所需的数据表
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import BackgroundJob, BackgroundJobTask
+
+def migrate_background_job_tables():
+    """创建后台任务相关表"""
+    with app.app_context():
+        try:
+            print("开始创建后台任务表...")
+            
+            # 创建表
+            db.create_all()
+            
+            print("✓ 后台任务表创建成功！")
+            print("已创建的表：")
+            print("  - BackgroundJob (后台任务表)")
+            print("  - BackgroundJobTask (后台子任务表)")
+            
+        except Exception as e:
+            print(f"✗ 创建表时出错: {str(e)}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_background_job_tables()
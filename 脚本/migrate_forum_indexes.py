@@ -0,0 +1,33 @@
+"""
+论坛索引迁移脚本
+为已存在的论坛表补建帖子列表分页、回复计数与回复分页所需的索引（db.create_all 不会给已有表加索引）
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import ForumPost, ForumComment
+
+INDEXED_TABLES = [ForumPost, ForumComment]
+
+def migrate_forum_indexes():
+    """创建论坛相关索引"""
+    with app.app_context():
+        try:
+            print("开始创建论坛索引...")
+            
+            for model in INDEXED_TABLES:
+                for index in model.__table__.indexes:
+                    index.create(db.engine, checkfirst=True)
+                    print(f"  - {model.__tablename__}.{index.name}")
+            
+            print("✓ 索引创建成功！")
+            
+        except Exception as e:
+            print(f"✗ 创建索引时出错: {str(e)}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_forum_indexes()
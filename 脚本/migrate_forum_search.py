@@ -0,0 +1,37 @@
+"""
+论坛全文检索迁移脚本
+创建倒排索引表 ForumSearchTerm，并为已有的帖子和回复建立索引
+之后的新增/修改/删除由论坛接口在同一事务中增量维护
+分词规则变化后重新运行本脚本即可按新规则重建索引
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import ForumSearchTerm
+from forum_search import rebuild_forum_search_index
+
+def migrate_forum_search():
+    """创建检索索引表并建立索引"""
+    with app.app_context():
+        try:
+            print("开始创建论坛检索索引表...")
+
+            ForumSearchTerm.__table__.create(db.engine, checkfirst=True)
+            for index in ForumSearchTerm.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+            print("  - ForumSearchTerm (论坛倒排索引表)")
+
+            print("开始为已有帖子和回复建立索引...")
+            count = rebuild_forum_search_index()
+
+            print(f"✓ 索引建立成功！共索引 {count} 个帖子")
+
+        except Exception as e:
+            print(f"✗ 建立索引时出错: {str(e)}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_forum_search()
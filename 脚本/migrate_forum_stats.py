@@ -0,0 +1,41 @@
+"""
+论坛计数器迁移脚本
+创建按班级/按用户的论坛计数器表，并按已有帖子、回复和帖子状态初始化计数
+之后的计数由论坛接口在同一事务中增量维护
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import ForumClassStats, ForumAuthorStats
+from forum_stats import recompute_class_stats, recompute_author_stats
+
+STATS_TABLES = [ForumClassStats, ForumAuthorStats]
+
+def migrate_forum_stats():
+    """创建论坛计数器表并初始化计数"""
+    with app.app_context():
+        try:
+            print("开始创建论坛计数器表...")
+
+            for model in STATS_TABLES:
+                model.__table__.create(db.engine, checkfirst=True)
+                for index in model.__table__.indexes:
+                    index.create(db.engine, checkfirst=True)
+                print(f"  - {model.__tablename__}")
+
+            print("开始初始化计数...")
+            recompute_class_stats()
+            recompute_author_stats()
+            db.session.commit()
+
+            print(f"✓ 计数器初始化成功！班级 {ForumClassStats.query.count()} 个，用户 {ForumAuthorStats.query.count()} 个")
+
+        except Exception as e:
+            print(f"✗ 初始化计数器时出错: {str(e)}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_forum_stats()
@@ -0,0 +1,31 @@
+"""
+主键序列表迁移脚本
+用于创建分块ID分配所需的 IdSequence 表（各表序列在首次分配时按现有最大ID自动初始化）
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import IdSequence
+
+def migrate_id_sequence_table():
+    """创建主键序列表"""
+    with app.app_context():
+        try:
+            print("开始创建主键序列表...")
+            
+            # 创建表
+            db.create_all()
+            
+            print("✓ 主键序列表创建成功！")
+            print("已创建的表：")
+            print("  - IdSequence (主键序列表)")
+            
+        except Exception as e:
+            print(f"✗ 创建表时出错: {str(e)}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_id_sequence_table()